@@ -0,0 +1,162 @@
+import asyncio
+import hashlib
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Optional
+
+from .config import settings
+from . import metrics
+
+# Key of the per-request release list that AdmissionMiddleware puts in the scope
+SCOPE_KEY = "admission.release"
+
+
+class AdmissionRejected(Exception):
+    """The proxy is at capacity and the request was not queued (or waited too long)"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def tenant_key(user: Optional[str], headers, client_host: Optional[str]) -> str:
+    """Identify who a request belongs to: the `user` field, then the API key, then the client address"""
+    if user:
+        return f"user:{user}"
+    api_key = headers.get("authorization") or headers.get("x-api-key")
+    if api_key:
+        return "key:" + hashlib.blake2b(api_key.encode(), digest_size=8).hexdigest()
+    return f"ip:{client_host or 'unknown'}"
+
+
+class AdmissionController:
+    """Global concurrency cap with a bounded wait queue served round-robin per tenant.
+
+    Each tenant waits in its own FIFO; a freed slot goes to the head of the
+    next tenant in turn, so a tenant with a long backlog only ever gets its
+    share of the slots. Over capacity, requests are rejected immediately.
+    """
+
+    def __init__(self, max_concurrent: int, queue_size: int, tenant_queue_size: int, queue_timeout: float):
+        self.max_concurrent = max_concurrent
+        self.queue_size = queue_size
+        self.tenant_queue_size = tenant_queue_size
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.queued = 0
+        self._waiters: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._hold_ewma = 1.0
+        self.stats: Dict[str, int] = {"admitted": 0, "queued_total": 0, "rejected": 0, "timed_out": 0}
+
+    def _retry_after(self) -> int:
+        """Rough time until a newly queued request would be served"""
+        backlog = (self.queued + 1) / max(1, self.max_concurrent)
+        return max(1, math.ceil(self._hold_ewma * backlog))
+
+    def _forget(self, tenant: str, waiter: asyncio.Future) -> None:
+        waiters = self._waiters.get(tenant)
+        if waiters is None or waiter not in waiters:
+            return
+        waiters.remove(waiter)
+        self.queued -= 1
+        if not waiters:
+            del self._waiters[tenant]
+
+    async def acquire(self, tenant: str) -> None:
+        """Wait for a slot, or raise AdmissionRejected when the queue is full or the wait times out"""
+        start = time.perf_counter()
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            self.stats["admitted"] += 1
+            metrics.ADMISSION_WAIT.observe(0.0)
+            return
+
+        waiters = self._waiters.get(tenant)
+        if self.queued >= self.queue_size or (waiters is not None and len(waiters) >= self.tenant_queue_size):
+            self.stats["rejected"] += 1
+            raise AdmissionRejected("Too many concurrent requests", self._retry_after())
+
+        if waiters is None:
+            waiters = self._waiters[tenant] = deque()
+        waiter = asyncio.get_running_loop().create_future()
+        waiters.append(waiter)
+        self.queued += 1
+        self.stats["queued_total"] += 1
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up on it
+                self.release()
+            else:
+                self._forget(tenant, waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self.stats["timed_out"] += 1
+                raise AdmissionRejected("Timed out waiting for a free slot", self._retry_after())
+            raise
+        self.stats["admitted"] += 1
+        metrics.ADMISSION_WAIT.observe(time.perf_counter() - start)
+
+    def release(self, held: Optional[float] = None) -> None:
+        """Free a slot, handing it straight to the next tenant's oldest waiter if any"""
+        if held is not None:
+            self._hold_ewma += 0.2 * (held - self._hold_ewma)
+        while self._waiters:
+            tenant, waiters = next(iter(self._waiters.items()))
+            waiter = waiters.popleft()
+            self.queued -= 1
+            if waiters:
+                self._waiters.move_to_end(tenant)
+            else:
+                del self._waiters[tenant]
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    async def admit(self, scope, tenant: str) -> None:
+        """Acquire a slot that AdmissionMiddleware releases once the response is fully sent"""
+        releases = scope.get(SCOPE_KEY)
+        if releases is None or not settings.ADMISSION_ENABLED:
+            return
+        await self.acquire(tenant)
+        start = time.perf_counter()
+        releases.append(lambda: self.release(time.perf_counter() - start))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "active": self.active,
+            "queued": self.queued,
+            "waiting_tenants": len(self._waiters),
+            "max_concurrent": self.max_concurrent,
+            "queue_size": self.queue_size,
+        }
+
+
+class AdmissionMiddleware:
+    """Release admission slots after the response, including streamed bodies, is finished"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        releases = scope[SCOPE_KEY] = []
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            for release in releases:
+                release()
+
+
+admission = AdmissionController(
+    max_concurrent=settings.ADMISSION_MAX_CONCURRENT,
+    queue_size=settings.ADMISSION_QUEUE_SIZE,
+    tenant_queue_size=settings.ADMISSION_TENANT_QUEUE_SIZE,
+    queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT,
+)
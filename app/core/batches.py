@@ -0,0 +1,463 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # not on Windows, where there is a single worker anyway
+    fcntl = None
+
+from .config import settings
+from ..schemas.batch import Batch, BatchErrors, FileObject
+
+logger = logging.getLogger(__name__)
+
+# Batches the runner still has to work on, oldest first
+ACTIVE_STATUSES = ("validating", "in_progress", "finalizing", "cancelling")
+
+# How often an idle runner looks for batches created by other workers, and a
+# worker without the runner lock tries to take it over
+IDLE_POLL_INTERVAL = 1.0
+
+# Executes one request body and returns (HTTP status, response body)
+Executor = Callable[[Dict[str, Any]], Awaitable[Tuple[int, Dict[str, Any]]]]
+
+
+def new_id(prefix: str) -> str:
+    return f"{prefix}{uuid.uuid4().hex[:24]}"
+
+
+class BatchStore:
+    """Uploaded files and batch state in SQLite, plus the files themselves on disk.
+
+    sqlite3 is blocking, so callers run these methods via `asyncio.to_thread`.
+    Completed input lines are recorded together with the output/error file
+    sizes in one transaction, which is what makes a batch resumable.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.files_dir = os.path.join(directory, "files")
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def open(self) -> None:
+        os.makedirs(self.files_dir, exist_ok=True)
+        with self._lock:
+            if self._conn is not None:
+                return
+            self._conn = sqlite3.connect(os.path.join(self.directory, "batches.sqlite3"), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS files (id TEXT PRIMARY KEY, created_at INTEGER NOT NULL, data TEXT NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS batches (id TEXT PRIMARY KEY, created_at INTEGER NOT NULL, data TEXT NOT NULL,"
+                " output_file TEXT NOT NULL, error_file TEXT NOT NULL,"
+                " output_bytes INTEGER NOT NULL DEFAULT 0, error_bytes INTEGER NOT NULL DEFAULT 0);"
+                "CREATE TABLE IF NOT EXISTS batch_lines (batch_id TEXT NOT NULL, line INTEGER NOT NULL,"
+                " PRIMARY KEY (batch_id, line)) WITHOUT ROWID;"
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def file_path(self, file_id: str) -> str:
+        return os.path.join(self.files_dir, f"{file_id}.jsonl")
+
+    # Files
+
+    def add_file(self, file: FileObject) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (id, created_at, data) VALUES (?, ?, ?)",
+                (file.id, file.created_at, file.model_dump_json())
+            )
+            self._conn.commit()
+
+    def get_file(self, file_id: str) -> Optional[FileObject]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM files WHERE id = ?", (file_id,)).fetchone()
+        return FileObject.model_validate_json(row[0]) if row else None
+
+    def list_files(self, purpose: Optional[str] = None) -> List[FileObject]:
+        with self._lock:
+            rows = self._conn.execute("SELECT data FROM files ORDER BY created_at DESC").fetchall()
+        files = [FileObject.model_validate_json(row[0]) for row in rows]
+        return [file for file in files if purpose is None or file.purpose == purpose]
+
+    def delete_file(self, file_id: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM files WHERE id = ?", (file_id,))
+            self._conn.commit()
+        if cursor.rowcount:
+            try:
+                os.remove(self.file_path(file_id))
+            except FileNotFoundError:
+                pass
+        return bool(cursor.rowcount)
+
+    # Batches
+
+    def create_batch(self, batch: Batch) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO batches (id, created_at, data, output_file, error_file) VALUES (?, ?, ?, ?, ?)",
+                (batch.id, batch.created_at, batch.model_dump_json(), new_id("file-"), new_id("file-"))
+            )
+            self._conn.commit()
+
+    def save_batch(self, batch: Batch) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE batches SET data = ? WHERE id = ?", (batch.model_dump_json(), batch.id))
+            self._conn.commit()
+
+    def get_batch(self, batch_id: str) -> Optional[Batch]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM batches WHERE id = ?", (batch_id,)).fetchone()
+        return Batch.model_validate_json(row[0]) if row else None
+
+    def list_batches(self) -> List[Batch]:
+        with self._lock:
+            rows = self._conn.execute("SELECT data FROM batches ORDER BY created_at DESC, id").fetchall()
+        return [Batch.model_validate_json(row[0]) for row in rows]
+
+    def next_active_batch(self) -> Optional[Batch]:
+        # Filtered in SQL: idle runners poll this, and finished batches pile up
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM batches WHERE json_extract(data, '$.status') IN (?, ?, ?, ?)"
+                " ORDER BY created_at, id LIMIT 1",
+                ACTIVE_STATUSES
+            ).fetchone()
+        return Batch.model_validate_json(row[0]) if row else None
+
+    def progress(self, batch_id: str) -> Tuple[str, str, int, int, Set[int]]:
+        """Output/error file ids, their checkpointed sizes and the completed input lines"""
+        with self._lock:
+            output_file, error_file, output_bytes, error_bytes = self._conn.execute(
+                "SELECT output_file, error_file, output_bytes, error_bytes FROM batches WHERE id = ?", (batch_id,)
+            ).fetchone()
+            lines = {row[0] for row in self._conn.execute(
+                "SELECT line FROM batch_lines WHERE batch_id = ?", (batch_id,)
+            )}
+        return output_file, error_file, output_bytes, error_bytes, lines
+
+    def checkpoint(self, batch: Batch, lines: List[int], output_bytes: int, error_bytes: int) -> bool:
+        """Atomically record finished lines with the output sizes that include their results.
+
+        Returns True when the stored batch was meanwhile marked "cancelling"
+        (by another worker); the cancellation is kept rather than overwritten.
+        """
+        with self._lock:
+            with self._conn:
+                row = self._conn.execute("SELECT data FROM batches WHERE id = ?", (batch.id,)).fetchone()
+                stored = Batch.model_validate_json(row[0]) if row else None
+                cancelled = (
+                    stored is not None and stored.status == "cancelling" and batch.status != "cancelling"
+                )
+                if cancelled:
+                    batch.status = "cancelling"
+                    batch.cancelling_at = stored.cancelling_at
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO batch_lines (batch_id, line) VALUES (?, ?)",
+                    [(batch.id, line) for line in lines]
+                )
+                self._conn.execute(
+                    "UPDATE batches SET data = ?, output_bytes = ?, error_bytes = ? WHERE id = ?",
+                    (batch.model_dump_json(), output_bytes, error_bytes, batch.id)
+                )
+        return cancelled
+
+    def forget_lines(self, batch_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM batch_lines WHERE batch_id = ?", (batch_id,))
+            self._conn.commit()
+
+
+class RateLimiter:
+    """Space calls evenly to at most `rate` per second (0 = unlimited)"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._next = 0.0
+
+    async def wait(self) -> None:
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        start = max(self._next, now)
+        self._next = start + 1.0 / self.rate
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+class BatchRunner:
+    """Works through active batches one at a time with a pool of workers.
+
+    Input lines are read lazily and handed to the workers through a small
+    bounded queue, so files of any size run in constant memory. Results are
+    appended to the output/error JSONL files and checkpointed every
+    BATCH_CHECKPOINT_INTERVAL seconds; after a restart both files are cut back
+    to the last checkpoint and only the lines not recorded there are redone.
+
+    With several worker processes only the one holding the runner lock file
+    works on batches; the others take over if it exits.
+    """
+
+    def __init__(self, store: BatchStore):
+        self.store = store
+        self.execute: Optional[Executor] = None
+        self._task: Optional[asyncio.Task] = None
+        self._current: Optional[Batch] = None
+        self._wakeup = asyncio.Event()
+        self._lock_file = None
+        self.stats: Dict[str, int] = {"batches_completed": 0, "requests_completed": 0, "requests_failed": 0}
+
+    async def start(self) -> None:
+        """Open the store and resume unfinished batches (called from the app lifespan)"""
+        await asyncio.to_thread(self.store.open)
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            task, self._task = self._task, None
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+        await asyncio.to_thread(self.store.close)
+
+    def _try_lock(self) -> bool:
+        """Become the one process that runs batches, if no other worker is"""
+        if fcntl is None:
+            return True
+        lock_file = open(os.path.join(self.store.directory, "runner.lock"), "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def notify(self) -> None:
+        """A batch was created"""
+        self._wakeup.set()
+
+    async def _lookup(self, batch_id: str) -> Optional[Batch]:
+        # The running batch is ahead of its last checkpoint
+        if self._current is not None and self._current.id == batch_id:
+            return self._current
+        return await asyncio.to_thread(self.store.get_batch, batch_id)
+
+    async def get(self, batch_id: str) -> Optional[Batch]:
+        batch = await self._lookup(batch_id)
+        return batch.model_copy(deep=True) if batch is not None else None
+
+    async def cancel(self, batch_id: str) -> Optional[Batch]:
+        """Ask for a batch to stop; lines already sent upstream still finish"""
+        batch = await self._lookup(batch_id)
+        if batch is None:
+            return None
+        if batch.status in ("validating", "in_progress", "finalizing"):
+            batch.status = "cancelling"
+            batch.cancelling_at = int(time.time())
+            await asyncio.to_thread(self.store.save_batch, batch)
+            self._wakeup.set()
+        return batch.model_copy(deep=True)
+
+    async def _loop(self) -> None:
+        while not self._try_lock():
+            await asyncio.sleep(IDLE_POLL_INTERVAL)
+        while True:
+            self._wakeup.clear()
+            batch = await asyncio.to_thread(self.store.next_active_batch)
+            if batch is None:
+                try:
+                    # Batches created by other workers do not wake us, hence the timeout
+                    await asyncio.wait_for(self._wakeup.wait(), IDLE_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._current = batch
+            try:
+                await self._run(batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception("Batch failed", extra={"batch_id": batch.id})
+                batch.status = "failed"
+                batch.failed_at = int(time.time())
+                batch.errors = BatchErrors(data=[{"code": "internal_error", "message": str(e)}])
+                await asyncio.to_thread(self.store.save_batch, batch)
+            finally:
+                self._current = None
+
+    async def _run(self, batch: Batch) -> None:
+        input_path = self.store.file_path(batch.input_file_id)
+        if not os.path.exists(input_path):
+            batch.status = "failed"
+            batch.failed_at = int(time.time())
+            batch.errors = BatchErrors(data=[{
+                "code": "missing_file", "message": f"Input file {batch.input_file_id} does not exist"
+            }])
+            await asyncio.to_thread(self.store.save_batch, batch)
+            return
+
+        if batch.status == "validating":
+            batch.status = "in_progress"
+            batch.in_progress_at = int(time.time())
+            await asyncio.to_thread(self.store.save_batch, batch)
+
+        output_file, error_file, output_bytes, error_bytes, done = await asyncio.to_thread(
+            self.store.progress, batch.id
+        )
+        output = open(self.store.file_path(output_file), "ab")
+        errors = open(self.store.file_path(error_file), "ab")
+        try:
+            # Drop results written after the last checkpoint; those lines run again
+            output.truncate(output_bytes)
+            errors.truncate(error_bytes)
+            if batch.status in ("in_progress", "cancelling"):
+                await self._process(batch, input_path, done, output, errors)
+        finally:
+            output.close()
+            errors.close()
+
+        now = int(time.time())
+        if batch.status == "cancelling":
+            batch.status = "cancelled"
+            batch.cancelled_at = now
+        else:
+            batch.status = "completed"
+            batch.completed_at = now
+            self.stats["batches_completed"] += 1
+        # Partial results of a cancelled batch are kept too; an empty error file is not
+        for file_id, kind in ((output_file, "output"), (error_file, "error")):
+            size = os.path.getsize(self.store.file_path(file_id))
+            if kind == "error" and not size:
+                continue
+            await asyncio.to_thread(self.store.add_file, FileObject(
+                id=file_id, bytes=size, created_at=now, filename=f"{batch.id}_{kind}.jsonl", purpose="batch_output"
+            ))
+            setattr(batch, f"{kind}_file_id", file_id)
+        await asyncio.to_thread(self.store.save_batch, batch)
+        await asyncio.to_thread(self.store.forget_lines, batch.id)
+        logger.info("Batch finished", extra={"batch_id": batch.id, "status": batch.status})
+
+    async def _process(self, batch: Batch, input_path: str, done: Set[int], output, errors) -> None:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=settings.BATCH_WORKERS * 2)
+        limiter = RateLimiter(settings.BATCH_RATE_LIMIT)
+        finished: List[int] = []
+        last_checkpoint = time.monotonic()
+        checkpointing = False
+
+        async def checkpoint() -> None:
+            nonlocal finished, last_checkpoint
+            # Written lines and file sizes are taken together, before anything else can append
+            lines, finished = finished, []
+            last_checkpoint = time.monotonic()
+            output.flush()
+            errors.flush()
+            sizes = (output.tell(), errors.tell())
+            snapshot = batch.model_copy(deep=True)
+
+            def persist() -> bool:
+                os.fsync(output.fileno())
+                os.fsync(errors.fileno())
+                return self.store.checkpoint(snapshot, lines, *sizes)
+
+            if await asyncio.to_thread(persist) and batch.status != "cancelling":
+                # Cancelled through another worker
+                batch.status = "cancelling"
+                batch.cancelling_at = snapshot.cancelling_at
+
+        async def worker() -> None:
+            nonlocal checkpointing
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                line_no, raw = item
+                await limiter.wait()
+                record, ok = await self._execute_line(batch, raw)
+                (output if ok else errors).write(record)
+                batch.request_counts.completed += ok
+                batch.request_counts.failed += not ok
+                self.stats["requests_completed" if ok else "requests_failed"] += 1
+                finished.append(line_no)
+                if not checkpointing and time.monotonic() - last_checkpoint >= settings.BATCH_CHECKPOINT_INTERVAL:
+                    checkpointing = True
+                    try:
+                        await checkpoint()
+                    finally:
+                        checkpointing = False
+
+        workers = [asyncio.create_task(worker()) for _ in range(settings.BATCH_WORKERS)]
+        try:
+            total = 0
+            with open(input_path, "rb") as source:
+                for line_no, raw in enumerate(source):
+                    if not raw.strip():
+                        continue
+                    total += 1
+                    if line_no in done:
+                        continue
+                    batch.request_counts.total = max(batch.request_counts.total, total)
+                    if batch.status == "cancelling":
+                        break
+                    await queue.put((line_no, raw))
+            if batch.status != "cancelling":
+                batch.request_counts.total = total
+                batch.status = "finalizing"
+                batch.finalizing_at = int(time.time())
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            await checkpoint()
+
+    async def _execute_line(self, batch: Batch, raw: bytes) -> Tuple[bytes, bool]:
+        """Run one input line and format its output (or error) JSONL record"""
+        record: Dict[str, Any] = {"id": new_id("batch_req_"), "custom_id": None, "response": None, "error": None}
+        try:
+            item = json.loads(raw)
+            if not isinstance(item, dict):
+                raise ValueError("each line must be a JSON object")
+            record["custom_id"] = item.get("custom_id")
+            if item.get("method", "POST") != "POST" or item.get("url") != batch.endpoint:
+                raise ValueError(f"only POST {batch.endpoint} is supported in this batch")
+            if not isinstance(item.get("body"), dict):
+                raise ValueError("missing request body")
+        except ValueError as e:
+            record["error"] = {"code": "invalid_request", "message": str(e)}
+            return (json.dumps(record, ensure_ascii=False) + "\n").encode(), False
+
+        try:
+            status, body = await self.execute(item["body"])
+        except Exception as e:
+            logger.exception("Batch request failed", extra={"batch_id": batch.id})
+            status, body = 500, {"error": {"message": str(e), "type": "server_error"}}
+        record["response"] = {"status_code": status, "request_id": uuid.uuid4().hex, "body": body}
+        return (json.dumps(record, ensure_ascii=False) + "\n").encode(), status == 200
+
+
+batch_store = BatchStore(settings.BATCH_STORAGE_DIR)
+batch_runner = BatchRunner(batch_store)
@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Generic, NamedTuple, Optional, Tuple, TypeVar
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def _consume_exception(task: asyncio.Task) -> None:
+    """Mark a background refresh failure as handled (it is logged and counted already)"""
+    if not task.cancelled():
+        task.exception()
+
+
+class CachedValue(Generic[T]):
+    """Single in-process value with TTL, stale-while-revalidate and single-flight refresh.
+
+    - younger than `ttl`: served from memory
+    - younger than `ttl + stale_ttl`: served from memory while one background
+      refresh runs
+    - older or missing: callers wait on one shared refresh; if it fails the
+      last good value is served instead of an error
+
+    With a `shared` tier a refresh first looks for a value another worker
+    process loaded less than `ttl` ago, so workers share one warm copy.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[], Awaitable[T]],
+        ttl: float,
+        stale_ttl: float,
+        shared: Optional["SharedTier"] = None
+    ):
+        self._loader = loader
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._shared = shared
+        self._value: Optional[T] = None
+        self._loaded_at = float("-inf")
+        self._inflight: Optional[asyncio.Task] = None
+        self.stats: Dict[str, int] = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "refreshes": 0,
+            "shared_hits": 0,
+            "errors": 0,
+        }
+
+    @property
+    def value(self) -> Optional[T]:
+        """Last successfully loaded value, regardless of age"""
+        return self._value
+
+    def _refresh(self) -> asyncio.Task:
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._run_refresh())
+            self._inflight.add_done_callback(_consume_exception)
+        return self._inflight
+
+    async def _load(self) -> Tuple[T, float]:
+        """Return a fresh value and its age, from the shared tier if it has one"""
+        shared = self._shared
+        if shared is None:
+            return await self._loader(), 0.0
+        try:
+            entry = await asyncio.to_thread(shared.store.get_entry, shared.key)
+        except Exception as e:
+            logger.warning("Shared cache read failed: %s", e)
+            entry = None
+        if entry is not None:
+            data, expires_at = entry
+            self.stats["shared_hits"] += 1
+            return shared.decode(data), max(0.0, self.ttl - (expires_at - time.time()))
+
+        value = await self._loader()
+        try:
+            await asyncio.to_thread(shared.store.set, shared.key, shared.encode(value), self.ttl)
+        except Exception as e:
+            logger.warning("Shared cache write failed: %s", e)
+        return value, 0.0
+
+    async def _run_refresh(self) -> T:
+        try:
+            value, age = await self._load()
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning("Cache refresh failed: %s", e)
+            raise
+        finally:
+            self._inflight = None
+        self._value = value
+        self._loaded_at = time.monotonic() - age
+        self.stats["refreshes"] += 1
+        return value
+
+    async def get(self) -> T:
+        """Return the cached value, refreshing it according to its age"""
+        if self._value is not None:
+            age = time.monotonic() - self._loaded_at
+            if age < self.ttl:
+                self.stats["hits"] += 1
+                return self._value
+            if age < self.ttl + self.stale_ttl:
+                self.stats["stale_hits"] += 1
+                self._refresh()
+                return self._value
+
+        self.stats["misses"] += 1
+        try:
+            # Shielded so one cancelled caller does not abort the shared refresh
+            return await asyncio.shield(self._refresh())
+        except Exception:
+            if self._value is not None:
+                logger.warning("Serving stale cached value after refresh failure")
+                return self._value
+            raise
+
+    def peek(self) -> Optional[T]:
+        """Return the last good value without waiting, refreshing it in the background when old.
+
+        For hot paths that can do without the value (None before the first load).
+        """
+        if time.monotonic() - self._loaded_at >= self.ttl:
+            self._refresh()
+        return self._value
+
+    def invalidate(self) -> None:
+        """Force the next `get` to refresh"""
+        self._loaded_at = float("-inf")
+
+
+class SQLiteStore:
+    """Small key/value table with expiry, used as an on-disk cache tier.
+
+    The database runs in WAL mode, so several worker processes can share one
+    file: readers never wait for the writer. Expired rows are purged every
+    PURGE_EVERY writes. sqlite3 is blocking, so callers run these methods via
+    `asyncio.to_thread`.
+    """
+
+    PURGE_EVERY = 1000
+
+    def __init__(self, path: str, table: str):
+        self.path = path
+        self.table = table
+        self._lock = threading.Lock()
+        self._writes = 0
+        # Wait for another process's write rather than failing with "database is locked"
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} "
+            "(key TEXT PRIMARY KEY, expires_at REAL NOT NULL, value BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get_entry(self, key: str) -> Optional[Tuple[bytes, float]]:
+        """Return an unexpired value with its expiry time (epoch seconds)"""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return row[0], row[1]
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, expires_at, value) VALUES (?, ?, ?)",
+                (key, time.time() + ttl, value)
+            )
+            self._conn.commit()
+            self._writes += 1
+            purge = self._writes % self.PURGE_EVERY == 0
+        if purge:
+            self.purge_expired()
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self._conn.commit()
+        return bool(cursor.rowcount)
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at < ?", (time.time(),))
+            self._conn.commit()
+        return cursor.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class SharedTier(NamedTuple):
+    """Where and how a CachedValue is shared between worker processes"""
+    store: SQLiteStore
+    key: str
+    encode: Callable[[object], bytes]
+    decode: Callable[[bytes], object]
+
+
+def open_shared_store(table: str) -> Optional[SQLiteStore]:
+    """A table in the SHARED_CACHE_PATH database, or None when no shared cache is configured"""
+    if not settings.SHARED_CACHE_PATH:
+        return None
+    return SQLiteStore(settings.SHARED_CACHE_PATH, table)
@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _consume_exception(task: asyncio.Task) -> None:
+    if not task.cancelled():
+        task.exception()
+
+
+class _Entry:
+    __slots__ = ("task", "finished_at")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.finished_at: Optional[float] = None
+
+
+class Coalescer:
+    """Share one in-flight call between concurrent callers with the same key.
+
+    A finished result stays joinable for `window` seconds (0 means only
+    while the call is still running). Failures are never shared with
+    callers that arrive after the call has finished.
+    """
+
+    def __init__(self, window: float):
+        self.window = window
+        self._entries: Dict[str, _Entry] = {}
+        self.stats: Dict[str, int] = {"leaders": 0, "joined": 0}
+
+    @property
+    def inflight(self) -> int:
+        return sum(1 for entry in self._entries.values() if entry.finished_at is None)
+
+    def _joinable(self, entry: _Entry) -> bool:
+        if entry.finished_at is None:
+            return True
+        return time.monotonic() - entry.finished_at < self.window
+
+    def _on_done(self, key: str, entry: _Entry) -> None:
+        if entry.task.cancelled() or entry.task.exception() is not None:
+            self._finish(key, entry, failed=True)
+            return
+        # Streams stay joinable until the broadcast they started has ended, so
+        # factories must return the StreamBroadcast itself (see its `meta`)
+        closed = getattr(entry.task.result(), "closed", None)
+        if isinstance(closed, asyncio.Future) and not closed.done():
+            closed.add_done_callback(lambda _: self._finish(key, entry, failed=closed.result()))
+            return
+        self._finish(key, entry, failed=False)
+
+    def _finish(self, key: str, entry: _Entry, failed: bool) -> None:
+        entry.finished_at = time.monotonic()
+        if failed or self.window <= 0:
+            self._forget(key, entry)
+        else:
+            asyncio.get_running_loop().call_later(self.window, self._forget, key, entry)
+
+    def _forget(self, key: str, entry: _Entry) -> None:
+        if self._entries.get(key) is entry:
+            del self._entries[key]
+
+    async def run(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Run `factory` once per key and return `(result, joined)` to every caller"""
+        entry = self._entries.get(key)
+        joined = entry is not None and self._joinable(entry)
+        if joined:
+            self.stats["joined"] += 1
+        else:
+            entry = _Entry(asyncio.ensure_future(factory()))
+            entry.task.add_done_callback(_consume_exception)
+            entry.task.add_done_callback(lambda _, key=key, entry=entry: self._on_done(key, entry))
+            self._entries[key] = entry
+            self.stats["leaders"] += 1
+        # Shielded so a caller that goes away does not cancel the shared call
+        return await asyncio.shield(entry.task), joined
+
+
+class StreamAbandoned(Exception):
+    """Every subscriber left before the stream ended, so it was cancelled"""
+
+
+class StreamBroadcast:
+    """Fan one async stream out to any number of subscribers.
+
+    Every item is kept so subscribers that join late get a replay of what
+    was already sent before following the live stream. Once the last
+    subscriber has gone away before the end, the source is cancelled and
+    closed (and with it the upstream response); the broadcast then counts
+    as failed, so nobody joins a stream that was cut short. `meta` is
+    whatever the creator wants every subscriber to see along with it.
+    """
+
+    def __init__(self, source: AsyncIterator[Any], meta: Any = None):
+        self.meta = meta
+        self._items: List[Any] = []
+        self._done = False
+        self._error: Optional[BaseException] = None
+        self._subscribers = 0
+        self._changed = asyncio.Event()
+        # Resolves to True if the stream failed, False once it ended cleanly
+        self.closed: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._task = asyncio.ensure_future(self._pump(source))
+        self._task.add_done_callback(lambda _: self._on_pump_done(source))
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _pump(self, source: AsyncIterator[Any]) -> None:
+        try:
+            async for item in source:
+                self._items.append(item)
+                self._notify()
+        except asyncio.CancelledError:
+            self._error = StreamAbandoned("Every subscriber left before the stream ended")
+            raise
+        except Exception as e:
+            self._error = e
+        finally:
+            self._end()
+            aclose = getattr(source, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    def _end(self) -> None:
+        self._done = True
+        self._notify()
+        self.closed.set_result(self._error is not None)
+
+    def _on_pump_done(self, source: AsyncIterator[Any]) -> None:
+        # A pump cancelled before its first step never enters its try block
+        if self._done:
+            return
+        self._error = StreamAbandoned("Every subscriber left before the stream started")
+        self._end()
+        aclose = getattr(source, "aclose", None)
+        if aclose is not None:
+            asyncio.ensure_future(aclose()).add_done_callback(_consume_exception)
+
+    def subscribe(self) -> AsyncIterator[Any]:
+        """Yield every item from the beginning, then follow the live stream.
+
+        The subscriber counts from this call, so a stream whose first
+        reader has not started yet is not cancelled when another one leaves.
+        """
+        self._subscribers += 1
+        return _Subscription(self)
+
+    def _unsubscribe(self) -> None:
+        self._subscribers -= 1
+        if not self._subscribers and not self._done:
+            self._task.cancel()
+
+
+class _Subscription:
+    """One reader of a StreamBroadcast.
+
+    Not an async generator: closing (or dropping) one that was never
+    iterated would skip its `finally`, and the subscriber would be
+    counted forever.
+    """
+
+    def __init__(self, broadcast: StreamBroadcast):
+        self._broadcast = broadcast
+        self._position = 0
+        self._subscribed = True
+
+    def __aiter__(self) -> "_Subscription":
+        return self
+
+    async def __anext__(self) -> Any:
+        broadcast = self._broadcast
+        try:
+            while True:
+                if not self._subscribed:
+                    raise StopAsyncIteration
+                if self._position < len(broadcast._items):
+                    self._position += 1
+                    return broadcast._items[self._position - 1]
+                if broadcast._done:
+                    if broadcast._error is not None:
+                        raise broadcast._error
+                    raise StopAsyncIteration
+                await broadcast._changed.wait()
+        except BaseException:
+            self._leave()
+            raise
+
+    def _leave(self) -> None:
+        if self._subscribed:
+            self._subscribed = False
+            self._broadcast._unsubscribe()
+
+    async def aclose(self) -> None:
+        self._leave()
+
+    def __del__(self):
+        self._leave()
+
+
+completion_coalescer = Coalescer(window=settings.COALESCE_WINDOW)
@@ -0,0 +1,368 @@
+import io
+import logging
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from starlette.datastructures import MutableHeaders
+from starlette.responses import JSONResponse
+
+from .config import settings
+
+try:
+    import brotli
+except ImportError:  # optional, enables "br"
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional, enables "zstd"
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Content encodings this process can produce, depending on installed packages
+AVAILABLE = {"gzip"} | ({"br"} if brotli is not None else set()) | ({"zstd"} if zstandard is not None else set())
+
+# Media types worth compressing; everything else (images, archives...) is sent as is
+_COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/jsonl",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+)
+
+stats: Dict[str, int] = {
+    "responses_compressed": 0,
+    "response_bytes_in": 0,
+    "response_bytes_out": 0,
+    "requests_decompressed": 0,
+    "request_bytes_in": 0,
+    "request_bytes_out": 0,
+    "requests_rejected": 0,
+    "upstream_compressed": 0,
+    "upstream_bytes_in": 0,
+    "upstream_bytes_out": 0,
+}
+
+
+class _Gzip:
+    def __init__(self):
+        self._compressor = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _Brotli:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _Zstd:
+    def __init__(self):
+        self._compressor = zstandard.ZstdCompressor(level=settings.COMPRESSION_ZSTD_LEVEL).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+_CODECS = {"gzip": _Gzip, "br": _Brotli, "zstd": _Zstd}
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """Pick the content encoding for a response from the client's Accept-Encoding.
+
+    Among the available encodings the client accepts, the highest q-value
+    wins; ties go to the order of COMPRESSION_ENCODINGS. None means identity.
+    """
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted["gzip" if name == "x-gzip" else name] = quality
+
+    wildcard = accepted.get("*", 0.0)
+    best, best_quality = None, 0.0
+    for encoding in settings.COMPRESSION_ENCODINGS:
+        if encoding not in AVAILABLE:
+            continue
+        quality = accepted.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def _compressible(content_type: str) -> bool:
+    content_type = content_type.split(";", 1)[0].strip().lower()
+    return content_type.startswith(_COMPRESSIBLE_TYPES) or content_type.endswith(("+json", "+xml"))
+
+
+class RequestTooLarge(Exception):
+    """A compressed request body expands beyond COMPRESSION_MAX_REQUEST_BYTES"""
+
+
+def decompress(encoding: str, data: bytes, limit: int) -> bytes:
+    """Decode a request body, never producing more than `limit` bytes.
+
+    Raises ValueError for unsupported encodings and malformed data, and
+    RequestTooLarge when the output would exceed the limit (zip bombs).
+    """
+    if encoding in ("gzip", "x-gzip", "deflate"):
+        # 47 detects gzip or zlib headers; "deflate" is zlib-wrapped per RFC 9110
+        decompressor = zlib.decompressobj(47 if encoding != "deflate" else 15)
+        try:
+            output = decompressor.decompress(data, limit + 1)
+        except zlib.error as e:
+            raise ValueError(f"Malformed {encoding} body: {e}") from e
+        if len(output) > limit:
+            raise RequestTooLarge()
+        if not decompressor.eof:
+            raise ValueError(f"Truncated {encoding} body")
+        return output
+
+    if encoding == "zstd" and zstandard is not None:
+        try:
+            with zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)) as reader:
+                output = reader.read(limit + 1)
+        except zstandard.ZstdError as e:
+            raise ValueError(f"Malformed zstd body: {e}") from e
+        if len(output) > limit:
+            raise RequestTooLarge()
+        return output
+
+    if encoding == "br" and brotli is not None:
+        decompressor = brotli.Decompressor()
+        output = io.BytesIO()
+        # Small input slices keep a bomb from expanding far past the limit at once
+        for offset in range(0, len(data), 4096):
+            try:
+                output.write(decompressor.process(data[offset:offset + 4096]))
+            except brotli.error as e:
+                raise ValueError(f"Malformed br body: {e}") from e
+            if output.tell() > limit:
+                raise RequestTooLarge()
+        if not decompressor.is_finished():
+            raise ValueError("Truncated br body")
+        return output.getvalue()
+
+    raise ValueError(f"Unsupported Content-Encoding: {encoding}")
+
+
+def compress_upstream_body(content: bytes) -> Tuple[bytes, Optional[str]]:
+    """Gzip an upstream request body when enabled and large enough.
+
+    Returns the body to send and its Content-Encoding (None when unchanged).
+    """
+    if not settings.UPSTREAM_COMPRESS_REQUESTS or len(content) < settings.COMPRESSION_MIN_SIZE:
+        return content, None
+    compressed = zlib.compress(content, settings.COMPRESSION_GZIP_LEVEL, wbits=31)
+    stats["upstream_compressed"] += 1
+    stats["upstream_bytes_in"] += len(content)
+    stats["upstream_bytes_out"] += len(compressed)
+    return compressed, "gzip"
+
+
+class _CompressingSend:
+    """`send` wrapper that compresses the response body if it qualifies.
+
+    http.response.start is held back until the first body message shows
+    whether the response is small (sent as is) or worth compressing. Buffered
+    bodies are compressed in one go; streamed ones chunk by chunk, flushing
+    after every chunk so SSE events reach the client immediately. Only
+    downloads with a declared Content-Length skip the per-chunk flush.
+    """
+
+    def __init__(self, send, encoding: str):
+        self.send = send
+        self.encoding = encoding
+        self.start = None
+        self.codec = None
+        self.flush_chunks = True
+        self.passthrough = False
+
+    def _headers_for(self, start) -> Optional[MutableHeaders]:
+        """The response headers when it may be compressed, otherwise None"""
+        status = start["status"]
+        if status < 200 or status in (204, 206, 304):
+            return None
+        headers = MutableHeaders(raw=list(start.get("headers", [])))
+        if "content-encoding" in headers or not _compressible(headers.get("content-type", "")):
+            return None
+        # The representation depends on Accept-Encoding even when this one stays small
+        headers.add_vary_header("Accept-Encoding")
+        start["headers"] = headers.raw
+        return headers
+
+    async def __call__(self, message) -> None:
+        if self.passthrough:
+            await self.send(message)
+            return
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start is not None:
+            start, self.start = self.start, None
+            headers = self._headers_for(start)
+            if headers is None or (not more_body and len(body) < settings.COMPRESSION_MIN_SIZE):
+                self.passthrough = True
+                await self.send(start)
+                await self.send(message)
+                return
+            self.flush_chunks = "content-length" not in headers
+            del headers["content-length"]
+            headers["Content-Encoding"] = self.encoding
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                # Same content, different bytes: only a weak validator still holds
+                headers["ETag"] = "W/" + etag
+            start["headers"] = headers.raw
+            self.codec = _CODECS[self.encoding]()
+            stats["responses_compressed"] += 1
+            await self.send(start)
+
+        stats["response_bytes_in"] += len(body)
+        output = self.codec.compress(body)
+        if not more_body:
+            output += self.codec.finish()
+        elif self.flush_chunks:
+            output += self.codec.flush()
+        elif not output:
+            return
+        stats["response_bytes_out"] += len(output)
+        await self.send({"type": "http.response.body", "body": output, "more_body": more_body})
+
+
+class CompressionMiddleware:
+    """Negotiated response compression and compressed request bodies.
+
+    Responses are compressed with the client's preferred encoding (gzip,
+    plus br/zstd when their packages are installed) once they reach
+    COMPRESSION_MIN_SIZE or are streamed. Request bodies sent with a
+    Content-Encoding are decoded before the app sees them, up to
+    COMPRESSION_MAX_REQUEST_BYTES of output.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.COMPRESSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = content_encoding = None
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+            elif name == b"content-encoding":
+                content_encoding = value.decode("latin-1").strip().lower()
+
+        if content_encoding and content_encoding != "identity":
+            decoded = await self._decode_request(scope, receive, send, content_encoding)
+            if decoded is None:
+                return
+            scope, receive = decoded
+
+        encoding = negotiate(accept_encoding) if accept_encoding else None
+        if encoding is not None:
+            send = _CompressingSend(send, encoding)
+        await self.app(scope, receive, send)
+
+    async def _decode_request(self, scope, receive, send, encoding: str):
+        """Read and decode the whole request body.
+
+        Returns the scope and receive channel the app should see, or None
+        when an error response was sent or the client went away.
+        """
+        limit = settings.COMPRESSION_MAX_REQUEST_BYTES
+        chunks: List[bytes] = []
+        size = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return None
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > limit:
+                return await self._reject(scope, receive, send, 413, "Request body too large")
+            chunks.append(chunk)
+            more_body = message.get("more_body", False)
+
+        data = b"".join(chunks)
+        del chunks
+        try:
+            body = decompress(encoding, data, limit)
+        except RequestTooLarge:
+            return await self._reject(scope, receive, send, 413, "Request body too large once decompressed")
+        except ValueError as e:
+            status = 415 if str(e).startswith("Unsupported") else 400
+            return await self._reject(scope, receive, send, status, str(e))
+        stats["requests_decompressed"] += 1
+        stats["request_bytes_in"] += len(data)
+        stats["request_bytes_out"] += len(body)
+
+        headers = [
+            (name, value) for name, value in scope["headers"]
+            if name not in (b"content-encoding", b"content-length")
+        ]
+        headers.append((b"content-length", str(len(body)).encode("latin-1")))
+        replayed = False
+
+        async def receive_decoded():
+            nonlocal replayed
+            if not replayed:
+                replayed = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        # Replaced in place rather than on a copy: outer middleware (metrics)
+        # reads what the router writes into the scope, such as "route"
+        scope["headers"] = headers
+        return scope, receive_decoded
+
+    async def _reject(self, scope, receive, send, status: int, detail: str) -> None:
+        stats["requests_rejected"] += 1
+        logger.warning("Rejected compressed request body: %s", detail)
+        headers = {"Accept-Encoding": ", ".join(sorted(AVAILABLE | {"deflate"}))} if status == 415 else None
+        await JSONResponse({"detail": detail}, status_code=status, headers=headers)(scope, receive, send)
+        return None
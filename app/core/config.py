@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Optional, List, Dict
 from functools import lru_cache
 
 class Settings(BaseSettings):
@@ -10,7 +10,181 @@ class Settings(BaseSettings):
     FUNCTION_CALLING_SYSTEM_PROMPT: str = """You are a helpful AI assistant capable of using tools through function calling.
 When a function is available and relevant to the user's request, you should use it.
 Always structure your function call responses in valid JSON format."""
-    
+
+    # Shared upstream HTTP client
+    UPSTREAM_HTTP2: bool = False
+    UPSTREAM_MAX_CONNECTIONS: int = 100
+    UPSTREAM_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    UPSTREAM_KEEPALIVE_EXPIRY: float = 30.0
+    UPSTREAM_CONNECT_TIMEOUT: float = 5.0
+    UPSTREAM_READ_TIMEOUT: float = 30.0
+    UPSTREAM_WRITE_TIMEOUT: float = 30.0
+    UPSTREAM_POOL_TIMEOUT: float = 10.0
+    UPSTREAM_MODELS_TIMEOUT: float = 10.0
+
+    # Upstream pool: POLLINATIONS_BASE_URLS (JSON list) overrides
+    # POLLINATIONS_BASE_URL when set. Routing is "least_outstanding" or
+    # "ewma"; an endpoint's circuit opens after UPSTREAM_BREAKER_FAILURES
+    # consecutive errors and is retried after UPSTREAM_BREAKER_COOLDOWN.
+    # Set UPSTREAM_HEALTH_CHECK_INTERVAL to 0 to disable active probes.
+    POLLINATIONS_BASE_URLS: List[str] = []
+    UPSTREAM_ROUTING: str = "least_outstanding"
+    UPSTREAM_EWMA_ALPHA: float = 0.3
+    UPSTREAM_BREAKER_FAILURES: int = 5
+    UPSTREAM_BREAKER_COOLDOWN: float = 30.0
+    UPSTREAM_FAILOVER_ATTEMPTS: int = 2
+    UPSTREAM_HEALTH_CHECK_INTERVAL: float = 15.0
+    UPSTREAM_HEALTH_CHECK_PATH: str = "/models"
+    UPSTREAM_HEALTH_CHECK_TIMEOUT: float = 5.0
+
+    # Adaptive (AIMD) per-endpoint upstream concurrency window: grows while
+    # requests succeed, shrinks by ADAPTIVE_LIMIT_BACKOFF on 429/503, timeouts
+    # or when latency rises ADAPTIVE_LIMIT_LATENCY_FACTOR times above its
+    # usual level (0 disables the latency signal); upstream Retry-After pauses it
+    ADAPTIVE_LIMIT_ENABLED: bool = True
+    ADAPTIVE_LIMIT_INITIAL: int = 32
+    ADAPTIVE_LIMIT_MIN: int = 1
+    ADAPTIVE_LIMIT_MAX: int = 100
+    ADAPTIVE_LIMIT_BACKOFF: float = 0.5
+    ADAPTIVE_LIMIT_LATENCY_FACTOR: float = 3.0
+    ADAPTIVE_LIMIT_QUEUE_TIMEOUT: float = 10.0
+
+    # Retries with jittered exponential backoff for connect errors, timeouts
+    # and 429/502/503/504, bounded by the request deadline: "X-Proxy-Deadline"
+    # (seconds) or REQUEST_DEADLINE (0 = none), capped at REQUEST_DEADLINE_MAX
+    RETRY_ATTEMPTS: int = 2
+    RETRY_BACKOFF: float = 0.2
+    RETRY_MAX_BACKOFF: float = 2.0
+    REQUEST_DEADLINE: float = 0.0
+    REQUEST_DEADLINE_MAX: float = 300.0
+
+    # Hedged requests (opt-in, or per request with "X-Proxy-Hedge: on"): a
+    # second attempt starts once the first is slower than HEDGE_PERCENTILE of
+    # the last HEDGE_WINDOW attempts, and the faster one wins
+    HEDGE_ENABLED: bool = False
+    HEDGE_PERCENTILE: float = 95.0
+    HEDGE_MIN_DELAY: float = 0.05
+    HEDGE_MIN_SAMPLES: int = 20
+    HEDGE_WINDOW: int = 500
+
+    # Requests with n > 1 fan out into n concurrent upstream calls
+    FANOUT_MAX_N: int = 8
+
+    # Batch API: uploaded files and job state live under BATCH_STORAGE_DIR;
+    # each batch runs BATCH_WORKERS requests at a time, at most BATCH_RATE_LIMIT
+    # per second (0 = unlimited), checkpointing every BATCH_CHECKPOINT_INTERVAL
+    BATCH_STORAGE_DIR: str = "batch_data"
+    BATCH_WORKERS: int = 8
+    BATCH_RATE_LIMIT: float = 0.0
+    BATCH_CHECKPOINT_INTERVAL: float = 1.0
+
+    # Admission control for chat completions: at most ADMISSION_MAX_CONCURRENT
+    # in flight, up to ADMISSION_QUEUE_SIZE waiting (ADMISSION_TENANT_QUEUE_SIZE
+    # per user/API key), served round-robin across tenants; the rest get 429
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_MAX_CONCURRENT: int = 64
+    ADMISSION_QUEUE_SIZE: int = 256
+    ADMISSION_TENANT_QUEUE_SIZE: int = 32
+    ADMISSION_QUEUE_TIMEOUT: float = 10.0
+
+    # Server-side conversation sessions: with "X-Proxy-Session: <id>" clients
+    # send only new messages and the proxy keeps the history. Least recently
+    # used sessions beyond SESSION_MAX_BYTES are spilled to SESSION_DISK_PATH
+    # (SQLite) when set, otherwise dropped; idle sessions expire after SESSION_TTL
+    SESSIONS_ENABLED: bool = True
+    SESSION_MAX_BYTES: int = 128 * 1024 * 1024
+    SESSION_TTL: float = 3600.0
+    SESSION_DISK_PATH: Optional[str] = None
+
+    # Response compression negotiated from Accept-Encoding: gzip, plus "br"
+    # and "zstd" when the brotli / zstandard packages are installed, in
+    # COMPRESSION_ENCODINGS preference order. Buffered bodies under
+    # COMPRESSION_MIN_SIZE bytes are sent as is; streams (SSE) are compressed
+    # and flushed chunk by chunk. Request bodies with a Content-Encoding are
+    # accepted up to COMPRESSION_MAX_REQUEST_BYTES once decompressed.
+    # UPSTREAM_COMPRESS_REQUESTS gzips upstream payloads over the same size
+    # threshold and needs an upstream that accepts Content-Encoding: gzip
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_ENCODINGS: List[str] = ["zstd", "br", "gzip"]
+    COMPRESSION_MIN_SIZE: int = 1024
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 5
+    COMPRESSION_ZSTD_LEVEL: int = 3
+    COMPRESSION_MAX_REQUEST_BYTES: int = 64 * 1024 * 1024
+    UPSTREAM_COMPRESS_REQUESTS: bool = False
+
+    # Startup warm-up, run in the background while /v1/ready answers 503:
+    # WARMUP_CONNECTIONS connections are opened to every upstream endpoint,
+    # the model catalogue is fetched and a synthetic tool-calling request
+    # runs through the local request path. A step that fails or takes longer
+    # than WARMUP_TIMEOUT seconds is logged and skipped
+    WARMUP_ENABLED: bool = True
+    WARMUP_CONNECTIONS: int = 4
+    WARMUP_TIMEOUT: float = 15.0
+
+    # Multi-worker launcher (python -m app.serve): WORKERS processes, 0 means
+    # one per CPU available to the container. Workers share the model
+    # catalogue and response caches through the SQLite file at
+    # SHARED_CACHE_PATH, which the launcher defaults to "shared_cache.sqlite3"
+    SERVER_HOST: str = "0.0.0.0"
+    SERVER_PORT: int = 8000
+    WORKERS: int = 0
+    SHARED_CACHE_PATH: Optional[str] = None
+
+    # Model catalogue cache for /v1/models
+    MODELS_CACHE_TTL: float = 60.0
+    MODELS_CACHE_STALE_TTL: float = 600.0
+
+    # Model routing from the catalogue: unknown models (and tools for models
+    # the catalogue marks "tools": false) are rejected locally unless
+    # MODEL_VALIDATION_ENABLED is off. MODEL_ALIASES maps extra names to
+    # catalogue models (JSON object). MODEL_FALLBACKS lists, per model, the
+    # models to use while it is unhealthy (after MODEL_FALLBACK_FAILURES
+    # consecutive 429/5xx answers, for MODEL_FALLBACK_COOLDOWN seconds) or
+    # when it still answers 429/5xx after the retries
+    MODEL_VALIDATION_ENABLED: bool = True
+    MODEL_ALIASES: Dict[str, str] = {}
+    MODEL_FALLBACKS: Dict[str, List[str]] = {}
+    MODEL_FALLBACK_FAILURES: int = 3
+    MODEL_FALLBACK_COOLDOWN: float = 30.0
+
+    # Response cache for deterministic chat completions
+    # Requests opt in with "X-Proxy-Cache: on", or by using one of
+    # RESPONSE_CACHE_MODELS with temperature 0
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_MODELS: List[str] = []
+    RESPONSE_CACHE_TTL: float = 3600.0
+    RESPONSE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    RESPONSE_CACHE_DISK_PATH: Optional[str] = None
+
+    # Coalescing of identical in-flight deterministic requests; a finished
+    # result stays joinable for COALESCE_WINDOW seconds
+    COALESCE_ENABLED: bool = True
+    COALESCE_WINDOW: float = 0.0
+
+    # Compiled function/tool prompt blocks kept in memory
+    TOOLSET_CACHE_SIZE: int = 256
+
+    # Structured logging through a background queue; records are dropped
+    # (and counted) when the queue is full
+    LOG_LEVEL: str = "INFO"
+    LOG_QUEUE_SIZE: int = 10000
+    LOG_SAMPLE_RATES: Dict[str, float] = {}
+    LOG_MAX_PAYLOAD_CHARS: int = 2048
+    LOG_JSONL_PATH: Optional[str] = None
+
+    # Server-Timing header with per-stage durations on every response
+    SERVER_TIMING_ENABLED: bool = True
+
+    # Admin endpoints (sampling profiler) need "Authorization: Bearer
+    # <ADMIN_API_KEY>" and are not served while it is unset
+    ADMIN_API_KEY: Optional[str] = None
+    PROFILER_INTERVAL_MS: float = 5.0
+    PROFILER_MAX_SECONDS: float = 60.0
+
+    # Streaming
+    STREAM_MAX_BUFFER_CHARS: int = 1048576
+
     class Config:
         env_file = ".env"
         case_sensitive = True
@@ -0,0 +1,80 @@
+import asyncio
+import logging
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class DisconnectMiddleware:
+    """Cancel the request's work as soon as the client goes away.
+
+    Once the app has read the whole request body, the middleware keeps
+    listening on `receive`. If the client disconnects before the response is
+    complete, the request task is cancelled, which aborts the in-flight
+    upstream call (releasing its endpoint and admission slots) instead of
+    finishing a completion nobody will read.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        task = asyncio.current_task()
+        disconnected = asyncio.Event()
+        body_done = False
+        response_started = False
+        response_done = False
+        finished = False
+        abandoned = False
+        watcher = None
+
+        async def watch():
+            nonlocal abandoned
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    break
+            disconnected.set()
+            if not response_done and not finished:
+                abandoned = True
+                task.cancel()
+
+        async def receive_with_watch():
+            nonlocal body_done, watcher
+            if body_done:
+                # The watcher owns the real receive channel now
+                await disconnected.wait()
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request" and not message.get("more_body", False):
+                body_done = True
+                watcher = asyncio.create_task(watch())
+            return message
+
+        async def send_with_watch(message):
+            nonlocal response_started, response_done
+            if message["type"] == "http.response.start":
+                response_started = True
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                response_done = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive_with_watch, send_with_watch)
+        except asyncio.CancelledError:
+            if not abandoned:
+                raise
+        finally:
+            finished = True
+            if watcher is not None:
+                watcher.cancel()
+            if abandoned:
+                task.uncancel()
+                phase = "streaming" if response_started else "waiting"
+                metrics.ABANDONED.inc(phase)
+                logger.info("Client disconnected, request cancelled", extra={"phase": phase})
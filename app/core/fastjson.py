@@ -0,0 +1,112 @@
+import io
+import json
+from typing import Any, Callable, Dict, Union
+
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+# Which library does the work, for stats and benchmarks
+BACKEND = "orjson" if orjson is not None else "json"
+
+# orjson's decode error subclasses this one, so callers catch a single type
+JSONDecodeError = json.JSONDecodeError
+
+_encoder = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False)
+
+# The stdlib fallback encodes top-level lists longer than this item by item,
+# so a long message history never exists as one str plus one bytes copy
+_CHUNKED_LIST_ITEMS = 64
+
+
+def _is_chunkable(value: Any) -> bool:
+    return (
+        isinstance(value, dict)
+        and any(isinstance(item, list) and len(item) > _CHUNKED_LIST_ITEMS for item in value.values())
+        and all(isinstance(key, str) for key in value)
+    )
+
+
+def _dumps_chunked(value: Dict[str, Any]) -> bytes:
+    """Stdlib encoding of a dict, writing its long lists piecewise into one buffer"""
+    buffer = io.BytesIO()
+    write = buffer.write
+    separator = b"{"
+    for key, item in value.items():
+        write(separator)
+        separator = b","
+        write(_encoder.encode(key).encode())
+        write(b":")
+        if isinstance(item, list) and len(item) > _CHUNKED_LIST_ITEMS:
+            item_separator = b"["
+            for element in item:
+                write(item_separator)
+                item_separator = b","
+                write(_encoder.encode(element).encode())
+            write(b"]")
+        else:
+            write(_encoder.encode(item).encode())
+    write(b"}")
+    # No copy: BytesIO hands over its buffer when nothing else references it
+    return buffer.getvalue()
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Decode a JSON document"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(value: Any) -> bytes:
+    """Encode to compact UTF-8 JSON"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    if _is_chunkable(value):
+        return _dumps_chunked(value)
+    return _encoder.encode(value).encode()
+
+
+def dumps_str(value: Any) -> str:
+    """Encode to a compact JSON string"""
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    return _encoder.encode(value)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with the fast encoder.
+
+    The content must already be plain JSON data: unlike FastAPI's default
+    path it is neither validated against a response model nor run through
+    `jsonable_encoder`.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class FastJSONRequest(Request):
+    """Request whose JSON body is decoded with the fast decoder"""
+
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            self._json = loads(await self.body())
+        return self._json
+
+
+class FastJSONRoute(APIRoute):
+    """Route class that parses request bodies through FastJSONRequest"""
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            return await handler(FastJSONRequest(request.scope, request.receive))
+
+        return route_handler
@@ -0,0 +1,216 @@
+import asyncio
+import contextvars
+import logging
+import random
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, NamedTuple, Optional
+
+import httpx
+
+from . import fastjson
+from .compression import compress_upstream_body
+from .config import settings
+from .limiter import parse_retry_after
+from .upstream import DeadlineExceeded, upstream
+
+logger = logging.getLogger(__name__)
+
+# Upstream answers worth another try: nothing was produced and a later or
+# different attempt may well succeed
+RETRYABLE_STATUSES = {429, 502, 503, 504}
+
+
+class CallPolicy(NamedTuple):
+    """How the current request wants its upstream calls made"""
+    deadline: Optional[float]
+    hedge: bool
+
+
+_policy: contextvars.ContextVar[Optional[CallPolicy]] = contextvars.ContextVar("upstream_call_policy", default=None)
+
+
+def set_policy(deadline: Optional[float], hedge: bool) -> None:
+    """Apply a deadline (time.monotonic() value) and hedging choice to the current request"""
+    _policy.set(CallPolicy(deadline, hedge))
+
+
+def deadline_from_header(value: Optional[str]) -> Optional[float]:
+    """Turn an `X-Proxy-Deadline` budget in seconds into an absolute deadline"""
+    budget = None
+    if value:
+        try:
+            budget = float(value)
+        except ValueError:
+            budget = None
+    if budget is None or budget <= 0:
+        budget = settings.REQUEST_DEADLINE or None
+    if budget is None:
+        return None
+    if settings.REQUEST_DEADLINE_MAX:
+        budget = min(budget, settings.REQUEST_DEADLINE_MAX)
+    return time.monotonic() + budget
+
+
+class LatencyTracker:
+    """Sliding window of recent successful attempt latencies"""
+
+    def __init__(self, size: int):
+        self._samples: Deque[float] = deque(maxlen=size)
+        self._sorted: Optional[List[float]] = None
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+        self._sorted = None
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if len(self._samples) < settings.HEDGE_MIN_SAMPLES:
+            return None
+        if self._sorted is None:
+            self._sorted = sorted(self._samples)
+        rank = min(len(self._sorted) - 1, int(len(self._sorted) * pct / 100))
+        return self._sorted[rank]
+
+
+_trackers: Dict[str, LatencyTracker] = {}
+stats: Dict[str, int] = {"hedges": 0, "hedge_wins": 0, "primary_wins": 0, "retries": 0, "deadline_exceeded": 0}
+
+
+def _tracker(path: str, stream: bool) -> LatencyTracker:
+    # Streams are timed to headers and buffered calls to the full body, so keep them apart
+    key = f"{path}:{'stream' if stream else 'buffered'}"
+    tracker = _trackers.get(key)
+    if tracker is None:
+        tracker = _trackers[key] = LatencyTracker(settings.HEDGE_WINDOW)
+    return tracker
+
+
+async def _timed_send(tracker: LatencyTracker, **kwargs) -> httpx.Response:
+    start = time.perf_counter()
+    response = await upstream.send(**kwargs)
+    if response.status_code < 500:
+        tracker.observe(time.perf_counter() - start)
+    return response
+
+
+async def _discard(task: asyncio.Task) -> None:
+    """Cancel a losing attempt, closing its response if it already had one"""
+    task.cancel()
+    try:
+        response = await task
+    except BaseException:
+        return
+    await response.aclose()
+
+
+async def _hedged_send(tracker: LatencyTracker, **kwargs) -> httpx.Response:
+    """Start a second attempt if the first is slower than usual and keep the faster one"""
+    delay = tracker.percentile(settings.HEDGE_PERCENTILE)
+    primary = asyncio.ensure_future(_timed_send(tracker, **kwargs))
+    if delay is None:
+        return await primary
+
+    attempts = [primary]
+    winner = None
+    try:
+        done, _ = await asyncio.wait(attempts, timeout=max(delay, settings.HEDGE_MIN_DELAY))
+        # Hedge only when there is spare upstream capacity, otherwise it just adds load
+        if done or not upstream.has_capacity():
+            winner = primary
+            return await primary
+
+        stats["hedges"] += 1
+        hedge = asyncio.ensure_future(_timed_send(tracker, **kwargs))
+        attempts.append(hedge)
+        pending = set(attempts)
+        while winner is None and pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winner = next((task for task in done if not task.exception()), None)
+        if winner is None:
+            # Both failed: surface the primary's error
+            return primary.result()
+        stats["hedge_wins" if winner is hedge else "primary_wins"] += 1
+        return winner.result()
+    finally:
+        # Losers, or every attempt if we were cancelled
+        for task in attempts:
+            if task is not winner:
+                await _discard(task)
+
+
+async def send(
+    method: str,
+    path: str,
+    *,
+    json: Any = None,
+    stream: bool = False,
+    timeout: Optional[float] = None
+) -> httpx.Response:
+    """Send an upstream request under the current request's deadline and hedging policy.
+
+    Connect errors, timeouts and 429/502/503/504 are retried with jittered
+    exponential backoff (honouring upstream Retry-After) as long as the
+    deadline budget allows. Without a deadline a Retry-After longer than
+    RETRY_MAX_BACKOFF is not waited out: the answer goes back to the client
+    with its Retry-After rather than holding the request (and its admission
+    slot) meanwhile. Only calls with no upstream side effects go
+    through here, so every attempt is safe to repeat.
+    """
+    policy = _policy.get() or CallPolicy(None, False)
+    deadline = policy.deadline
+    tracker = _tracker(path, stream)
+    # Encoded once, however many attempts and hedges it takes
+    content, content_encoding = compress_upstream_body(fastjson.dumps(json)) if json is not None else (None, None)
+    attempt = 0
+    while True:
+        if deadline is not None and time.monotonic() >= deadline:
+            stats["deadline_exceeded"] += 1
+            raise DeadlineExceeded("Deadline exceeded before Pollinations API answered")
+
+        kwargs = dict(
+            method=method,
+            path=path,
+            content=content,
+            content_encoding=content_encoding,
+            stream=stream,
+            timeout=timeout,
+            deadline=deadline
+        )
+        response = None
+        retry_after = None
+        try:
+            if policy.hedge:
+                response = await _hedged_send(tracker, **kwargs)
+            else:
+                response = await _timed_send(tracker, **kwargs)
+        except DeadlineExceeded:
+            stats["deadline_exceeded"] += 1
+            raise
+        except httpx.TransportError as e:
+            if deadline is not None and time.monotonic() >= deadline:
+                stats["deadline_exceeded"] += 1
+                raise DeadlineExceeded("Deadline exceeded before Pollinations API answered") from e
+            if attempt >= settings.RETRY_ATTEMPTS:
+                raise
+            error = e
+        else:
+            if response.status_code not in RETRYABLE_STATUSES or attempt >= settings.RETRY_ATTEMPTS:
+                return response
+            retry_after = parse_retry_after(response.headers.get("retry-after"))
+            error = None
+
+        backoff = min(settings.RETRY_MAX_BACKOFF, settings.RETRY_BACKOFF * 2 ** attempt)
+        backoff = max(random.uniform(0, backoff), retry_after or 0.0)
+        if deadline is not None and time.monotonic() + backoff >= deadline:
+            # Not enough budget left to wait and try again
+            if error is not None:
+                raise error
+            return response
+        if deadline is None and retry_after is not None and retry_after > settings.RETRY_MAX_BACKOFF:
+            return response
+        if response is not None:
+            await response.aclose()
+        attempt += 1
+        stats["retries"] += 1
+        logger.info("Retrying upstream request", extra={"attempt": attempt, "backoff": round(backoff, 3)})
+        await asyncio.sleep(backoff)
@@ -0,0 +1,153 @@
+import asyncio
+import time
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Deque, Dict, Optional
+
+# Longest upstream Retry-After we are willing to honour
+MAX_RETRY_AFTER = 300.0
+
+
+class LimiterTimeout(Exception):
+    """No upstream window slot became free in time"""
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given either in seconds or as an HTTP date"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            when = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        seconds = (when - datetime.now(timezone.utc)).total_seconds()
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+class AdaptiveLimiter:
+    """AIMD window on concurrent upstream requests.
+
+    The window grows by one request per window's worth of successes and is
+    multiplied by `backoff` on 429/503, timeouts or when the short-term
+    latency average rises above `latency_factor` times the long-term one
+    (at most once per round trip). A Retry-After from upstream pauses new
+    requests until it has passed. Requests over the window wait in FIFO order.
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        minimum: int,
+        maximum: int,
+        backoff: float,
+        latency_factor: float,
+        on_change=None
+    ):
+        self.window = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.latency_factor = latency_factor
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self._short_latency: Optional[float] = None
+        self._long_latency: Optional[float] = None
+        self._last_decrease = 0.0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+        self._on_change = on_change
+        self.stats: Dict[str, int] = {"increases": 0, "decreases": 0, "throttled": 0, "timed_out": 0}
+
+    def has_capacity(self) -> bool:
+        return not self._waiters and self.in_flight < int(self.window) and time.monotonic() >= self.blocked_until
+
+    def _wake(self) -> None:
+        self._wakeup = None
+        now = time.monotonic()
+        if now < self.blocked_until:
+            if self._waiters:
+                self._wakeup = asyncio.get_running_loop().call_later(self.blocked_until - now, self._wake)
+            return
+        while self._waiters and self.in_flight < int(self.window):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    async def acquire(self, timeout: float) -> None:
+        """Wait until the window has room, raising LimiterTimeout after `timeout` seconds"""
+        if self.has_capacity():
+            self.in_flight += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        if self._wakeup is None:
+            self._wake()
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self.stats["timed_out"] += 1
+                raise LimiterTimeout("Upstream concurrency window is full")
+            raise
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        if self._waiters and self._wakeup is None:
+            self._wake()
+
+    def _set_window(self, window: float) -> None:
+        self.window = min(max(window, float(self.minimum)), float(self.maximum))
+        if self._on_change is not None:
+            self._on_change(self.window)
+
+    def _decrease(self) -> None:
+        now = time.monotonic()
+        # One decrease per round trip: requests already in flight saw the same congestion
+        if now - self._last_decrease < (self._short_latency or 0.0):
+            return
+        self._last_decrease = now
+        self.stats["decreases"] += 1
+        self._set_window(self.window * self.backoff)
+
+    def on_overload(self, retry_after: Optional[float] = None) -> None:
+        """Upstream said 429/503 or timed out"""
+        self.stats["throttled"] += 1
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+        self._decrease()
+
+    def on_success(self, latency: float) -> None:
+        if self._short_latency is None:
+            self._short_latency = self._long_latency = latency
+        else:
+            self._short_latency += 0.3 * (latency - self._short_latency)
+            self._long_latency += 0.02 * (latency - self._long_latency)
+        if self.latency_factor and self._short_latency > self._long_latency * self.latency_factor:
+            self._decrease()
+        elif self.window < self.maximum:
+            self.stats["increases"] += 1
+            self._set_window(self.window + 1.0 / self.window)
+        if self._waiters and self._wakeup is None:
+            self._wake()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "window": round(self.window, 2),
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "blocked_for": round(max(0.0, self.blocked_until - time.monotonic()), 2),
+            **self.stats,
+        }
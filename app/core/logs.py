@@ -0,0 +1,173 @@
+import contextvars
+import json
+import logging
+import queue
+import random
+import sys
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+from .config import settings
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else was passed through `extra=`
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a configured fraction of records per level and tag them with the request id"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = {logging.getLevelName(level.upper()): rate for level, rate in rates.items()}
+        self.sampled_out = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.levelno, 1.0)
+        if rate < 1.0 and random.random() >= rate:
+            self.sampled_out += 1
+            return False
+        record.request_id = request_id_var.get()
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Hand records to the background listener without ever blocking the caller.
+
+    Records are queued as-is; formatting happens on the listener thread. When
+    the queue is full the record is dropped and counted instead.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.enqueued = 0
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+            self.enqueued += 1
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with `extra` payloads truncated to a size cap"""
+
+    def __init__(self, max_payload_chars: int):
+        super().__init__()
+        self.max_payload_chars = max_payload_chars
+
+    def _truncate(self, value: Any) -> Any:
+        text = value
+        if not isinstance(value, str):
+            try:
+                text = json.dumps(value, ensure_ascii=False, default=str)
+            except (TypeError, ValueError):
+                text = repr(value)
+        if len(text) <= self.max_payload_chars:
+            return value
+        return f"{text[:self.max_payload_chars]}...[truncated {len(text) - self.max_payload_chars} chars]"
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = self._truncate(value)
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class LoggingPipeline:
+    """Routes the `app` logger through a bounded queue to a background writer thread"""
+
+    def __init__(self):
+        self.queue: queue.Queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+        self.filter = SamplingFilter(settings.LOG_SAMPLE_RATES)
+        self.handler = DroppingQueueHandler(self.queue)
+        self.handler.addFilter(self.filter)
+        self._listener: Optional[QueueListener] = None
+
+    def start(self) -> None:
+        """Attach the queue handler to the `app` logger and start the writer thread"""
+        if self._listener is not None:
+            return
+        formatter = JsonFormatter(settings.LOG_MAX_PAYLOAD_CHARS)
+        sinks = [logging.StreamHandler(sys.stderr)]
+        if settings.LOG_JSONL_PATH:
+            sinks.append(logging.FileHandler(settings.LOG_JSONL_PATH, encoding="utf-8"))
+        for sink in sinks:
+            sink.setFormatter(formatter)
+
+        app_logger = logging.getLogger("app")
+        app_logger.setLevel(settings.LOG_LEVEL.upper())
+        app_logger.addHandler(self.handler)
+        app_logger.propagate = False
+
+        self._listener = QueueListener(self.queue, *sinks, respect_handler_level=False)
+        self._listener.start()
+
+    def stop(self) -> None:
+        """Flush queued records and stop the writer thread"""
+        if self._listener is None:
+            return
+        logging.getLogger("app").removeHandler(self.handler)
+        self._listener.stop()
+        for sink in self._listener.handlers:
+            sink.close()
+        self._listener = None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "enqueued": self.handler.enqueued,
+            "dropped": self.handler.dropped,
+            "sampled_out": self.filter.sampled_out,
+            "queued": self.queue.qsize(),
+        }
+
+
+class RequestIdMiddleware:
+    """Assign each request a correlation id (or reuse `X-Request-ID`) and echo it back"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:128]
+                break
+        if not request_id:
+            request_id = uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
+
+
+logging_pipeline = LoggingPipeline()
@@ -0,0 +1,271 @@
+import bisect
+import contextvars
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .config import settings
+
+# Recording happens on the event loop thread only, so plain dict/list
+# updates are enough here: no locks on the hot path.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+STAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[Any, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.values: Dict[Tuple[Any, ...], float] = {}
+
+    def inc(self, *labels: Any, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self.values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    def dec(self, *labels: Any, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+    def set(self, value: float, *labels: Any) -> None:
+        self.values[labels] = value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        for labels, value in self.values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [bucket counts..., sum, count]
+        self.values: Dict[Tuple[Any, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: Any) -> None:
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = [0] * (len(self.buckets) + 2)
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, series in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {series[-1]}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(series[-2])}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {series[-1]}"
+
+
+class Registry:
+    """Holds metrics plus callbacks that export existing stats dicts as gauges"""
+
+    def __init__(self):
+        self._metrics: List[Any] = []
+        self._stats: List[Tuple[str, Callable[[], Dict[str, Any]]]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_stats(self, prefix: str, source: Callable[[], Dict[str, Any]]) -> None:
+        """Export every numeric value of `source()` as `<prefix>_<key>`"""
+        self._stats.append((prefix, source))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for prefix, source in self._stats:
+            for key, value in source().items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"{prefix}_{key}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUESTS = registry.register(Counter(
+    "proxy_requests_total", "HTTP requests handled by the proxy", ("path", "method", "status")
+))
+ERRORS = registry.register(Counter(
+    "proxy_request_errors_total", "HTTP responses with status >= 400", ("path", "status")
+))
+ABANDONED = registry.register(Counter(
+    "proxy_requests_abandoned_total",
+    "Requests cancelled because the client disconnected (waiting for upstream or mid-stream)",
+    ("phase",)
+))
+IN_FLIGHT = registry.register(Gauge(
+    "proxy_requests_in_flight", "Requests currently being handled"
+))
+LATENCY = registry.register(Histogram(
+    "proxy_request_duration_seconds", "End-to-end request latency", ("path", "model")
+))
+STAGES = registry.register(Histogram(
+    "proxy_stage_duration_seconds",
+    "Time spent per request stage (validation, queue, prepare, upstream, parse, serialize, send)",
+    ("stage", "model"),
+    STAGE_BUCKETS
+))
+OVERHEAD = registry.register(Histogram(
+    "proxy_overhead_seconds",
+    "Latency added by the proxy itself (all stages except queueing, upstream wait and body send)",
+    ("model",),
+    STAGE_BUCKETS
+))
+UPSTREAM_REQUESTS = registry.register(Counter(
+    "proxy_upstream_requests_total", "Upstream attempts per endpoint and outcome", ("endpoint", "outcome")
+))
+UPSTREAM_FAILOVERS = registry.register(Counter(
+    "proxy_upstream_failovers_total", "Requests retried on another endpoint after a failure", ("endpoint",)
+))
+UPSTREAM_WINDOW = registry.register(Gauge(
+    "proxy_upstream_window", "Current adaptive concurrency window per endpoint", ("endpoint",)
+))
+UPSTREAM_BREAKER_OPEN = registry.register(Gauge(
+    "proxy_upstream_breaker_open", "1 while an endpoint's circuit breaker is open or half-open", ("endpoint",)
+))
+ADMISSION_WAIT = registry.register(Histogram(
+    "proxy_admission_wait_seconds", "Time chat completions waited for an admission slot"
+))
+
+
+class RequestTiming:
+    """Per-request stopwatch; each `mark` closes the stage that started at the previous mark"""
+    __slots__ = ("last", "stages", "model")
+
+    def __init__(self):
+        self.last = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.model: Optional[str] = None
+
+    def mark(self, stage: str) -> None:
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self.last
+        self.last = now
+
+    def server_timing(self, start: float) -> bytes:
+        """`Server-Timing` value: the stages closed so far and the total, in milliseconds"""
+        entries = [f"{stage};dur={seconds * 1000:.3f}" for stage, seconds in self.stages.items()] if self.model is not None else []
+        entries.append(f"total;dur={(self.last - start) * 1000:.3f}")
+        return ", ".join(entries).encode("latin-1")
+
+
+_timing: contextvars.ContextVar[Optional[RequestTiming]] = contextvars.ContextVar("request_timing", default=None)
+
+
+def mark(stage: str) -> None:
+    """Close the current stage of the request being handled, if it is being timed"""
+    timing = _timing.get()
+    if timing is not None:
+        timing.mark(stage)
+
+
+def set_model(model: str) -> None:
+    """Attribute the current request's latency to a model"""
+    timing = _timing.get()
+    if timing is not None:
+        timing.model = model
+
+
+def _route_label(scope) -> str:
+    """Label by route template rather than raw path to bound cardinality"""
+    if scope.get("route") is None:
+        return "unmatched"
+    path = scope["path"]
+    for name, value in scope.get("path_params", {}).items():
+        path = path.replace(f"/{value}", f"/{{{name}}}", 1)
+    return path
+
+
+class MetricsMiddleware:
+    """Counts requests and records end-to-end and per-stage latency.
+
+    The stages closed by the time the response starts are also reported to
+    the client in a `Server-Timing` header (chat completions; other routes
+    only get the total).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        timing = RequestTiming()
+        token = _timing.set(timing)
+        status = 500
+        IN_FLIGHT.inc()
+
+        async def send_with_metrics(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                timing.mark("serialize")
+                if settings.SERVER_TIMING_ENABLED:
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", timing.server_timing(start))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            _timing.reset(token)
+            IN_FLIGHT.dec()
+            timing.mark("send")
+            path = _route_label(scope)
+            model = timing.model or ""
+            REQUESTS.inc(path, scope["method"], status)
+            if status >= 400:
+                ERRORS.inc(path, status)
+            LATENCY.observe(time.perf_counter() - start, path, model)
+            if timing.model is not None:
+                overhead = 0.0
+                for stage, seconds in timing.stages.items():
+                    STAGES.observe(seconds, stage, model)
+                    if stage not in ("queue", "upstream", "send"):
+                        overhead += seconds
+                OVERHEAD.observe(overhead, model)
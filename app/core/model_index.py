@@ -0,0 +1,154 @@
+import logging
+import time
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Upstream answers that mean "this model is overloaded or failing", worth a fallback
+FALLBACK_STATUSES = (429, 500, 502, 503, 504)
+
+
+class ModelInfo(NamedTuple):
+    """What the catalogue says a model can do; None means it does not say"""
+    name: str
+    type: Optional[str]
+    tools: Optional[bool]
+    vision: Optional[bool]
+    reasoning: Optional[bool]
+    provider: Optional[str]
+
+
+class ModelRejected(Exception):
+    """A request that cannot succeed with the model it names"""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _aliases(model: Dict[str, Any]) -> List[str]:
+    aliases = model.get("aliases")
+    if isinstance(aliases, str):
+        return [aliases] if aliases else []
+    if isinstance(aliases, list):
+        return [alias for alias in aliases if isinstance(alias, str) and alias]
+    return []
+
+
+class ModelIndex:
+    """Model names, aliases and capabilities from one catalogue snapshot.
+
+    Built once per catalogue refresh, so each request only pays a couple of
+    dict lookups. MODEL_ALIASES from the settings take precedence over
+    aliases published by the upstream.
+    """
+
+    def __init__(self, models: List[Dict[str, Any]]):
+        self.models: Dict[str, ModelInfo] = {}
+        self.aliases: Dict[str, str] = {}
+        for model in models:
+            name = model.get("name") or model.get("id")
+            if not isinstance(name, str) or name == "unknown":
+                continue
+            self.models[name] = ModelInfo(
+                name=name,
+                type=model.get("type"),
+                tools=model.get("tools"),
+                vision=model.get("vision"),
+                reasoning=model.get("reasoning"),
+                provider=model.get("provider"),
+            )
+            for alias in _aliases(model):
+                self.aliases.setdefault(alias, name)
+        self.aliases.update(settings.MODEL_ALIASES)
+        # Case-insensitive fallback for clients that capitalise model names
+        self._folded = {name.lower(): name for name in self.models}
+        self._folded.update({alias.lower(): name for alias, name in self.aliases.items()})
+
+    def __len__(self) -> int:
+        return len(self.models)
+
+    def resolve(self, model: str) -> Optional[str]:
+        """The catalogue name for a model name or alias, None when unknown"""
+        if model in self.models:
+            return model
+        return self.aliases.get(model) or self._folded.get(model.lower())
+
+
+def model_label(index: Optional[ModelIndex], model: str) -> str:
+    """Metrics label for a model: catalogue names only, so made-up names cannot add series"""
+    return model if index is not None and model in index.models else "other"
+
+
+class ModelRouter:
+    """Validates requested models and picks fallbacks for failing ones.
+
+    Each model has a small circuit breaker: after MODEL_FALLBACK_FAILURES
+    consecutive overload answers (429/5xx, after the usual retries) it is
+    skipped in favour of its MODEL_FALLBACKS for MODEL_FALLBACK_COOLDOWN
+    seconds, then tried again; one more failure reopens it.
+    """
+
+    def __init__(self):
+        self._failures: Dict[str, int] = {}
+        self._open_until: Dict[str, float] = {}
+        self.stats: Dict[str, int] = {
+            "aliased": 0,
+            "rejected_unknown": 0,
+            "rejected_capability": 0,
+            "fallbacks": 0,
+            "breaker_opens": 0,
+        }
+
+    def check(self, index: Optional[ModelIndex], model: str, uses_tools: bool) -> str:
+        """Resolve the requested model, raising ModelRejected for requests bound to fail.
+
+        Without a catalogue (not loaded yet, or the upstream lists nothing)
+        only the configured aliases apply and every model is let through.
+        """
+        if index is None or not len(index):
+            return settings.MODEL_ALIASES.get(model, model)
+        name = index.resolve(model)
+        if name is None:
+            if not settings.MODEL_VALIDATION_ENABLED:
+                return model
+            self.stats["rejected_unknown"] += 1
+            raise ModelRejected(
+                f"The model '{model}' does not exist. See /v1/models for available models", 404
+            )
+        if name != model:
+            self.stats["aliased"] += 1
+        info = index.models[name]
+        if settings.MODEL_VALIDATION_ENABLED and uses_tools and info.tools is False:
+            self.stats["rejected_capability"] += 1
+            raise ModelRejected(f"The model '{name}' does not support function or tool calling", 400)
+        return name
+
+    def healthy(self, model: str) -> bool:
+        return self._open_until.get(model, 0.0) <= time.monotonic()
+
+    def candidates(self, model: str) -> List[str]:
+        """Models to try in order: healthy ones first, the primary before its fallbacks"""
+        chain = [model] + [fallback for fallback in settings.MODEL_FALLBACKS.get(model, []) if fallback != model]
+        healthy = [candidate for candidate in chain if self.healthy(candidate)]
+        return healthy + [candidate for candidate in chain if candidate not in healthy]
+
+    def record_success(self, model: str) -> None:
+        self._failures.pop(model, None)
+        self._open_until.pop(model, None)
+
+    def record_failure(self, model: str) -> None:
+        failures = self._failures[model] = self._failures.get(model, 0) + 1
+        if failures >= settings.MODEL_FALLBACK_FAILURES and self.healthy(model):
+            self._open_until[model] = time.monotonic() + settings.MODEL_FALLBACK_COOLDOWN
+            self.stats["breaker_opens"] += 1
+            logger.warning("Model marked unhealthy, using fallbacks", extra={"model": model})
+
+    def snapshot(self) -> Dict[str, Any]:
+        unhealthy = [model for model in self._open_until if not self.healthy(model)]
+        return {**self.stats, "unhealthy": len(unhealthy), "unhealthy_models": unhealthy}
+
+
+model_router = ModelRouter()
@@ -0,0 +1,157 @@
+import asyncio
+import os
+import signal
+import sys
+import sysconfig
+import threading
+import time
+from collections import Counter
+from types import CodeType
+from typing import Dict, Optional
+
+# Nothing here runs unless a profile has been requested: the timer and the
+# sampler thread only exist for the duration of one profile, so the cost when
+# idle is zero.
+
+
+# Resolved once: labels are built inside the SIGPROF handler, which must stay cheap
+_SITE_PACKAGES = "site-packages" + os.sep
+_PATH_PREFIXES = (sysconfig.get_path("stdlib") + os.sep, os.getcwd() + os.sep)
+
+
+class ProfilerBusy(Exception):
+    """A profile is already being taken"""
+
+
+def _short_path(filename: str) -> str:
+    """Path of a source file relative to site-packages, the standard library or the working directory"""
+    _, marker, rest = filename.rpartition(_SITE_PACKAGES)
+    if marker:
+        return rest
+    for prefix in _PATH_PREFIXES:
+        if filename.startswith(prefix):
+            return filename[len(prefix):]
+    return filename
+
+
+class SamplingProfiler:
+    """Statistical profiler for live traffic.
+
+    The event loop is profiled by CPU time: an ITIMER_PROF timer raises
+    SIGPROF every `interval` seconds of CPU and the handler, which Python
+    runs on the main (event loop) thread, records the interrupted stack.
+    A thread that polls sys._current_frames() would only see the loop at
+    the points where it releases the GIL, mostly inside the selector.
+    That thread sampler is still used for `all_threads` (wall-clock, one
+    sample per thread) and where the timer is unavailable.
+
+    Stacks are returned in the collapsed format read by flamegraph.pl,
+    speedscope and similar tools: one line per distinct stack, root
+    first, frames separated by ";", then the number of samples.
+    """
+
+    def __init__(self):
+        self._active = False
+        self._labels: Dict[CodeType, str] = {}
+        self._stacks: Counter = Counter()
+        self.stats: Dict[str, int] = {"profiles": 0, "samples": 0}
+
+    def _label(self, code: CodeType) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{code.co_qualname} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def _collapse(self, frame) -> str:
+        labels = []
+        while frame is not None:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        labels.reverse()
+        return ";".join(labels)
+
+    def _on_signal(self, signum, frame) -> None:
+        if frame is not None:
+            self._stacks[self._collapse(frame)] += 1
+
+    def _sample(self, stacks: Counter, thread_id: Optional[int], interval: float, stop: threading.Event) -> None:
+        own_id = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        while not stop.wait(interval):
+            frames = sys._current_frames()
+            if thread_id is not None:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    stacks[self._collapse(frame)] += 1
+                continue
+            for ident, frame in frames.items():
+                if ident == own_id:
+                    continue
+                if ident not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                stacks[f"{names.get(ident, ident)};{self._collapse(frame)}"] += 1
+
+    async def profile(self, seconds: float, interval: float, all_threads: bool = False) -> "Profile":
+        """Sample for `seconds` while the event loop keeps serving traffic.
+
+        Must be awaited on the event loop thread, which is the one sampled
+        unless `all_threads` is set. Raises ProfilerBusy while another
+        profile is running.
+        """
+        if self._active:
+            raise ProfilerBusy()
+        self._active = True
+        self._stacks = stacks = Counter()
+        use_timer = (
+            not all_threads
+            and hasattr(signal, "setitimer")
+            and threading.current_thread() is threading.main_thread()
+        )
+        start = time.perf_counter()
+        if use_timer:
+            previous = signal.signal(signal.SIGPROF, self._on_signal)
+            signal.setitimer(signal.ITIMER_PROF, interval, interval)
+        else:
+            stop = threading.Event()
+            sampler = threading.Thread(
+                target=self._sample,
+                args=(stacks, None if all_threads else threading.get_ident(), interval, stop),
+                name="profiler",
+                daemon=True,
+            )
+            sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            if use_timer:
+                signal.setitimer(signal.ITIMER_PROF, 0)
+                signal.signal(signal.SIGPROF, previous if previous is not None else signal.SIG_DFL)
+            else:
+                stop.set()
+                # At most one sample away; a plain join also survives a second cancellation
+                sampler.join()
+            self._active = False
+            self._stacks = Counter()
+            # Code objects of reloaded or unloaded modules must not be kept alive
+            self._labels.clear()
+        profile = Profile(stacks, time.perf_counter() - start, "cpu" if use_timer else "wall")
+        self.stats["profiles"] += 1
+        self.stats["samples"] += profile.samples
+        return profile
+
+
+class Profile:
+    """Aggregated samples of one profiling run"""
+
+    def __init__(self, stacks: Counter, duration: float, mode: str):
+        self.stacks = stacks
+        self.duration = duration
+        self.mode = mode
+        self.samples = sum(stacks.values())
+
+    def collapsed(self) -> str:
+        """Flamegraph-compatible collapsed stacks, most sampled first"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,112 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from .cache import SQLiteStore
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def canonical_key(payload: Dict[str, Any]) -> str:
+    """Hash a request payload independently of key order and whitespace"""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class ResponseCache:
+    """Byte-budgeted LRU cache of serialized completions with an optional SQLite tier"""
+
+    def __init__(self, max_bytes: int, ttl: float, disk_path: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._bytes = 0
+        self._disk = SQLiteStore(disk_path, "response_cache") if disk_path else None
+        self.stats: Dict[str, int] = {
+            "hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+        }
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: str) -> None:
+        _, value = self._entries.pop(key)
+        self._bytes -= len(value)
+
+    def _put_memory(self, key: str, value: bytes, expires_at: float) -> None:
+        if len(value) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (expires_at, value)
+        self._bytes += len(value)
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.stats["evictions"] += 1
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """Return a cached body, checking memory first and then the disk tier"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.time():
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[1]
+            self._remove(key)
+
+        if self._disk is not None:
+            entry = await asyncio.to_thread(self._disk.get_entry, key)
+            if entry is not None:
+                value, expires_at = entry
+                # Promoted with the lifetime it has left, not a fresh TTL
+                self._put_memory(key, value, expires_at)
+                self.stats["disk_hits"] += 1
+                return value
+
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: bytes) -> None:
+        """Store a body in memory and, if configured, on disk"""
+        self._put_memory(key, value, time.time() + self.ttl)
+        self.stats["stores"] += 1
+        if self._disk is not None:
+            try:
+                await asyncio.to_thread(self._disk.set, key, value, self.ttl)
+            except Exception as e:
+                logger.warning("Failed to write response cache entry to disk: %s", e)
+
+    def close(self) -> None:
+        if self._disk is not None:
+            self._disk.close()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters and sizes for the stats endpoint"""
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "disk": self._disk.path if self._disk else None,
+        }
+
+
+response_cache = ResponseCache(
+    max_bytes=settings.RESPONSE_CACHE_MAX_BYTES,
+    ttl=settings.RESPONSE_CACHE_TTL,
+    disk_path=settings.RESPONSE_CACHE_DISK_PATH or settings.SHARED_CACHE_PATH
+)
@@ -0,0 +1,232 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import fastjson
+from .cache import SQLiteStore
+from .admission import tenant_key
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Longest accepted "X-Proxy-Session" value
+MAX_SESSION_ID_LENGTH = 128
+
+
+def session_key(session_id: Optional[str], headers, client_host: Optional[str]) -> Optional[str]:
+    """Store key for a client's session id, or None when sessions are not used.
+
+    Ids are scoped to the caller's API key (or IP), so one client cannot
+    read or extend another client's session by guessing its id.
+    """
+    if not session_id or not settings.SESSIONS_ENABLED:
+        return None
+    if len(session_id) > MAX_SESSION_ID_LENGTH:
+        raise ValueError(f"X-Proxy-Session must be at most {MAX_SESSION_ID_LENGTH} characters")
+    return f"{tenant_key(None, headers, client_host)}:{session_id}"
+
+
+class _Session:
+    __slots__ = ("messages", "bytes", "expires_at")
+
+    def __init__(self, messages: List[Dict[str, Any]], size: int, expires_at: float):
+        self.messages = messages
+        self.bytes = size
+        self.expires_at = expires_at
+
+
+def _encoded_size(messages: List[Dict[str, Any]]) -> int:
+    return sum(len(fastjson.dumps(message)) for message in messages)
+
+
+class SessionStore:
+    """Conversation histories kept server-side, keyed by session id.
+
+    Histories are stored as prepared upstream message dicts, so a turn only
+    prepares and measures its new messages. Memory is bounded by `max_bytes`
+    (measured as encoded JSON) with LRU eviction and an idle `ttl`; evicted
+    sessions are spilled to an optional SQLite tier and loaded back on
+    their next turn.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float, disk_path: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._bytes = 0
+        self._disk = SQLiteStore(disk_path, "sessions") if disk_path else None
+        self.stats: Dict[str, int] = {
+            "hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "appends": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "spilled": 0,
+        }
+
+    def _remove(self, key: str) -> _Session:
+        session = self._sessions.pop(key)
+        self._bytes -= session.bytes
+        return session
+
+    def _put(self, key: str, session: _Session) -> List[Tuple[str, _Session]]:
+        """Insert a session as most recently used and return the ones evicted to make room"""
+        self._sessions[key] = session
+        self._bytes += session.bytes
+        evicted = []
+        while self._bytes > self.max_bytes and self._sessions:
+            oldest = next(iter(self._sessions))
+            evicted.append((oldest, self._remove(oldest)))
+            self.stats["evictions"] += 1
+        return evicted
+
+    async def _spill(self, evicted: List[Tuple[str, _Session]]) -> None:
+        if self._disk is None:
+            return
+        now = time.time()
+        for key, session in evicted:
+            if session.expires_at <= now:
+                continue
+            try:
+                await asyncio.to_thread(
+                    self._disk.set, key, fastjson.dumps(session.messages), session.expires_at - now
+                )
+                self.stats["spilled"] += 1
+            except Exception as e:
+                logger.warning("Failed to spill session to disk: %s", e)
+
+    async def get(self, key: str) -> List[Dict[str, Any]]:
+        """Return a session's messages (empty for a new or expired session).
+
+        The list is the stored one: callers copy it rather than modify it.
+        """
+        session = self._sessions.get(key)
+        if session is not None:
+            if session.expires_at > time.time():
+                self._sessions.move_to_end(key)
+                session.expires_at = time.time() + self.ttl
+                self.stats["hits"] += 1
+                return session.messages
+            self._remove(key)
+            self.stats["expirations"] += 1
+
+        session = await self._load(key)
+        if session is not None:
+            await self._spill(self._put(key, session))
+            self.stats["disk_hits"] += 1
+            return session.messages
+
+        self.stats["misses"] += 1
+        return []
+
+    async def _load(self, key: str) -> Optional[_Session]:
+        """Take a spilled session off the disk tier; memory holds the live copy from then on"""
+        if self._disk is None:
+            return None
+        value = await asyncio.to_thread(self._disk.get, key)
+        if value is None:
+            return None
+        await asyncio.to_thread(self._disk.delete, key)
+        return _Session(fastjson.loads(value), len(value), time.time() + self.ttl)
+
+    async def append(self, key: str, messages: List[Dict[str, Any]]) -> None:
+        """Add the messages of a finished turn to a session"""
+        self.stats["appends"] += 1
+        session = None
+        if key not in self._sessions:
+            # The session may have been spilled to disk since this turn read it
+            session = await self._load(key)
+        if key in self._sessions:
+            session = self._remove(key)
+        elif session is None:
+            session = _Session([], 0, 0.0)
+        # Only the new messages are measured, so a turn costs O(new messages)
+        session.messages.extend(messages)
+        session.bytes += _encoded_size(messages)
+        session.expires_at = time.time() + self.ttl
+        await self._spill(self._put(key, session))
+
+    async def delete(self, key: str) -> bool:
+        """Forget a session; True if it existed"""
+        found = key in self._sessions
+        if found:
+            self._remove(key)
+        if self._disk is not None:
+            found = await asyncio.to_thread(self._disk.delete, key) or found
+        return found
+
+    def purge_expired(self) -> None:
+        now = time.time()
+        for key in [key for key, session in self._sessions.items() if session.expires_at <= now]:
+            self._remove(key)
+            self.stats["expirations"] += 1
+
+    def close(self) -> None:
+        if self._disk is not None:
+            self._disk.close()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters and sizes for the stats endpoint"""
+        self.purge_expired()
+        return {
+            **self.stats,
+            "sessions": len(self._sessions),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "disk": self._disk.path if self._disk else None,
+        }
+
+
+class ReplyRecorder:
+    """Rebuild the assistant message from streamed choice-0 deltas"""
+
+    def __init__(self):
+        self._content: List[str] = []
+        self._function_call: Optional[Dict[str, str]] = None
+        self._tool_calls: Dict[int, Dict[str, Any]] = {}
+        self.finished = False
+
+    def feed(self, delta: Dict[str, Any], finish_reason: Optional[str]) -> None:
+        if delta.get("content"):
+            self._content.append(delta["content"])
+        if delta.get("function_call"):
+            call = self._function_call = self._function_call or {"name": "", "arguments": ""}
+            call["name"] += delta["function_call"].get("name") or ""
+            call["arguments"] += delta["function_call"].get("arguments") or ""
+        for fragment in delta.get("tool_calls") or ():
+            call = self._tool_calls.setdefault(fragment.get("index", 0), {
+                "id": "", "type": "function", "function": {"name": "", "arguments": ""}
+            })
+            call["id"] = fragment.get("id") or call["id"]
+            function = fragment.get("function") or {}
+            call["function"]["name"] += function.get("name") or ""
+            call["function"]["arguments"] += function.get("arguments") or ""
+        if finish_reason is not None:
+            self.finished = True
+
+    def message(self) -> Dict[str, Any]:
+        return assistant_message({
+            "content": "".join(self._content) or None,
+            "function_call": self._function_call,
+            "tool_calls": [self._tool_calls[index] for index in sorted(self._tool_calls)] or None,
+        })
+
+
+def assistant_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Turn a response message into the upstream form stored in a session"""
+    stored = {"role": "assistant", "content": message.get("content") or ""}
+    if message.get("function_call"):
+        stored["function_call"] = message["function_call"]
+    if message.get("tool_calls"):
+        stored["tool_calls"] = message["tool_calls"]
+    return stored
+
+
+session_store = SessionStore(
+    max_bytes=settings.SESSION_MAX_BYTES,
+    ttl=settings.SESSION_TTL,
+    disk_path=settings.SESSION_DISK_PATH
+)
@@ -0,0 +1,70 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+def _process_age() -> float:
+    """Seconds since this process was started (Linux), or 0 when unknown"""
+    try:
+        with open("/proc/self/stat") as stat:
+            # Fields after the parenthesised command name; starttime is field 22
+            fields = stat.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as uptime:
+            seconds_since_boot = float(uptime.read().split()[0])
+        return max(0.0, seconds_since_boot - int(fields[19]) / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError, AttributeError):
+        return 0.0
+
+
+class StartupState:
+    """Warm-up progress and startup timings, for /v1/ready and the metrics.
+
+    Times are measured from process start where the OS reports it (from
+    the import of this module otherwise), so "boot" covers interpreter
+    start-up and imports up to the app lifespan.
+    """
+
+    def __init__(self):
+        self._origin = time.perf_counter() - _process_age()
+        self.ready = False
+        self.timings: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+
+    def mark(self, stage: str) -> None:
+        """Record the time since process start at which `stage` was reached"""
+        self.timings[stage] = round(time.perf_counter() - self._origin, 4)
+
+    async def run_step(self, name: str, step: Callable[[], Awaitable[Any]], timeout: float) -> None:
+        """Run one warm-up step and record its duration; failures are logged, never raised"""
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(step(), timeout)
+        except asyncio.TimeoutError:
+            self.errors[name] = f"timed out after {timeout:g}s"
+        except Exception as e:
+            self.errors[name] = str(e) or type(e).__name__
+        if name in self.errors:
+            logger.warning("Warm-up step failed", extra={"step": name, "error": self.errors[name]})
+        self.timings[name] = round(time.perf_counter() - start, 4)
+
+    def set_ready(self) -> None:
+        self.mark("ready")
+        self.ready = True
+        logger.info("Warm-up complete", extra={"timings": self.timings, "errors": self.errors})
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "status": "ready" if self.ready else "warming_up",
+            "timings": self.timings,
+            "errors": self.errors,
+        }
+
+    def metrics(self) -> Dict[str, float]:
+        return {"ready": int(self.ready), **{f"{stage}_seconds": value for stage, value in self.timings.items()}}
+
+
+startup_state = StartupState()
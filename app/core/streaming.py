@@ -0,0 +1,161 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Optional, Dict, Any, List
+
+import httpx
+
+from . import fastjson
+
+logger = logging.getLogger(__name__)
+
+
+class StreamBufferOverflow(Exception):
+    """Raised when an upstream SSE line grows past the configured buffer limit"""
+
+
+def format_sse(payload: Dict[str, Any]) -> str:
+    """Encode a payload as a single server-sent event"""
+    return f"data: {fastjson.dumps_str(payload)}\n\n"
+
+
+SSE_DONE = "data: [DONE]\n\n"
+
+
+def chunk_payload(
+    completion_id: str,
+    created: int,
+    model: str,
+    delta: Dict[str, Any],
+    finish_reason: Optional[str] = None,
+    index: int = 0
+) -> Dict[str, Any]:
+    """Build an OpenAI `chat.completion.chunk` object"""
+    return {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": model,
+        "choices": [{
+            "index": index,
+            "delta": delta,
+            "finish_reason": finish_reason
+        }]
+    }
+
+
+def _content_from_event(data: str) -> Optional[str]:
+    """Pull the text delta out of one upstream SSE `data:` payload"""
+    try:
+        event = fastjson.loads(data)
+    except fastjson.JSONDecodeError:
+        # Some backends stream plain text inside SSE frames
+        return data
+    if isinstance(event, dict):
+        choices = event.get("choices") or [{}]
+        delta = choices[0].get("delta") or choices[0].get("message") or {}
+        return delta.get("content")
+    if isinstance(event, str):
+        return event
+    return None
+
+
+async def _iter_sse_lines(response: httpx.Response, max_buffer: int) -> AsyncIterator[str]:
+    """Split the upstream body into lines while holding at most `max_buffer` chars"""
+    buffer = ""
+    async for text in response.aiter_text():
+        lines = (buffer + text).split("\n")
+        buffer = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+        if len(buffer) > max_buffer:
+            raise StreamBufferOverflow(f"SSE line exceeds {max_buffer} characters")
+    if buffer:
+        yield buffer.rstrip("\r")
+
+
+async def iter_upstream_content(response: httpx.Response, max_buffer: int) -> AsyncIterator[str]:
+    """Yield content deltas from an upstream streaming response as they arrive.
+
+    Pollinations answers `stream: true` with OpenAI-style SSE, but plain
+    chunked text is accepted too so the relay works with simpler backends.
+    """
+    content_type = response.headers.get("content-type", "")
+    if "text/event-stream" not in content_type:
+        async for text in response.aiter_text():
+            if text:
+                yield text
+        return
+
+    async for line in _iter_sse_lines(response, max_buffer):
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].lstrip()
+        if data == "[DONE]":
+            return
+        content = _content_from_event(data)
+        if content:
+            yield content
+
+
+class ResponseStream:
+    """Async iterator that owns the upstream responses it reads from.
+
+    Closing an async generator that was never iterated does not run its
+    `finally`, so the responses are closed here directly: `aclose()`
+    releases them (and their connections and endpoint slots) whether or
+    not iteration ever started.
+    """
+
+    def __init__(self, iterator: AsyncIterator[Any], responses: List[httpx.Response]):
+        self._iterator = iterator
+        self._responses = responses
+
+    def __aiter__(self) -> "ResponseStream":
+        return self
+
+    def __anext__(self):
+        return self._iterator.__anext__()
+
+    async def aclose(self) -> None:
+        try:
+            await self._iterator.aclose()
+        finally:
+            for response in self._responses:
+                await response.aclose()
+
+
+async def merge_streams(sources: List[AsyncIterator[Any]]) -> AsyncIterator[Any]:
+    """Interleave several async iterators, yielding each item as soon as it arrives.
+
+    An error in any source ends the merged stream with that error; every
+    source is closed when the merged stream finishes or is closed.
+    """
+    done = object()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=16 * len(sources))
+
+    async def pump(source: AsyncIterator[Any]) -> None:
+        try:
+            async for item in source:
+                await queue.put((None, item))
+        except Exception as e:
+            await queue.put((e, None))
+        else:
+            await queue.put((done, None))
+
+    tasks = [asyncio.ensure_future(pump(source)) for source in sources]
+    remaining = len(tasks)
+    try:
+        while remaining:
+            marker, item = await queue.get()
+            if marker is done:
+                remaining -= 1
+            elif marker is not None:
+                raise marker
+            else:
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for source in sources:
+            await source.aclose()
@@ -0,0 +1,385 @@
+import re
+import uuid
+from typing import Any, Dict, List, Optional
+
+from . import fastjson
+
+_STRING_SPECIAL = re.compile(r'["\\]')
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+_WHITESPACE = " \t\r\n"
+_SCALAR_END = " \t\r\n,}]"
+_ARGUMENT_KEYS = ("arguments", "parameters")
+
+UNDECIDED = "undecided"
+TEXT = "text"
+FUNCTION_CALL = "function_call"
+TOOL_CALLS = "tool_calls"
+
+
+class _Call:
+    """One function/tool call being assembled from the stream"""
+    __slots__ = ("index", "id", "name", "args", "started", "header_sent")
+
+    def __init__(self, index: int):
+        self.index = index
+        self.id: Optional[str] = None
+        self.name: Optional[str] = None
+        self.args: List[str] = []
+        self.started = False
+        self.header_sent = False
+
+
+class ToolCallStreamParser:
+    """Resumable JSON scanner that turns streamed model output into OpenAI deltas.
+
+    Chunks are fed as they arrive and every character is looked at once, so
+    the cost stays linear in the output length. The first significant token
+    decides the output kind: anything that does not start like one of the
+    shapes understood by `extract_function_or_tool_call` is relayed as plain
+    `content`, otherwise `function_call` / `tool_calls` deltas are emitted as
+    soon as a call name is known, followed by `arguments` fragments.
+    """
+
+    def __init__(self):
+        self.mode = UNDECIDED
+        self._direct = False  # bare {"name": ..., "parameters": ...} object
+        self._done = False
+        self._held: List[str] = []
+        self._events: List[Dict[str, Any]] = []
+        self._calls: Dict[int, _Call] = {}
+
+        # Scanner state: stack frames are [container, key, array index]
+        self._stack: List[list] = []
+        self._expect_key = False
+        self._in_string = False
+        self._escape = False
+        self._unicode: Optional[str] = None
+        self._high_surrogate: Optional[int] = None
+        self._target: Optional[str] = None
+        self._target_call: Optional[_Call] = None
+        self._buf: List[str] = []
+
+        # Argument capture: raw JSON slices or a string value, decoded for
+        # "arguments" and re-encoded for "parameters" like the buffered path
+        self._cap_kind: Optional[str] = None
+        self._cap_encode = False
+        self._cap_call: Optional[_Call] = None
+        self._cap_depth = 0
+        self._cap_from = 0
+
+    @property
+    def finish_reason(self) -> str:
+        if self.mode == TOOL_CALLS:
+            return "tool_calls"
+        if self.mode == FUNCTION_CALL:
+            return "function_call"
+        return "stop"
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """Consume the next chunk of model output and return the deltas it produced"""
+        if not text:
+            return []
+        if self.mode == TEXT:
+            return [{"content": text}]
+        if self._done:
+            return []
+        if self.mode == UNDECIDED:
+            self._held.append(text)
+        self._scan(text)
+        return self._drain()
+
+    def close(self) -> List[Dict[str, Any]]:
+        """Flush whatever is still pending once the upstream stream has ended"""
+        if self.mode == UNDECIDED:
+            if self._held:
+                self._to_text()
+        elif self.mode != TEXT:
+            # Truncated output: still hand out every call that was started
+            for index in sorted(self._calls):
+                self._send_header(self._calls[index])
+        return self._drain()
+
+    # Event helpers
+
+    def _drain(self) -> List[Dict[str, Any]]:
+        self._flush_args()
+        events, self._events = self._events, []
+        return events
+
+    def _to_text(self) -> None:
+        self.mode = TEXT
+        self._events.append({"content": "".join(self._held)})
+        self._held = []
+
+    def _commit(self, mode: str) -> None:
+        self.mode = mode
+        self._held = []
+        for index in sorted(self._calls):
+            if self._calls[index].name is not None:
+                self._send_header(self._calls[index])
+
+    def _call(self, index: int) -> _Call:
+        call = self._calls.get(index)
+        if call is None:
+            call = self._calls[index] = _Call(index)
+        return call
+
+    def _send_header(self, call: _Call) -> None:
+        if call.header_sent or self.mode not in (FUNCTION_CALL, TOOL_CALLS):
+            return
+        self._flush_args()
+        call.header_sent = True
+        name = call.name or ""
+        if self.mode == FUNCTION_CALL:
+            self._events.append({"function_call": {"name": name, "arguments": ""}})
+        else:
+            self._events.append({"tool_calls": [{
+                "index": call.index,
+                "id": call.id or str(uuid.uuid4()),
+                "type": "function",
+                "function": {"name": name, "arguments": ""}
+            }]})
+
+    def _flush_args(self) -> None:
+        for index in sorted(self._calls):
+            call = self._calls[index]
+            if not call.header_sent or not call.args:
+                continue
+            fragment = "".join(call.args)
+            call.args = []
+            if not fragment:
+                continue
+            if self.mode == FUNCTION_CALL:
+                self._events.append({"function_call": {"arguments": fragment}})
+            else:
+                self._events.append({"tool_calls": [{
+                    "index": call.index,
+                    "function": {"arguments": fragment}
+                }]})
+
+    def _maybe_commit_direct(self) -> None:
+        call = self._calls.get(0)
+        if self._direct and self.mode == UNDECIDED and call and call.name is not None and call.started:
+            self._commit(FUNCTION_CALL)
+
+    # Scanner
+
+    def _scan(self, chunk: str) -> None:
+        i = 0
+        n = len(chunk)
+        self._cap_from = 0
+        while i < n:
+            if self.mode == TEXT or self._done:
+                return
+            if self._in_string:
+                i = self._scan_string(chunk, i)
+                continue
+            ch = chunk[i]
+            if self._cap_kind == "scalar" and ch in _SCALAR_END:
+                self._end_capture(chunk, i)
+            if ch in _WHITESPACE:
+                i += 1
+                continue
+            if not self._stack:
+                if ch != "{":
+                    self._to_text()
+                    return
+                self._stack.append(["{", None, 0])
+                self._expect_key = True
+            elif ch == '"':
+                if self._stack[-1][0] == "{" and self._expect_key:
+                    self._start_string("key", None)
+                else:
+                    self._start_value(chunk, i, ch)
+            elif ch == "{" or ch == "[":
+                self._start_value(chunk, i, ch)
+                self._stack.append([ch, None, 0])
+                self._expect_key = ch == "{"
+            elif ch == "}" or ch == "]":
+                self._close_container(chunk, i)
+            elif ch == ",":
+                top = self._stack[-1]
+                if top[0] == "{":
+                    self._expect_key = True
+                else:
+                    top[2] += 1
+            elif ch != ":":
+                self._start_value(chunk, i, ch)
+            i += 1
+        if self._cap_kind in ("raw", "scalar") and self.mode != TEXT:
+            self._cap_call.args.append(chunk[self._cap_from:n])
+
+    def _scan_string(self, chunk: str, i: int) -> int:
+        n = len(chunk)
+        if self._unicode is not None:
+            while i < n and len(self._unicode) < 4:
+                self._unicode += chunk[i]
+                i += 1
+            if len(self._unicode) == 4:
+                try:
+                    self._put_code_unit(int(self._unicode, 16))
+                except ValueError:
+                    self._put("\ufffd")
+                self._unicode = None
+            return i
+        if self._escape:
+            self._escape = False
+            ch = chunk[i]
+            if ch == "u":
+                self._unicode = ""
+            else:
+                self._put(_ESCAPES.get(ch, ch))
+            return i + 1
+        match = _STRING_SPECIAL.search(chunk, i)
+        end = match.start() if match else n
+        if end > i:
+            self._put(chunk[i:end])
+        if match is None:
+            return n
+        if chunk[end] == "\\":
+            self._escape = True
+        else:
+            self._in_string = False
+            self._end_string()
+        return end + 1
+
+    def _put(self, text: str) -> None:
+        if self._high_surrogate is not None:
+            self._high_surrogate = None
+            text = "\ufffd" + text
+        if self._target is None:
+            return
+        if self._target == "args":
+            if self._cap_encode:
+                # JSON escaping is per character, so encoding piecewise matches encoding the whole
+                text = fastjson.dumps_str(text)[1:-1]
+            self._target_call.args.append(text)
+        else:
+            self._buf.append(text)
+
+    def _put_code_unit(self, unit: int) -> None:
+        if 0xD800 <= unit < 0xDC00:
+            if self._high_surrogate is not None:
+                self._put("\ufffd")
+            self._high_surrogate = unit
+            return
+        if 0xDC00 <= unit < 0xE000 and self._high_surrogate is not None:
+            high, self._high_surrogate = self._high_surrogate, None
+            self._put(chr(0x10000 + ((high - 0xD800) << 10) + (unit - 0xDC00)))
+            return
+        self._put(chr(unit))
+
+    def _start_string(self, target: Optional[str], call: Optional[_Call]) -> None:
+        self._in_string = True
+        self._target = target
+        self._target_call = call
+        self._buf = []
+
+    def _end_string(self) -> None:
+        if self._high_surrogate is not None:
+            self._put("\ufffd")
+        target, call = self._target, self._target_call
+        self._target = self._target_call = None
+        if target == "key":
+            self._stack[-1][1] = "".join(self._buf)
+            self._expect_key = False
+            if len(self._stack) == 1:
+                self._on_root_key(self._stack[-1][1])
+        elif target == "name":
+            call.name = "".join(self._buf)
+            if self.mode == UNDECIDED:
+                self._maybe_commit_direct()
+            else:
+                self._send_header(call)
+        elif target == "id":
+            call.id = "".join(self._buf)
+        elif target == "args":
+            if self._cap_encode:
+                call.args.append('"')
+                self._cap_encode = False
+            self._cap_kind = None
+
+    def _on_root_key(self, key: str) -> None:
+        if self.mode != UNDECIDED or self._direct:
+            return
+        if key == "tool_calls":
+            self._commit(TOOL_CALLS)
+        elif key == "function_call":
+            self._commit(FUNCTION_CALL)
+        elif key == "name" or key in _ARGUMENT_KEYS:
+            self._direct = True
+        else:
+            self._to_text()
+
+    def _value_role(self) -> Optional[tuple]:
+        path = [frame[1] if frame[0] == "{" else frame[2] for frame in self._stack]
+        depth = len(path)
+        if self._direct:
+            if depth == 1 and path[0] == "name":
+                return "name", 0
+            if depth == 1 and path[0] in _ARGUMENT_KEYS:
+                return "args", 0
+        elif self.mode == FUNCTION_CALL:
+            if depth == 2 and path[0] == "function_call":
+                if path[1] == "name":
+                    return "name", 0
+                if path[1] in _ARGUMENT_KEYS:
+                    return "args", 0
+        elif self.mode == TOOL_CALLS:
+            if depth >= 3 and path[0] == "tool_calls" and isinstance(path[1], int):
+                if depth == 3 and path[2] == "id":
+                    return "id", path[1]
+                if depth == 4 and path[2] == "function":
+                    if path[3] == "name":
+                        return "name", path[1]
+                    if path[3] in _ARGUMENT_KEYS:
+                        return "args", path[1]
+        return None
+
+    def _start_value(self, chunk: str, i: int, ch: str) -> None:
+        if self._cap_kind is not None:
+            if ch == '"':
+                self._start_string(None, None)
+            return
+        role = self._value_role()
+        call = self._call(role[1]) if role else None
+        if role is None or role[0] != "args":
+            if ch == '"':
+                self._start_string(role[0] if role else None, call)
+            return
+
+        call.started = True
+        if ch == '"':
+            self._cap_kind = "string"
+            self._start_string("args", call)
+            if self._stack[-1][1] == "parameters":
+                self._cap_encode = True
+                call.args.append('"')
+        else:
+            self._cap_kind = "raw" if ch in "{[" else "scalar"
+            self._cap_call = call
+            self._cap_depth = len(self._stack)
+            self._cap_from = i
+        self._maybe_commit_direct()
+
+    def _end_capture(self, chunk: str, end: int) -> None:
+        self._cap_call.args.append(chunk[self._cap_from:end])
+        self._cap_kind = None
+        self._cap_call = None
+
+    def _close_container(self, chunk: str, i: int) -> None:
+        self._stack.pop()
+        if self._cap_kind == "raw" and len(self._stack) == self._cap_depth:
+            self._end_capture(chunk, i + 1)
+        depth = len(self._stack)
+        if self.mode == TOOL_CALLS and depth == 2 and self._stack[0][1] == "tool_calls":
+            self._send_header(self._call(self._stack[1][2]))
+        if depth:
+            self._expect_key = False
+            return
+        self._done = True
+        if self.mode == UNDECIDED:
+            self._to_text()
+        else:
+            for index in sorted(self._calls):
+                self._send_header(self._calls[index])
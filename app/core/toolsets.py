@@ -0,0 +1,175 @@
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, NamedTuple, Optional, Tuple
+
+from pydantic import TypeAdapter
+
+from .config import settings
+from ..schemas.chat import Function, Tool
+
+_functions_adapter = TypeAdapter(List[Function])
+_tools_adapter = TypeAdapter(List[Tool])
+
+
+def tools_to_functions(tools: List[Tool]) -> List[Function]:
+    """Convert `function` tools to legacy Function definitions"""
+    functions = []
+    for tool in tools:
+        if tool.type == "function":
+            functions.append(Function(
+                name=tool.function.name,
+                description=tool.function.description,
+                parameters=tool.function.parameters
+            ))
+    return functions
+
+
+def serialize_functions_or_tools(
+    functions: Optional[List[Function]] = None,
+    tools: Optional[List[Tool]] = None
+) -> str:
+    """Serialize functions or tools to a compact JSON string"""
+    if tools:
+        serialized_items = []
+        for tool in tools:
+            if tool.type == "function":
+                serialized_item = {
+                    "type": "function",
+                    "function": {
+                        "name": tool.function.name,
+                        "description": tool.function.description,
+                        "parameters": {
+                            "type": tool.function.parameters.type,
+                            "description": tool.function.parameters.description,
+                            "properties": tool.function.parameters.properties,
+                            "required": tool.function.parameters.required
+                        }
+                    }
+                }
+                if tool.function.parameters.enum:
+                    serialized_item["function"]["parameters"]["enum"] = tool.function.parameters.enum
+                if tool.function.parameters.items:
+                    serialized_item["function"]["parameters"]["items"] = tool.function.parameters.items
+                serialized_items.append(serialized_item)
+        return json.dumps(serialized_items, separators=(",", ":"), ensure_ascii=False)
+
+    elif functions:
+        serialized_items = []
+        for func in functions:
+            serialized_item = {
+                "name": func.name,
+                "description": func.description,
+                "parameters": {
+                    "type": func.parameters.type,
+                    "description": func.parameters.description,
+                    "properties": func.parameters.properties,
+                    "required": func.parameters.required
+                }
+            }
+            if func.parameters.enum:
+                serialized_item["parameters"]["enum"] = func.parameters.enum
+            if func.parameters.items:
+                serialized_item["parameters"]["items"] = func.parameters.items
+            serialized_items.append(serialized_item)
+        return json.dumps(serialized_items, separators=(",", ":"), ensure_ascii=False)
+
+    return "[]"
+
+
+def tools_system_message(items_str: str, use_tools: bool) -> str:
+    """Build the system message that describes the available functions/tools"""
+    return f"""Available {'tools' if use_tools else 'functions'}:
+{items_str}
+
+Instructions:
+1. If a {'tool' if use_tools else 'function'} is needed to answer the user's request, use it.
+2. Return your response in JSON format.
+3. Only use {'tools' if use_tools else 'functions'} when necessary and relevant.
+4. Use the exact format:
+   For functions: {{"function_call": {{"name": "function_name", "arguments": "{{\\"param1\\": \\"value1\\"}}"}}}}
+   For tools: {{"tool_calls": [{{"id": "call_1", "type": "function", "function": {{"name": "tool_name", "arguments": "{{\\"param1\\": \\"value1\\"}}"}}}}]}}"""
+
+
+class CompiledToolSet(NamedTuple):
+    """Everything derived from one functions/tools definition"""
+    key: Hashable
+    functions: List[Function]
+    system_message: str
+    raw: Optional[Tuple[Any, Any]] = None
+
+
+def toolset_key(functions: Optional[List[Function]], tools: Optional[List[Tool]]) -> str:
+    """Hash the canonical functions/tools definition"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(b"functions:")
+    digest.update(_functions_adapter.dump_json(functions or []))
+    digest.update(b"tools:")
+    digest.update(_tools_adapter.dump_json(tools or []))
+    return digest.hexdigest()
+
+
+def raw_toolset_key(raw: Tuple[Any, Any]) -> Tuple:
+    """Cheap lookup key for (functions, tools) as decoded from the request body: the names, in order.
+
+    Only valid for definitions the request model has already accepted.
+    Entries found under it must still be compared with `raw`.
+    """
+    functions, tools = raw
+    return (
+        tuple(function["name"] for function in functions or ()),
+        tuple(tool["function"]["name"] for tool in tools or ()),
+    )
+
+
+class ToolSetCache:
+    """Bounded LRU of compiled tool sets, keyed by the definition hash"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CompiledToolSet]" = OrderedDict()
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def compile(
+        self,
+        functions: Optional[List[Function]] = None,
+        tools: Optional[List[Tool]] = None,
+        raw: Optional[Tuple[Any, Any]] = None
+    ) -> CompiledToolSet:
+        """Return the compiled tool set, building it only on a cache miss.
+
+        `raw` is the ("functions", "tools") pair from the decoded request
+        body. With it a lookup costs the names plus one equality check of
+        plain lists and dicts (done in C), instead of serializing the models.
+        Python equality does not tell 1, 1.0 and true apart, so such
+        definitions share a prompt block.
+        """
+        key = raw_toolset_key(raw) if raw is not None else toolset_key(functions, tools)
+        compiled = self._entries.get(key)
+        if compiled is not None and compiled.raw == raw:
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return compiled
+
+        self.stats["misses"] += 1
+        compiled = CompiledToolSet(
+            key=key,
+            functions=functions if functions else tools_to_functions(tools or []),
+            system_message=tools_system_message(
+                serialize_functions_or_tools(functions, tools),
+                bool(tools)
+            ),
+            raw=raw
+        )
+        self._entries[key] = compiled
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+        return compiled
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "entries": len(self._entries), "max_entries": self.max_entries}
+
+
+toolset_cache = ToolSetCache(max_entries=settings.TOOLSET_CACHE_SIZE)
@@ -0,0 +1,471 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Optional, Dict, Any, List
+
+import httpx
+
+from .config import settings
+from .limiter import AdaptiveLimiter, LimiterTimeout, parse_retry_after
+from . import fastjson, metrics
+from .compression import compress_upstream_body
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class UpstreamUnavailable(Exception):
+    """Every upstream endpoint has an open circuit breaker"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """The request's deadline budget ran out before upstream answered"""
+
+
+# Which httpx timeout setting each timeout error comes from
+_TIMEOUT_PHASES = (
+    (httpx.ConnectTimeout, "connect"),
+    (httpx.ReadTimeout, "read"),
+    (httpx.WriteTimeout, "write"),
+    (httpx.PoolTimeout, "pool"),
+)
+
+
+def _capped_timeout(configured: httpx.Timeout, remaining: float) -> httpx.Timeout:
+    """`configured` with every phase shortened to the time left before the deadline"""
+    def cap(value: Optional[float]) -> float:
+        # Nothing may outlive the deadline, but never go below a usable minimum
+        return max(0.001, min(value, remaining) if value is not None else remaining)
+    return httpx.Timeout(
+        connect=cap(configured.connect),
+        read=cap(configured.read),
+        write=cap(configured.write),
+        pool=cap(configured.pool),
+    )
+
+
+def _cut_by_deadline(error: httpx.TimeoutException, configured: httpx.Timeout, remaining: float) -> bool:
+    """Whether the phase that timed out had its timeout shortened by the deadline"""
+    for error_type, phase in _TIMEOUT_PHASES:
+        if isinstance(error, error_type):
+            value = getattr(configured, phase)
+            return value is None or remaining < value
+    return True
+
+
+def error_headers(response: httpx.Response) -> Optional[Dict[str, str]]:
+    """Headers worth relaying to the client with an upstream error status"""
+    retry_after = response.headers.get("retry-after")
+    return {"Retry-After": retry_after} if retry_after else None
+
+
+class UpstreamEndpoint:
+    """One upstream base URL with its load, latency estimate and circuit breaker.
+
+    Latency is time to response headers for streams and to the full body for
+    buffered requests, smoothed as an exponentially weighted moving average.
+    """
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        self.ewma: Optional[float] = None
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.stats: Dict[str, int] = {"requests": 0, "failures": 0, "failovers": 0, "breaker_opens": 0}
+        self.limiter: Optional[AdaptiveLimiter] = None
+        if settings.ADAPTIVE_LIMIT_ENABLED:
+            self.limiter = AdaptiveLimiter(
+                initial=settings.ADAPTIVE_LIMIT_INITIAL,
+                minimum=settings.ADAPTIVE_LIMIT_MIN,
+                maximum=settings.ADAPTIVE_LIMIT_MAX,
+                backoff=settings.ADAPTIVE_LIMIT_BACKOFF,
+                latency_factor=settings.ADAPTIVE_LIMIT_LATENCY_FACTOR,
+                on_change=lambda window: metrics.UPSTREAM_WINDOW.set(window, self.url),
+            )
+            metrics.UPSTREAM_WINDOW.set(self.limiter.window, self.url)
+
+    def available(self, now: float) -> bool:
+        """Whether the breaker lets a request through right now"""
+        if self.state == OPEN and now - self.opened_at >= settings.UPSTREAM_BREAKER_COOLDOWN:
+            self.state = HALF_OPEN
+            self.trial_in_flight = False
+        if self.state == HALF_OPEN:
+            return not self.trial_in_flight
+        return self.state == CLOSED
+
+    def score(self) -> float:
+        latency = self.ewma or 0.0
+        if settings.UPSTREAM_ROUTING == "ewma":
+            return latency * (self.outstanding + 1)
+        return self.outstanding + latency / (latency + 1.0)
+
+    def acquire(self) -> None:
+        self.outstanding += 1
+        self.stats["requests"] += 1
+        if self.state == HALF_OPEN:
+            self.trial_in_flight = True
+
+    def has_capacity(self) -> bool:
+        return self.limiter is None or self.limiter.has_capacity()
+
+    def release(self, limited: bool = True) -> None:
+        """Undo `acquire`; `limited` is False when no limiter slot was obtained"""
+        self.outstanding -= 1
+        self.trial_in_flight = False
+        if limited and self.limiter is not None:
+            self.limiter.release()
+
+    def _observe(self, latency: Optional[float]) -> None:
+        if latency is None:
+            return
+        if self.ewma is None:
+            self.ewma = latency
+        else:
+            self.ewma += settings.UPSTREAM_EWMA_ALPHA * (latency - self.ewma)
+
+    def record_success(self, latency: Optional[float] = None) -> None:
+        self._observe(latency)
+        self.consecutive_failures = 0
+        if self.state != CLOSED:
+            logger.info("Upstream endpoint recovered", extra={"endpoint": self.url})
+            self.state = CLOSED
+            metrics.UPSTREAM_BREAKER_OPEN.set(0, self.url)
+
+    def record_failure(self, latency: Optional[float] = None) -> None:
+        self._observe(latency)
+        self.consecutive_failures += 1
+        self.stats["failures"] += 1
+        if self.state == HALF_OPEN or (
+            self.state == CLOSED and self.consecutive_failures >= settings.UPSTREAM_BREAKER_FAILURES
+        ):
+            logger.warning(
+                "Upstream circuit opened",
+                extra={"endpoint": self.url, "consecutive_failures": self.consecutive_failures}
+            )
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            self.stats["breaker_opens"] += 1
+            metrics.UPSTREAM_BREAKER_OPEN.set(1, self.url)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "state": self.state,
+            "outstanding": self.outstanding,
+            "ewma_ms": round(self.ewma * 1000, 2) if self.ewma is not None else None,
+            "consecutive_failures": self.consecutive_failures,
+            **self.stats,
+            "limiter": self.limiter.snapshot() if self.limiter is not None else None,
+        }
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """Keep a streamed response counted as outstanding until it is closed"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, endpoint: UpstreamEndpoint):
+        self._stream = stream
+        self._endpoint: Optional[UpstreamEndpoint] = endpoint
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._endpoint is not None:
+                self._endpoint.release()
+                self._endpoint = None
+
+
+class UpstreamClient:
+    """Shared pooled HTTP client for talking to Pollinations.
+
+    A single instance is created at import time and started/stopped by the
+    application lifespan, so every router reuses the same keep-alive pool
+    instead of paying a fresh TCP+TLS handshake per request. Requests are
+    spread over the configured endpoints and fail over between them.
+    """
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._http2 = False
+        self._health_task: Optional[asyncio.Task] = None
+        urls = settings.POLLINATIONS_BASE_URLS or [settings.POLLINATIONS_BASE_URL]
+        self.endpoints: List[UpstreamEndpoint] = [UpstreamEndpoint(url) for url in urls]
+
+    def _build_client(self) -> httpx.AsyncClient:
+        http2 = settings.UPSTREAM_HTTP2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("UPSTREAM_HTTP2 is enabled but 'h2' is not installed, falling back to HTTP/1.1")
+                http2 = False
+        self._http2 = http2
+        return httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=settings.UPSTREAM_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.UPSTREAM_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(
+                connect=settings.UPSTREAM_CONNECT_TIMEOUT,
+                read=settings.UPSTREAM_READ_TIMEOUT,
+                write=settings.UPSTREAM_WRITE_TIMEOUT,
+                pool=settings.UPSTREAM_POOL_TIMEOUT,
+            ),
+        )
+
+    async def start(self) -> None:
+        """Create the pooled client and start health probes (called from the app lifespan)"""
+        if self._client is None:
+            self._client = self._build_client()
+        if self._health_task is None and settings.UPSTREAM_HEALTH_CHECK_INTERVAL > 0:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self) -> None:
+        """Stop health probes and close the pooled client and all its connections"""
+        if self._health_task is not None:
+            task, self._health_task = self._health_task, None
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if self._client is not None:
+            client, self._client = self._client, None
+            await client.aclose()
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Return the shared client, creating it lazily if the lifespan did not run"""
+        if self._client is None:
+            self._client = self._build_client()
+        return self._client
+
+    def _acquire(self, exclude: List[UpstreamEndpoint]) -> Optional[UpstreamEndpoint]:
+        """Pick the least loaded available endpoint, preferring ones under their window"""
+        now = time.monotonic()
+        candidates = [e for e in self.endpoints if e not in exclude and e.available(now)]
+        if not candidates:
+            return None
+        endpoint = min(candidates, key=lambda e: (not e.has_capacity(), e.score(), random.random()))
+        endpoint.acquire()
+        return endpoint
+
+    def has_capacity(self) -> bool:
+        """Whether some endpoint could take another request right now"""
+        now = time.monotonic()
+        return any(e.has_capacity() and e.available(now) for e in self.endpoints)
+
+    def _retry_after(self) -> float:
+        now = time.monotonic()
+        waits = [
+            settings.UPSTREAM_BREAKER_COOLDOWN - (now - e.opened_at)
+            for e in self.endpoints if e.state == OPEN
+        ]
+        return max(1.0, min(waits, default=1.0))
+
+    async def send(
+        self,
+        method: str,
+        path: str,
+        *,
+        json: Any = None,
+        content: Optional[bytes] = None,
+        content_encoding: Optional[str] = None,
+        stream: bool = False,
+        timeout: Optional[float] = None,
+        deadline: Optional[float] = None
+    ) -> httpx.Response:
+        """Send a request to the best endpoint, failing over on errors.
+
+        Transport errors, 429 and 5xx answers are retried on another endpoint
+        (up to UPSTREAM_FAILOVER_ATTEMPTS in total). This is only done before
+        the response is handed back, so nothing has reached the client yet and
+        completions have no upstream side effects, which makes it safe for
+        every caller. When no endpoint is left the last error or response is
+        returned as is. Each attempt first waits for room in the endpoint's
+        adaptive concurrency window, which shrinks on 429/503 and timeouts.
+        `deadline` (a time.monotonic() value) caps both that wait and the
+        httpx timeouts of every attempt; a timeout that only happened because
+        of that cap raises DeadlineExceeded and, being the client's choice,
+        counts neither against the endpoint's breaker nor its limiter. A `json` body is encoded (and
+        compressed, see UPSTREAM_COMPRESS_REQUESTS) once for all attempts;
+        pass `content` and `content_encoding` to send bytes that already are.
+        """
+        client = self.client
+        headers = None
+        if json is not None:
+            content, content_encoding = compress_upstream_body(fastjson.dumps(json))
+        if content is not None:
+            headers = {"content-type": "application/json"}
+            if content_encoding:
+                headers["content-encoding"] = content_encoding
+        endpoint = self._acquire([])
+        if endpoint is None:
+            raise UpstreamUnavailable("All upstream endpoints are unavailable", self._retry_after())
+        tried = [endpoint]
+
+        while True:
+            remaining = deadline - time.monotonic() if deadline is not None else None
+            limiter = endpoint.limiter
+            if limiter is not None:
+                try:
+                    wait = settings.ADAPTIVE_LIMIT_QUEUE_TIMEOUT
+                    await limiter.acquire(min(wait, max(remaining, 0.0)) if remaining is not None else wait)
+                except LimiterTimeout as e:
+                    endpoint.release(limited=False)
+                    raise UpstreamUnavailable(str(e), max(1.0, limiter.blocked_until - time.monotonic()))
+                except BaseException:
+                    endpoint.release(limited=False)
+                    raise
+
+            configured = httpx.Timeout(timeout) if timeout is not None else client.timeout
+            attempt_timeout = _capped_timeout(configured, remaining) if remaining is not None else configured
+            upstream_request = client.build_request(
+                method,
+                f"{endpoint.url}{path}",
+                content=content,
+                headers=headers,
+                timeout=attempt_timeout,
+            )
+            start = time.perf_counter()
+            try:
+                response = await client.send(upstream_request, stream=stream)
+            except httpx.TransportError as e:
+                if (
+                    remaining is not None
+                    and isinstance(e, httpx.TimeoutException)
+                    and _cut_by_deadline(e, configured, remaining)
+                ):
+                    endpoint.release()
+                    metrics.UPSTREAM_REQUESTS.inc(endpoint.url, "DeadlineExceeded")
+                    raise DeadlineExceeded("Deadline exceeded before Pollinations API answered") from e
+                if limiter is not None and isinstance(e, httpx.TimeoutException):
+                    limiter.on_overload()
+                endpoint.release()
+                endpoint.record_failure(time.perf_counter() - start)
+                metrics.UPSTREAM_REQUESTS.inc(endpoint.url, type(e).__name__)
+                next_endpoint = self._acquire(tried) if len(tried) < settings.UPSTREAM_FAILOVER_ATTEMPTS else None
+                if next_endpoint is None:
+                    raise
+                logger.warning(
+                    "Upstream request failed, failing over",
+                    extra={"endpoint": endpoint.url, "next_endpoint": next_endpoint.url, "error": str(e)}
+                )
+            except BaseException:
+                endpoint.release()
+                raise
+            else:
+                elapsed = time.perf_counter() - start
+                status = response.status_code
+                metrics.UPSTREAM_REQUESTS.inc(endpoint.url, str(status))
+                if status >= 500:
+                    endpoint.record_failure(elapsed)
+                else:
+                    # A 429 still proves the endpoint is alive
+                    endpoint.record_success(elapsed)
+                if limiter is not None:
+                    if status in (429, 503):
+                        limiter.on_overload(parse_retry_after(response.headers.get("retry-after")))
+                    elif status < 500:
+                        limiter.on_success(elapsed)
+
+                next_endpoint = None
+                if (status >= 500 or status == 429) and len(tried) < settings.UPSTREAM_FAILOVER_ATTEMPTS:
+                    next_endpoint = self._acquire(tried)
+                if next_endpoint is None:
+                    if stream and not response.is_closed:
+                        response.stream = _ReleasingStream(response.stream, endpoint)
+                    else:
+                        endpoint.release()
+                    return response
+
+                endpoint.release()
+                await response.aclose()
+                logger.warning(
+                    "Upstream answered with an error, failing over",
+                    extra={"endpoint": endpoint.url, "next_endpoint": next_endpoint.url, "status": status}
+                )
+
+            endpoint.stats["failovers"] += 1
+            metrics.UPSTREAM_FAILOVERS.inc(endpoint.url)
+            endpoint = next_endpoint
+            tried.append(endpoint)
+
+    async def _probe(self, endpoint: UpstreamEndpoint) -> None:
+        try:
+            response = await self.client.get(
+                f"{endpoint.url}{settings.UPSTREAM_HEALTH_CHECK_PATH}",
+                timeout=settings.UPSTREAM_HEALTH_CHECK_TIMEOUT,
+            )
+        except httpx.TransportError as e:
+            logger.debug("Upstream health probe failed", extra={"endpoint": endpoint.url, "error": str(e)})
+            endpoint.record_failure()
+            return
+        if response.status_code >= 500:
+            endpoint.record_failure()
+        else:
+            endpoint.record_success()
+
+    async def warm_up(self, connections: int) -> None:
+        """Open up to `connections` keep-alive connections to every endpoint ahead of traffic.
+
+        This sends concurrent health probes, so their results also count as
+        health checks.
+        """
+        count = max(1, min(connections, settings.UPSTREAM_MAX_KEEPALIVE_CONNECTIONS))
+        await asyncio.gather(*(self._probe(endpoint) for endpoint in self.endpoints for _ in range(count)))
+
+    async def _health_loop(self) -> None:
+        """Actively probe every endpoint so open circuits close as soon as it recovers"""
+        while True:
+            await asyncio.sleep(settings.UPSTREAM_HEALTH_CHECK_INTERVAL)
+            await asyncio.gather(*(self._probe(endpoint) for endpoint in self.endpoints))
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Report connection pool usage for sizing the limits"""
+        stats = {
+            "started": self._client is not None,
+            "http2": self._http2,
+            "max_connections": settings.UPSTREAM_MAX_CONNECTIONS,
+            "max_keepalive_connections": settings.UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+            "connections": 0,
+            "active": 0,
+            "idle": 0,
+            "waiting": 0,
+            "healthy_endpoints": sum(1 for e in self.endpoints if e.state == CLOSED),
+            "endpoints": [e.snapshot() for e in self.endpoints],
+        }
+        if self._client is None:
+            return stats
+
+        # httpx does not expose pool state publicly, so peek at the httpcore pool
+        pool = getattr(self._client._transport, "_pool", None)
+        if pool is None:
+            return stats
+        connections = list(getattr(pool, "connections", []))
+        idle = sum(1 for conn in connections if conn.is_idle())
+        stats["connections"] = len(connections)
+        stats["idle"] = idle
+        stats["active"] = len(connections) - idle
+        stats["waiting"] = sum(1 for req in getattr(pool, "_requests", []) if req.is_queued())
+        return stats
+
+
+upstream = UpstreamClient()
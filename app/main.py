@@ -1,7 +1,63 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from .routers import chat, models
+from .routers import admin, batches, chat, files, models, sessions
 from .core.config import settings
+from .core.upstream import upstream
+from .core import hedging
+from .core.response_cache import response_cache
+from .core.toolsets import toolset_cache
+from .core.logs import RequestIdMiddleware, logging_pipeline
+from .core.metrics import MetricsMiddleware, registry
+from .core.admission import AdmissionMiddleware, admission
+from .core.disconnect import DisconnectMiddleware
+from .core.batches import batch_runner
+from .core.sessions import session_store
+from .core.fastjson import FastJSONResponse
+from .core import compression
+from .core.compression import CompressionMiddleware
+from .core.startup import startup_state
+from .core.model_index import model_router
+from .core.profiler import profiler
+
+async def warm_up() -> None:
+    """Get the process up to speed before /v1/ready reports it ready"""
+    timeout = settings.WARMUP_TIMEOUT
+    await asyncio.gather(
+        startup_state.run_step(
+            "upstream_connections", lambda: upstream.warm_up(settings.WARMUP_CONNECTIONS), timeout
+        ),
+        startup_state.run_step("model_catalogue", models.models_cache.get, timeout),
+    )
+    await startup_state.run_step(
+        "code_paths", lambda: asyncio.to_thread(chat.warm_up_request_path), timeout
+    )
+    startup_state.set_ready()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open shared upstream/cache/logging resources for the lifetime of the app"""
+    startup_state.mark("boot")
+    logging_pipeline.start()
+    await upstream.start()
+    await batch_runner.start()
+    # Warm up in the background: liveness (/v1/health) answers meanwhile
+    warm_up_task = asyncio.create_task(warm_up()) if settings.WARMUP_ENABLED else None
+    if warm_up_task is None:
+        startup_state.set_ready()
+    try:
+        yield
+    finally:
+        if warm_up_task is not None:
+            warm_up_task.cancel()
+            await asyncio.gather(warm_up_task, return_exceptions=True)
+        await batch_runner.stop()
+        await upstream.close()
+        response_cache.close()
+        session_store.close()
+        logging_pipeline.stop()
 
 app = FastAPI(
     title="OpenAI-Compatible Pollinations.AI Proxy",
@@ -9,6 +65,8 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/v1/docs",
     redoc_url="/v1/redoc",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,
 )
 
 # CORS middleware configuration
@@ -18,13 +76,82 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID", "Server-Timing"],
 )
 
+# Cancels upstream work for clients that have gone away
+app.add_middleware(DisconnectMiddleware)
+
+# Releases chat completion admission slots once the response is sent
+app.add_middleware(AdmissionMiddleware)
+
+# Per-request correlation id for structured logs
+app.add_middleware(RequestIdMiddleware)
+
+# Negotiated response compression and compressed request bodies
+app.add_middleware(CompressionMiddleware)
+
+# Request counters and per-stage latency histograms for /v1/metrics
+app.add_middleware(MetricsMiddleware)
+registry.register_stats("proxy_upstream_pool", upstream.pool_stats)
+registry.register_stats("proxy_upstream_hedging", lambda: hedging.stats)
+registry.register_stats("proxy_models_cache", lambda: models.models_cache.stats)
+registry.register_stats("proxy_response_cache", response_cache.snapshot)
+registry.register_stats("proxy_toolset_cache", toolset_cache.snapshot)
+registry.register_stats("proxy_log_queue", logging_pipeline.stats)
+registry.register_stats("proxy_admission", admission.snapshot)
+registry.register_stats("proxy_batches", lambda: batch_runner.stats)
+registry.register_stats("proxy_sessions", session_store.snapshot)
+registry.register_stats("proxy_compression", lambda: compression.stats)
+registry.register_stats("proxy_startup", startup_state.metrics)
+registry.register_stats("proxy_model_routing", model_router.snapshot)
+registry.register_stats("proxy_profiler", lambda: profiler.stats)
+
 # Include routers
 app.include_router(chat.router, prefix="/v1")
 app.include_router(models.router, prefix="/v1")
+app.include_router(files.router, prefix="/v1")
+app.include_router(batches.router, prefix="/v1")
+app.include_router(sessions.router, prefix="/v1")
+app.include_router(admin.router, prefix="/v1")
 
 @app.get("/v1/health")
 async def health_check():
-    """Health check endpoint"""
-    return {"status": "healthy"} 
\ No newline at end of file
+    """Liveness: the process is up and serving requests"""
+    return {"status": "healthy"}
+
+@app.get("/v1/ready")
+async def readiness_check():
+    """Readiness: 503 until startup warm-up has finished, with startup timings"""
+    if not startup_state.ready:
+        return JSONResponse(startup_state.snapshot(), status_code=503, headers={"Retry-After": "1"})
+    return startup_state.snapshot()
+
+@app.get("/v1/upstream/stats")
+async def upstream_stats():
+    """Upstream connection pool, endpoint, hedging/retry and model routing statistics"""
+    return {**upstream.pool_stats(), "hedging": hedging.stats, "model_routing": model_router.snapshot()}
+
+@app.get("/v1/admission/stats")
+async def admission_stats():
+    """Admission control: active slots, queue depth and rejections"""
+    return admission.snapshot()
+
+@app.get("/v1/logging/stats")
+async def logging_stats():
+    """Background log queue counters (enqueued, dropped, sampled out)"""
+    return logging_pipeline.stats()
+
+@app.get("/v1/cache/stats")
+async def cache_stats():
+    """Model catalogue and response cache statistics"""
+    return {
+        "models": models.models_cache.stats,
+        "responses": response_cache.snapshot(),
+        "toolsets": toolset_cache.snapshot(),
+    }
+
+@app.get("/v1/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Metrics in Prometheus text exposition format"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
\ No newline at end of file
@@ -0,0 +1,42 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse
+import hmac
+import logging
+from ..core.config import settings
+from ..core.profiler import ProfilerBusy, profiler
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+def require_admin(http_request: Request) -> None:
+    """Admin endpoints need "Authorization: Bearer <ADMIN_API_KEY>" and do not exist without it"""
+    if not settings.ADMIN_API_KEY:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = http_request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.strip().encode(), settings.ADMIN_API_KEY.encode()):
+        raise HTTPException(status_code=403, detail="Admin API key required")
+
+@router.post("/admin/profile", dependencies=[Depends(require_admin)], response_class=PlainTextResponse)
+async def profile(
+    seconds: float = Query(10.0, gt=0),
+    interval_ms: float = Query(None, ge=1),
+    all_threads: bool = False,
+):
+    """Sample live traffic for `seconds` and return flamegraph-compatible collapsed stacks"""
+    if seconds > settings.PROFILER_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be at most {settings.PROFILER_MAX_SECONDS:g}")
+    interval = (interval_ms or settings.PROFILER_INTERVAL_MS) / 1000
+    logger.info("Profiling started", extra={"seconds": seconds, "interval": interval, "all_threads": all_threads})
+    try:
+        result = await profiler.profile(seconds, interval, all_threads)
+    except ProfilerBusy:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    return PlainTextResponse(
+        result.collapsed(),
+        headers={
+            "X-Profile-Samples": str(result.samples),
+            "X-Profile-Duration": f"{result.duration:.3f}",
+            "X-Profile-Mode": result.mode,
+        },
+    )
@@ -0,0 +1,98 @@
+from fastapi import APIRouter, HTTPException, Query, Request
+from pydantic import ValidationError
+from typing import Any, Dict, Optional, Tuple
+import asyncio
+import logging
+import time
+from ..core import fastjson
+from ..core.batches import batch_runner, batch_store, new_id
+from ..schemas.batch import Batch, BatchCreateRequest, BatchList
+from ..schemas.chat import ChatCompletionRequest
+from . import chat
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+def _error_body(message: str, error_type: str) -> Dict[str, Any]:
+    return {"error": {"message": message, "type": error_type}}
+
+async def execute_chat_request(body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+    """Run one batch line through the regular chat completion handler"""
+    try:
+        request = ChatCompletionRequest.model_validate({**body, "stream": False})
+    except ValidationError as e:
+        return 400, _error_body(str(e), "invalid_request_error")
+    # A synthetic request without an admission slot: batches are throttled by
+    # BATCH_WORKERS/BATCH_RATE_LIMIT instead of competing with live traffic
+    http_request = Request({
+        "type": "http",
+        "method": "POST",
+        "path": "/v1/chat/completions",
+        "headers": [],
+        "query_string": b"",
+        "client": None,
+    })
+    try:
+        result = await chat.create_chat_completion(request, http_request)
+    except HTTPException as e:
+        return e.status_code, _error_body(str(e.detail), "invalid_request_error" if e.status_code < 500 else "server_error")
+    return result.status_code, fastjson.loads(result.body)
+
+batch_runner.execute = execute_chat_request
+
+@router.post("/batches", response_model=Batch)
+async def create_batch(request: BatchCreateRequest):
+    """Queue a batch of chat completion requests from an uploaded JSONL file"""
+    input_file = await asyncio.to_thread(batch_store.get_file, request.input_file_id)
+    if input_file is None:
+        raise HTTPException(status_code=400, detail=f"No such file: {request.input_file_id}")
+    if input_file.purpose != "batch":
+        raise HTTPException(status_code=400, detail="Input file must be uploaded with purpose 'batch'")
+    batch = Batch(
+        id=new_id("batch_"),
+        endpoint=request.endpoint,
+        input_file_id=request.input_file_id,
+        completion_window=request.completion_window,
+        status="validating",
+        created_at=int(time.time()),
+        metadata=request.metadata
+    )
+    await asyncio.to_thread(batch_store.create_batch, batch)
+    batch_runner.notify()
+    logger.info("Batch created", extra={"batch_id": batch.id, "input_file_id": batch.input_file_id})
+    return batch
+
+@router.get("/batches", response_model=BatchList)
+async def list_batches(
+    limit: int = Query(20, ge=1, le=100),
+    after: Optional[str] = None
+):
+    """List batches, newest first"""
+    batches = await asyncio.to_thread(batch_store.list_batches)
+    if after:
+        ids = [batch.id for batch in batches]
+        batches = batches[ids.index(after) + 1:] if after in ids else []
+    page = batches[:limit]
+    return BatchList(
+        data=page,
+        first_id=page[0].id if page else None,
+        last_id=page[-1].id if page else None,
+        has_more=len(batches) > limit
+    )
+
+@router.get("/batches/{batch_id}", response_model=Batch)
+async def retrieve_batch(batch_id: str):
+    """Get a batch's status and request counts"""
+    batch = await batch_runner.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"No such batch: {batch_id}")
+    return batch
+
+@router.post("/batches/{batch_id}/cancel", response_model=Batch)
+async def cancel_batch(batch_id: str):
+    """Cancel a batch; results finished so far are kept"""
+    batch = await batch_runner.cancel(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"No such batch: {batch_id}")
+    return batch
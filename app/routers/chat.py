@@ -1,46 +1,103 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from ..schemas.chat import (
     ChatCompletionRequest, ChatCompletionResponse, ChatMessage,
-    Tool, ToolCall, Function
+    Tool
 )
 from ..core.config import settings
+from ..core import fastjson
+from ..core.fastjson import FastJSONResponse, FastJSONRoute
+from ..core.upstream import UpstreamUnavailable, error_headers
+from ..core import hedging
+from ..core.hedging import DeadlineExceeded
+from ..core.admission import AdmissionRejected, admission, tenant_key
+from ..core.sessions import ReplyRecorder, assistant_message, session_key, session_store
+from ..core.streaming import (
+    ResponseStream, StreamBufferOverflow, chunk_payload, format_sse, iter_upstream_content, merge_streams, SSE_DONE
+)
+from ..core.toolcall_parser import ToolCallStreamParser
+from ..core.response_cache import canonical_key, response_cache
+from ..core.coalesce import StreamAbandoned, StreamBroadcast, completion_coalescer
+from ..core.toolsets import serialize_functions_or_tools, tools_to_functions, toolset_cache
+from ..core.model_index import FALLBACK_STATUSES, ModelRejected, model_label, model_router
+from ..core import metrics
+from .models import models_cache
+import asyncio
 import httpx
 import json
+import logging
+import random
+import re
 import time
 import uuid
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, AsyncIterator, Tuple
+
+logger = logging.getLogger(__name__)
 
-router = APIRouter()
+# Start of an embedded {"name": ..., "parameters": ...} object in free text
+_EMBEDDED_CALL_RE = re.compile(r'\{\s*"name"\s*:')
+_json_decoder = json.JSONDecoder()
+
+router = APIRouter(route_class=FastJSONRoute)
+
+# Synthetic tool-calling exchange that warms up the request path at startup
+_WARMUP_REQUEST = {
+    "model": settings.DEFAULT_MODEL,
+    "messages": [
+        {"role": "user", "content": "What is the weather in Paris?"},
+        {"role": "assistant", "content": None, "tool_calls": [{
+            "id": "call_warmup",
+            "type": "function",
+            "function": {"name": "get_weather", "parameters": {"city": "Paris"}}
+        }]},
+        {"role": "tool", "tool_call_id": "call_warmup", "content": "{\"temperature\": 21}"}
+    ],
+    "tools": [{
+        "type": "function",
+        "function": {
+            "name": "get_weather",
+            "description": "Current weather for a city",
+            "parameters": {"type": "object", "properties": {"city": {"type": "string"}}, "required": ["city"]}
+        }
+    }]
+}
+_WARMUP_REPLY = '{"tool_calls": [{"id": "call_warmup", "function": {"name": "get_weather", "parameters": {"city": "Paris"}}}]}'
 
 def prepare_messages_with_function_calling(
     messages: list[ChatMessage],
     functions: Optional[list] = None,
     function_call: Optional[Dict[str, Any]] = None,
     tools: Optional[List[Tool]] = None,
-    tool_choice: Optional[Dict[str, Any]] = None
+    tool_choice: Optional[Dict[str, Any]] = None,
+    history: Optional[List[Dict[str, Any]]] = None
 ) -> list[Dict[str, Any]]:
-    """Prepare messages for Pollinations API with function/tool calling support"""
+    """Prepare messages for Pollinations API with function/tool calling support.
+
+    The request's messages are left untouched: the upstream dicts are built
+    in one pass and share the validated content strings rather than copying
+    them, so long histories cost little beyond their own size. `history`
+    holds already prepared messages (a server-side session) that go first.
+    """
+    history = history or []
     
     # Convert tools to functions if present
     if tools and not functions:
-        functions = []
-        for tool in tools:
-            if tool.type == "function":
-                functions.append(Function(
-                    name=tool.function.name,
-                    description=tool.function.description,
-                    parameters=tool.function.parameters
-                ))
+        functions = tools_to_functions(tools)
+    
+    formatted_messages = []
     
     # Add system message for function calling if functions are present
-    if (functions or tools) and not any(msg.role == "system" for msg in messages):
-        messages.insert(0, ChatMessage(
-            role="system",
-            content=settings.FUNCTION_CALLING_SYSTEM_PROMPT
-        ))
+    if (functions or tools) and not (
+        any(msg.role == "system" for msg in messages)
+        or any(message["role"] == "system" for message in history)
+    ):
+        formatted_messages.append({
+            "role": "system",
+            "content": settings.FUNCTION_CALLING_SYSTEM_PROMPT
+        })
+    formatted_messages.extend(history)
     
     # Convert messages to format expected by Pollinations
-    formatted_messages = []
     for msg in messages:
         message_dict = {
             "role": msg.role,
@@ -50,148 +107,507 @@ def prepare_messages_with_function_calling(
             message_dict["name"] = msg.name
         if msg.function_call:
             # Convert function call arguments to string if they're not already
-            if isinstance(msg.function_call.get("arguments"), (dict, list)):
-                msg.function_call["arguments"] = json.dumps(msg.function_call["arguments"])
-            message_dict["function_call"] = msg.function_call
+            arguments = msg.function_call.get("arguments")
+            if isinstance(arguments, (dict, list)):
+                message_dict["function_call"] = {**msg.function_call, "arguments": fastjson.dumps_str(arguments)}
+            else:
+                message_dict["function_call"] = msg.function_call
         if msg.tool_calls:
-            message_dict["tool_calls"] = []
-            for tool_call in msg.tool_calls:
-                formatted_tool_call = {
+            message_dict["tool_calls"] = [
+                {
                     "id": tool_call.id,
                     "type": tool_call.type,
                     "function": {
                         "name": tool_call.function.get("name", ""),
-                        "arguments": json.dumps(tool_call.function.get("parameters", {}))
+                        "arguments": fastjson.dumps_str(tool_call.function.get("parameters", {}))
                     }
                 }
-                message_dict["tool_calls"].append(formatted_tool_call)
+                for tool_call in msg.tool_calls
+            ]
         if msg.tool_call_id:
             message_dict["tool_call_id"] = msg.tool_call_id
         formatted_messages.append(message_dict)
     
     return formatted_messages
 
-def extract_function_or_tool_call(content: str) -> tuple[Optional[Dict[str, Any]], Optional[List[ToolCall]]]:
-    """Extract function call or tool calls from content"""
-    try:
-        # Try to parse the content as JSON
-        data = json.loads(content)
-        if isinstance(data, dict):
-            # Check for function call
-            if "function_call" in data:
-                function_call = data["function_call"]
-                # Ensure arguments is a string
-                if isinstance(function_call.get("parameters"), (dict, list)):
-                    function_call["arguments"] = json.dumps(function_call["parameters"])
-                    function_call.pop("parameters", None)
-                return function_call, None
-            # Check for direct function call format
-            if "name" in data and "parameters" in data:
-                # Convert parameters to arguments string
+def warm_up_request_path() -> None:
+    """Run the synthetic exchange through validation, preparation and parsing, without calling upstream"""
+    request = ChatCompletionRequest.model_validate(fastjson.loads(fastjson.dumps(_WARMUP_REQUEST)))
+    functions = tools_to_functions(request.tools)
+    serialize_functions_or_tools(functions=functions)
+    serialize_functions_or_tools(tools=request.tools)
+    messages = prepare_messages_with_function_calling(
+        request.messages, functions, request.function_call, request.tools, request.tool_choice
+    )
+    fastjson.dumps({"model": request.model, "messages": messages})
+    extract_function_or_tool_call(_WARMUP_REPLY)
+
+# Marks an upstream body that was not valid JSON
+_NOT_JSON = object()
+
+def extract_function_or_tool_call(
+    content: str,
+    data: Any = _NOT_JSON
+) -> tuple[Optional[Dict[str, Any]], Optional[List[Dict[str, Any]]]]:
+    """Extract function call or tool calls from content.
+
+    `data` is `content` already decoded, when the caller has done that;
+    otherwise it is decoded here.
+    """
+    if data is _NOT_JSON:
+        try:
+            data = fastjson.loads(content)
+        except fastjson.JSONDecodeError:
+            data = _NOT_JSON
+    if data is _NOT_JSON:
+        # If content is not JSON, look for an embedded function call object
+        for match in _EMBEDDED_CALL_RE.finditer(content):
+            try:
+                data, _ = _json_decoder.raw_decode(content, match.start())
+            except json.JSONDecodeError:
+                continue
+            if isinstance(data, dict) and isinstance(data.get("name"), str) and "parameters" in data:
                 return {
                     "name": data["name"],
-                    "arguments": json.dumps(data["parameters"])
+                    "arguments": fastjson.dumps_str(data["parameters"])
                 }, None
-            # Check for tool calls
-            if "tool_calls" in data:
-                tool_calls = []
-                for call in data["tool_calls"]:
-                    # Ensure function arguments is a string
-                    if "function" in call:
-                        if isinstance(call["function"].get("parameters"), (dict, list)):
-                            call["function"]["arguments"] = json.dumps(call["function"]["parameters"])
-                            call["function"].pop("parameters", None)
-                    tool_calls.append(ToolCall(
-                        id=call.get("id", str(uuid.uuid4())),
-                        type=call.get("type", "function"),
-                        function=call["function"]
-                    ))
-                return None, tool_calls
         return None, None
-    except json.JSONDecodeError:
-        # If content is not JSON, try to extract function call using regex
-        import re
-        match = re.search(r'{\s*"name":\s*"([^"]+)",\s*"parameters":\s*({[^}]+})\s*}', content)
-        if match:
+    if isinstance(data, dict):
+        # Check for function call
+        if "function_call" in data:
+            function_call = data["function_call"]
+            # Ensure arguments is a string
+            if "parameters" in function_call:
+                function_call["arguments"] = fastjson.dumps_str(function_call.pop("parameters"))
+            return function_call, None
+        # Check for direct function call format
+        if "name" in data and "parameters" in data:
+            # Convert parameters to arguments string
+            return {
+                "name": data["name"],
+                "arguments": fastjson.dumps_str(data["parameters"])
+            }, None
+        # Check for tool calls
+        if "tool_calls" in data:
+            tool_calls = []
+            for call in data["tool_calls"]:
+                # Ensure function arguments is a string
+                if "function" in call:
+                    if "parameters" in call["function"]:
+                        call["function"]["arguments"] = fastjson.dumps_str(call["function"].pop("parameters"))
+                tool_calls.append({
+                    "id": call.get("id", str(uuid.uuid4())),
+                    "type": call.get("type", "function"),
+                    "function": call["function"]
+                })
+            return None, tool_calls
+    return None, None
+
+def completion_id() -> str:
+    """Generate a unique OpenAI-style completion id"""
+    return f"chatcmpl-{uuid.uuid4().hex}"
+
+async def open_completion_stream(pollinations_request: Dict[str, Any]) -> httpx.Response:
+    """Send the upstream request in streaming mode and check its status"""
+    try:
+        response = await hedging.send("POST", "/", json=pollinations_request, stream=True)
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except UpstreamUnavailable as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Pollinations API unavailable: {str(e)}",
+            headers={"Retry-After": str(int(e.retry_after))}
+        )
+    except httpx.RequestError as e:
+        raise HTTPException(status_code=500, detail=f"Error communicating with Pollinations API: {str(e)}")
+
+    if response.status_code != 200:
+        body = await response.aread()
+        await response.aclose()
+        raise HTTPException(
+            status_code=response.status_code,
+            detail=f"Error from Pollinations API: {body.decode(errors='replace')}",
+            headers=error_headers(response)
+        )
+    metrics.mark("upstream")
+    return response
+
+async def iter_completion_deltas(
+    request: ChatCompletionRequest,
+    response: httpx.Response,
+    index: int = 0
+) -> AsyncIterator[Tuple[int, Dict[str, Any], Optional[str]]]:
+    """Yield `(choice index, delta, finish_reason)` for an open upstream stream"""
+    # Only look for function/tool call JSON when the client offered some
+    parser = ToolCallStreamParser() if request.functions or request.tools else None
+    try:
+        async for content in iter_upstream_content(response, settings.STREAM_MAX_BUFFER_CHARS):
+            deltas = parser.feed(content) if parser else [{"content": content}]
+            for delta in deltas:
+                yield index, delta, None
+        finish_reason = "stop"
+        if parser:
+            for delta in parser.close():
+                yield index, delta, None
+            finish_reason = parser.finish_reason
+        yield index, {}, finish_reason
+    finally:
+        await response.aclose()
+
+def sse_response(
+    request: ChatCompletionRequest,
+    deltas: AsyncIterator[Tuple[int, Dict[str, Any], Optional[str]]],
+    model: str,
+    source: Optional[AsyncIterator[Any]] = None
+) -> StreamingResponse:
+    """Format completion deltas as OpenAI `chat.completion.chunk` server-sent events.
+
+    `source` is the stream `deltas` wraps, if any: it is closed as well, in
+    case the client left before `deltas` ever started (and could close it).
+    """
+    chunk_id = completion_id()
+    created = int(time.time())
+
+    async def event_stream() -> AsyncIterator[str]:
+        try:
+            for index in range(request.n or 1):
+                yield format_sse(chunk_payload(
+                    chunk_id, created, model, {"role": "assistant", "content": ""}, index=index
+                ))
+            async for index, delta, finish_reason in deltas:
+                yield format_sse(chunk_payload(chunk_id, created, model, delta, finish_reason, index))
+            yield SSE_DONE
+        except Exception as e:
+            # Headers are already sent, so report the failure in-band and end the stream
+            if isinstance(e, (httpx.RequestError, StreamBufferOverflow, StreamAbandoned, DeadlineExceeded)):
+                logger.warning("Upstream stream aborted: %s", e)
+            else:
+                logger.exception("Stream relay failed")
+            yield format_sse({"error": {"message": f"Error streaming from Pollinations API: {str(e)}"}})
+        finally:
             try:
-                name = match.group(1)
-                parameters = json.loads(match.group(2))
-                return {
-                    "name": name,
-                    "arguments": json.dumps(parameters)
-                }, None
-            except:
-                pass
-        return None, None
+                await deltas.aclose()
+            finally:
+                if source is not None:
+                    await source.aclose()
 
-def serialize_functions_or_tools(
-    functions: Optional[List[Function]] = None,
-    tools: Optional[List[Tool]] = None
-) -> str:
-    """Serialize functions or tools to JSON string"""
-    if tools:
-        serialized_items = []
-        for tool in tools:
-            if tool.type == "function":
-                serialized_item = {
-                    "type": "function",
-                    "function": {
-                        "name": tool.function.name,
-                        "description": tool.function.description,
-                        "parameters": {
-                            "type": tool.function.parameters.type,
-                            "description": tool.function.parameters.description,
-                            "properties": tool.function.parameters.properties,
-                            "required": tool.function.parameters.required
-                        }
-                    }
-                }
-                if tool.function.parameters.enum:
-                    serialized_item["function"]["parameters"]["enum"] = tool.function.parameters.enum
-                if tool.function.parameters.items:
-                    serialized_item["function"]["parameters"]["items"] = tool.function.parameters.items
-                serialized_items.append(serialized_item)
-        return json.dumps(serialized_items, indent=2)
-    
-    elif functions:
-        serialized_items = []
-        for func in functions:
-            serialized_item = {
-                "name": func.name,
-                "description": func.description,
-                "parameters": {
-                    "type": func.parameters.type,
-                    "description": func.parameters.description,
-                    "properties": func.parameters.properties,
-                    "required": func.parameters.required
-                }
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def sample_requests(request: ChatCompletionRequest, pollinations_request: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Split an `n > 1` request into `n` single-sample upstream requests"""
+    n = request.n or 1
+    if n == 1:
+        return [pollinations_request]
+    # Pollinations caches identical requests, so give every sample its own seed
+    return [
+        {**pollinations_request, "n": 1, "seed": random.randrange(2 ** 31)}
+        for _ in range(n)
+    ]
+
+async def gather_or_cancel(aws, cleanup=None) -> List[Any]:
+    """Run awaitables concurrently; if one fails, cancel the rest and clean up finished results"""
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        if cleanup is not None:
+            for result in results:
+                if not isinstance(result, BaseException):
+                    await cleanup(result)
+        raise
+
+async def with_model_fallback(pollinations_request: Dict[str, Any], call) -> Tuple[Any, str]:
+    """Run `call` on the upstream request, moving on to fallback models while the model is failing.
+
+    The model's MODEL_FALLBACKS are tried when it is marked unhealthy, or
+    when it still answers 429/5xx after the retries. Returns the result and
+    the model that produced it.
+    """
+    primary = pollinations_request["model"]
+    candidates = model_router.candidates(primary)
+    for attempt, model in enumerate(candidates):
+        if model != primary:
+            model_router.stats["fallbacks"] += 1
+            logger.warning("Using fallback model", extra={"model": primary, "fallback": model})
+        try:
+            result = await call(pollinations_request if model == primary else {**pollinations_request, "model": model})
+        except HTTPException as e:
+            if e.status_code not in FALLBACK_STATUSES:
+                raise
+            model_router.record_failure(model)
+            if attempt == len(candidates) - 1:
+                raise
+            continue
+        model_router.record_success(model)
+        return result, model
+
+async def open_completion_deltas(
+    request: ChatCompletionRequest,
+    pollinations_request: Dict[str, Any]
+) -> AsyncIterator[Tuple[int, Dict[str, Any], Optional[str]]]:
+    """Open one upstream stream per requested choice and interleave their deltas"""
+    samples = sample_requests(request, pollinations_request)
+    if len(samples) == 1:
+        response = await open_completion_stream(pollinations_request)
+        return ResponseStream(iter_completion_deltas(request, response), [response])
+
+    responses = await gather_or_cancel(
+        (open_completion_stream(sample) for sample in samples),
+        cleanup=lambda response: response.aclose()
+    )
+    return ResponseStream(merge_streams([
+        iter_completion_deltas(request, response, index)
+        for index, response in enumerate(responses)
+    ]), responses)
+
+async def record_session_turn(
+    deltas: AsyncIterator[Tuple[int, Dict[str, Any], Optional[str]]],
+    session: str,
+    new_messages: List[Dict[str, Any]]
+) -> AsyncIterator[Tuple[int, Dict[str, Any], Optional[str]]]:
+    """Pass deltas through and add the turn to the session once the stream completes"""
+    recorder = ReplyRecorder()
+    try:
+        async for index, delta, finish_reason in deltas:
+            if index == 0:
+                recorder.feed(delta, finish_reason)
+            yield index, delta, finish_reason
+    finally:
+        await deltas.aclose()
+    if recorder.finished:
+        await session_store.append(session, new_messages + [recorder.message()])
+
+async def stream_chat_completion(
+    request: ChatCompletionRequest,
+    pollinations_request: Dict[str, Any],
+    coalesce_key: Optional[str] = None,
+    session_turn: Optional[Tuple[str, List[Dict[str, Any]]]] = None
+) -> StreamingResponse:
+    """Relay an upstream streaming completion, sharing it between identical requests"""
+    def open_deltas(body: Dict[str, Any]):
+        return open_completion_deltas(request, body)
+
+    if coalesce_key is None:
+        deltas, model = await with_model_fallback(pollinations_request, open_deltas)
+    else:
+        async def start_broadcast() -> StreamBroadcast:
+            deltas, model = await with_model_fallback(pollinations_request, open_deltas)
+            return StreamBroadcast(deltas, meta=model)
+
+        broadcast, _ = await completion_coalescer.run(coalesce_key, start_broadcast)
+        deltas, model = broadcast.subscribe(), broadcast.meta
+    source = None
+    if session_turn is not None:
+        source, deltas = deltas, record_session_turn(deltas, *session_turn)
+    return sse_response(request, deltas, model, source)
+
+async def fetch_chat_completion(
+    request: ChatCompletionRequest,
+    pollinations_request: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Send a buffered completion upstream and convert the answer to an OpenAI response body"""
+    messages = pollinations_request["messages"]
+    try:
+        response = await hedging.send("POST", "/", json=pollinations_request)
+        metrics.mark("upstream")
+        logger.debug("Pollinations request", extra={"payload": pollinations_request})
+        logger.debug(
+            "Pollinations response",
+            extra={"status": response.status_code, "payload": response.text}
+        )
+        if response.status_code != 200:
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"Error from Pollinations API: {response.text}",
+                headers=error_headers(response)
+            )
+        
+        content = response.text
+        
+        # Decode the body once for both the call check and the plain answer
+        try:
+            pollinations_response = fastjson.loads(response.content)
+        except fastjson.JSONDecodeError:
+            pollinations_response = _NOT_JSON
+        
+        # Check for function or tool calls in the response
+        function_call, tool_calls = extract_function_or_tool_call(content, pollinations_response)
+        
+        # If we got a function call or tool calls, use them directly
+        if function_call or tool_calls:
+            content = None
+        elif isinstance(pollinations_response, dict) and "choices" in pollinations_response:
+            content = pollinations_response.get("choices", [{}])[0].get("message", {}).get("content", content)
+        
+        # Build the OpenAI-compatible response as plain data: it is never
+        # validated again, only serialized
+        prompt_chars = sum(len(message.get("content") or "") for message in messages)
+        completion_chars = len(content or "")
+        chat_response = {
+            "id": completion_id(),
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": pollinations_request["model"],
+            "choices": [{
+                "index": 0,
+                "message": {
+                    "role": "assistant",
+                    "content": content,
+                    "name": None,
+                    "function_call": function_call,
+                    "tool_calls": tool_calls,
+                    "tool_call_id": None
+                },
+                "finish_reason": "tool_calls" if tool_calls else "function_call" if function_call else "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_chars // 4,  # Approximate
+                "completion_tokens": completion_chars // 4,  # Approximate
+                "total_tokens": (prompt_chars + completion_chars) // 4
             }
-            if func.parameters.enum:
-                serialized_item["parameters"]["enum"] = func.parameters.enum
-            if func.parameters.items:
-                serialized_item["parameters"]["items"] = func.parameters.items
-            serialized_items.append(serialized_item)
-        return json.dumps(serialized_items, indent=2)
-    
-    return "[]"
+        }
+        metrics.mark("parse")
+        
+        return chat_response
+        
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except UpstreamUnavailable as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Pollinations API unavailable: {str(e)}",
+            headers={"Retry-After": str(int(e.retry_after))}
+        )
+    except HTTPException:
+        raise
+    except httpx.RequestError as e:
+        raise HTTPException(status_code=500, detail=f"Error communicating with Pollinations API: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+async def fetch_chat_completions(
+    request: ChatCompletionRequest,
+    pollinations_request: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Fetch all requested choices concurrently and merge them into one response"""
+    samples = sample_requests(request, pollinations_request)
+    if len(samples) == 1:
+        return await fetch_chat_completion(request, pollinations_request)
+
+    responses = await gather_or_cancel(fetch_chat_completion(request, sample) for sample in samples)
+    choices = [
+        {**response["choices"][0], "index": index}
+        for index, response in enumerate(responses)
+    ]
+    # The prompt is the same for every sample, so it is counted once (as OpenAI does)
+    prompt_tokens = responses[0]["usage"]["prompt_tokens"]
+    completion_tokens = sum(response["usage"]["completion_tokens"] for response in responses)
+    return {
+        **responses[0],
+        "choices": choices,
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    }
+
+def is_deterministic(request: ChatCompletionRequest, http_request: Request) -> bool:
+    """Whether identical requests may share one upstream answer.
+
+    Clients opt in or out per request with the `X-Proxy-Cache` header;
+    otherwise models listed in RESPONSE_CACHE_MODELS opt in at temperature 0.
+    """
+    opt_in = http_request.headers.get("x-proxy-cache", "").lower()
+    if opt_in in ("off", "0", "false", "no"):
+        return False
+    if opt_in in ("on", "1", "true", "yes"):
+        return True
+    return request.model in settings.RESPONSE_CACHE_MODELS and request.temperature == 0
 
 @router.post("/chat/completions", response_model=ChatCompletionResponse)
-async def create_chat_completion(request: ChatCompletionRequest):
+async def create_chat_completion(
+    request: ChatCompletionRequest,
+    http_request: Request
+):
     """Create a chat completion with function/tool calling support"""
+    if not 1 <= (request.n or 1) <= settings.FANOUT_MAX_N:
+        raise HTTPException(status_code=400, detail=f"n must be between 1 and {settings.FANOUT_MAX_N}")
+    
+    # Requests bound to fail are rejected before any queueing; aliases resolve here
+    catalogue = models_cache.peek()
+    index = catalogue.index if catalogue else None
+    try:
+        model = model_router.check(index, request.model, bool(request.functions or request.tools))
+    except ModelRejected as e:
+        metrics.set_model("other")
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    metrics.set_model(model_label(index, model))
+    metrics.mark("validation")
+    
+    # The deadline budget starts now, so it also covers queueing below
+    hedge = http_request.headers.get("x-proxy-hedge", "").lower()
+    hedging.set_policy(
+        hedging.deadline_from_header(http_request.headers.get("x-proxy-deadline")),
+        hedge in ("on", "1", "true", "yes") or (settings.HEDGE_ENABLED and hedge not in ("off", "0", "false", "no"))
+    )
+    
+    # Wait for a free slot; it is held until the response has been sent
+    tenant = tenant_key(request.user, http_request.headers, http_request.client and http_request.client.host)
+    try:
+        await admission.admit(http_request.scope, tenant)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Proxy is at capacity: {str(e)}",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    metrics.mark("queue")
+    
+    # Server-side session: the request carries only the new messages
+    try:
+        session = session_key(
+            http_request.headers.get("x-proxy-session"),
+            http_request.headers,
+            http_request.client and http_request.client.host
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    history = await session_store.get(session) if session else None
+    
+    # Compile (or reuse) the prompt block for the offered functions/tools
+    toolset = None
+    if request.functions or request.tools:
+        # Only a request whose body has already been decoded (and kept) offers the
+        # cheap raw lookup; synthetic ones (batch lines) have no body to read
+        body = getattr(http_request, "_json", None)
+        raw = (body.get("functions"), body.get("tools")) if isinstance(body, dict) else None
+        toolset = toolset_cache.compile(request.functions, request.tools, raw)
     
     # Prepare messages with function/tool calling support
     messages = prepare_messages_with_function_calling(
         request.messages,
-        request.functions,
+        toolset.functions if toolset else request.functions,
         request.function_call,
         request.tools,
-        request.tool_choice
+        request.tool_choice,
+        history
     )
+    # What this turn adds to the session, besides the reply
+    new_messages = messages[len(messages) - len(request.messages):] if request.messages else []
     
     # Prepare the request to Pollinations
     pollinations_request = {
         "messages": messages,
-        "model": request.model,
+        "model": model,
         "temperature": request.temperature,
         "top_p": request.top_p,
         "n": request.n,
@@ -203,83 +619,61 @@ async def create_chat_completion(request: ChatCompletionRequest):
     }
     
     # If functions or tools are present, add them to the prompt
-    if request.functions or request.tools:
-        items_str = serialize_functions_or_tools(request.functions, request.tools)
-        system_message = f"""Available {'tools' if request.tools else 'functions'}:
-{items_str}
-
-Instructions:
-1. If a {'tool' if request.tools else 'function'} is needed to answer the user's request, use it.
-2. Return your response in JSON format.
-3. Only use {'tools' if request.tools else 'functions'} when necessary and relevant.
-4. Use the exact format:
-   For functions: {{"function_call": {{"name": "function_name", "arguments": "{{\\"param1\\": \\"value1\\"}}"}}}}
-   For tools: {{"tool_calls": [{{"id": "call_1", "type": "function", "function": {{"name": "tool_name", "arguments": "{{\\"param1\\": \\"value1\\"}}"}}}}]}}"""
-        
+    if toolset:
         pollinations_request["messages"].insert(0, {
             "role": "system",
-            "content": system_message
+            "content": toolset.system_message
         })
     
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{settings.POLLINATIONS_BASE_URL}/",
-                json=pollinations_request,
-                timeout=30.0
-            )
-            print("DEBUG: Pollinations Request:", pollinations_request)
-            print("DEBUG: Raw Pollinations Response:", response.text)
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"Error from Pollinations API: {response.text}"
+    # Identical deterministic requests can be cached and coalesced
+    request_key = canonical_key(pollinations_request) if is_deterministic(request, http_request) else None
+    coalesce_key = request_key if settings.COALESCE_ENABLED else None
+    cache_key = request_key if settings.RESPONSE_CACHE_ENABLED and not request.stream else None
+    metrics.mark("prepare")
+    
+    if request.stream:
+        return await stream_chat_completion(
+            request, pollinations_request, coalesce_key, (session, new_messages) if session else None
+        )
+    
+    headers = None
+    if cache_key:
+        cached = await response_cache.get(cache_key)
+        if cached is not None:
+            cached_response = fastjson.loads(cached)
+            cached_response["id"] = completion_id()
+            cached_response["created"] = int(time.time())
+            if session:
+                await session_store.append(
+                    session, new_messages + [assistant_message(cached_response["choices"][0]["message"])]
                 )
-            
-            content = response.text
-            
-            # Check for function or tool calls in the response
-            function_call, tool_calls = extract_function_or_tool_call(content)
-            
-            # If we got a function call or tool calls, use them directly
-            if function_call or tool_calls:
-                content = None
-            else:
-                # Try to parse as regular JSON response
-                try:
-                    pollinations_response = response.json()
-                    if isinstance(pollinations_response, dict) and "choices" in pollinations_response:
-                        content = pollinations_response.get("choices", [{}])[0].get("message", {}).get("content", content)
-                except json.JSONDecodeError:
-                    # If not JSON, use the raw content
-                    pass
-            
-            # Prepare the OpenAI-compatible response
-            chat_response = ChatCompletionResponse(
-                id=f"chatcmpl-{int(time.time()*1000)}",
-                object="chat.completion",
-                created=int(time.time()),
-                model=request.model,
-                choices=[{
-                    "index": 0,
-                    "message": ChatMessage(
-                        role="assistant",
-                        content=content,
-                        function_call=function_call,
-                        tool_calls=tool_calls
-                    ),
-                    "finish_reason": "tool_calls" if tool_calls else "function_call" if function_call else "stop"
-                }],
-                usage={
-                    "prompt_tokens": len(str(messages)) // 4,  # Approximate
-                    "completion_tokens": len(content or "") // 4,  # Approximate
-                    "total_tokens": (len(str(messages)) + len(content or "")) // 4
-                }
-            )
-            
-            return chat_response
-            
-    except httpx.RequestError as e:
-        raise HTTPException(status_code=500, detail=f"Error communicating with Pollinations API: {str(e)}")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}") 
\ No newline at end of file
+            return FastJSONResponse(content=cached_response, headers={"X-Cache": "HIT"})
+        headers = {"X-Cache": "MISS"}
+    
+    def fetch(body: Dict[str, Any]):
+        return fetch_chat_completions(request, body)
+
+    if coalesce_key:
+        (chat_response, _), joined = await completion_coalescer.run(
+            coalesce_key,
+            lambda: with_model_fallback(pollinations_request, fetch)
+        )
+        if joined:
+            metrics.mark("upstream")
+            # Every caller gets its own response id
+            chat_response = {**chat_response, "id": completion_id(), "created": int(time.time())}
+    else:
+        chat_response, _ = await with_model_fallback(pollinations_request, fetch)
+        joined = False
+    
+    # Serialized once, for both the cache and the client
+    body = fastjson.dumps(chat_response)
+    # A fallback model's answer is not cached as the requested model's
+    if cache_key and not joined and chat_response["model"] == model:
+        await response_cache.set(cache_key, body)
+    if session:
+        await session_store.append(
+            session, new_messages + [assistant_message(chat_response["choices"][0]["message"])]
+        )
+    
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,72 @@
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from fastapi.responses import FileResponse
+from typing import Optional
+import asyncio
+import logging
+import os
+import shutil
+import time
+from ..core.batches import batch_store, new_id
+from ..schemas.batch import FileDeleted, FileList, FileObject
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+def _save_upload(upload: UploadFile, path: str) -> int:
+    """Copy the spooled upload to its final place without holding it in memory"""
+    upload.file.seek(0)
+    with open(path, "wb") as target:
+        shutil.copyfileobj(upload.file, target, 1024 * 1024)
+    return os.path.getsize(path)
+
+@router.post("/files", response_model=FileObject)
+async def upload_file(file: UploadFile = File(...), purpose: str = Form(...)):
+    """Upload a JSONL file for use as batch input"""
+    if purpose != "batch":
+        raise HTTPException(status_code=400, detail="Only files with purpose 'batch' are supported")
+    file_id = new_id("file-")
+    size = await asyncio.to_thread(_save_upload, file, batch_store.file_path(file_id))
+    uploaded = FileObject(
+        id=file_id,
+        bytes=size,
+        created_at=int(time.time()),
+        filename=file.filename or f"{file_id}.jsonl",
+        purpose=purpose
+    )
+    await asyncio.to_thread(batch_store.add_file, uploaded)
+    logger.info("File uploaded", extra={"file_id": file_id, "bytes": size})
+    return uploaded
+
+@router.get("/files", response_model=FileList)
+async def list_files(purpose: Optional[str] = None):
+    """List uploaded and batch result files"""
+    return FileList(data=await asyncio.to_thread(batch_store.list_files, purpose))
+
+async def _get_file(file_id: str) -> FileObject:
+    file = await asyncio.to_thread(batch_store.get_file, file_id)
+    if file is None:
+        raise HTTPException(status_code=404, detail=f"No such file: {file_id}")
+    return file
+
+@router.get("/files/{file_id}", response_model=FileObject)
+async def retrieve_file(file_id: str):
+    """Get a file's metadata"""
+    return await _get_file(file_id)
+
+@router.get("/files/{file_id}/content")
+async def retrieve_file_content(file_id: str):
+    """Download a file, e.g. a batch's results"""
+    file = await _get_file(file_id)
+    return FileResponse(
+        batch_store.file_path(file_id),
+        media_type="application/jsonl",
+        filename=file.filename
+    )
+
+@router.delete("/files/{file_id}", response_model=FileDeleted)
+async def delete_file(file_id: str):
+    """Delete a file"""
+    if not await asyncio.to_thread(batch_store.delete_file, file_id):
+        raise HTTPException(status_code=404, detail=f"No such file: {file_id}")
+    return FileDeleted(id=file_id)
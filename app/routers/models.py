@@ -1,9 +1,16 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
 from pydantic import BaseModel
-from typing import List, Dict
+from typing import List, Dict, Any, NamedTuple
+import hashlib
 import httpx
 import json
+import logging
 from ..core.config import settings
+from ..core.upstream import UpstreamUnavailable, error_headers, upstream
+from ..core.cache import CachedValue, SharedTier, open_shared_store
+from ..core.model_index import ModelIndex
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -34,74 +41,85 @@ class ModelsResponse(BaseModel):
     object: str = "list"
     data: List[Model]
 
-@router.get("/models", response_model=ModelsResponse)
-async def list_models():
-    """List available models"""
+class ModelCatalogue(NamedTuple):
+    """Parsed model list together with its pre-serialized response body and capability index"""
+    models: List[Dict[str, Any]]
+    body: bytes
+    etag: str
+    index: ModelIndex
+
+async def fetch_models() -> List[Dict[str, Any]]:
+    """Fetch and normalize the model list from Pollinations"""
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{settings.POLLINATIONS_BASE_URL}/models",
-                timeout=10.0
+        response = await upstream.send("GET", "/models", timeout=settings.UPSTREAM_MODELS_TIMEOUT)
+        
+        if response.status_code != 200:
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"Error fetching models from Pollinations API: {response.text}",
+                headers=error_headers(response)
             )
-            
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"Error fetching models from Pollinations API: {response.text}"
-                )
-            
+        
+        try:
             try:
-                try:
-                    pollinations_models = response.json()
-                    print("Parsed Models:", pollinations_models)
-                except json.JSONDecodeError:
-                    # Try to fix malformed JSON manually
-                    fixed_json = "[" + response.text.replace("}{", "},{") + "]"
-                    try:
-                        pollinations_models = json.loads(fixed_json)
-                    except Exception:
-                        raise HTTPException(
-                            status_code=500,
-                            detail=f"Failed to parse fixed JSON response: {response.text}"
-                        )
+                pollinations_models = response.json()
+                logger.debug("Parsed models", extra={"payload": pollinations_models})
             except json.JSONDecodeError:
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Invalid JSON response from Pollinations API: {response.text}"
-                )
-            
-            if not isinstance(pollinations_models, (list, dict)):
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Unexpected response format from Pollinations API: {pollinations_models}"
-                )
-            
-            # Handle both list and dict responses
-            if isinstance(pollinations_models, dict):
-                model_ids = list(pollinations_models.keys())
-            else:
-                model_ids = pollinations_models
-            
-            # Convert Pollinations models to OpenAI format
-            models = []
-            formatted_models = []
-            for model_data in pollinations_models:
-                if isinstance(model_data, dict):
-                    formatted_models.append({
-                        "id": model_data.get("name", "unknown"),  # Assign 'id' from 'name'
-                        "name": model_data.get("name", "unknown"),
-                        "type": model_data.get("type", "unknown"),
-                        "censored": model_data.get("censored", False),
-                        "description": model_data.get("description", ""),
-                        "baseModel": model_data.get("baseModel", False),
-                        "reasoning": model_data.get("reasoning", None),
-                        "vision": model_data.get("vision", None),
-                        "provider": model_data.get("provider", None),
-                    })
-            return {"data": formatted_models}
-            
-            return ModelsResponse(data=models)
-            
+                # Try to fix malformed JSON manually
+                fixed_json = "[" + response.text.replace("}{", "},{") + "]"
+                try:
+                    pollinations_models = json.loads(fixed_json)
+                except Exception:
+                    raise HTTPException(
+                        status_code=500,
+                        detail=f"Failed to parse fixed JSON response: {response.text}"
+                    )
+        except json.JSONDecodeError:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Invalid JSON response from Pollinations API: {response.text}"
+            )
+        
+        if not isinstance(pollinations_models, (list, dict)):
+            raise HTTPException(
+                status_code=500,
+                detail=f"Unexpected response format from Pollinations API: {pollinations_models}"
+            )
+        
+        # Handle both list and dict responses
+        if isinstance(pollinations_models, dict):
+            model_ids = list(pollinations_models.keys())
+        else:
+            model_ids = pollinations_models
+        
+        # Convert Pollinations models to OpenAI format
+        models = []
+        formatted_models = []
+        for model_data in pollinations_models:
+            if isinstance(model_data, dict):
+                formatted_models.append({
+                    "id": model_data.get("name", "unknown"),  # Assign 'id' from 'name'
+                    "name": model_data.get("name", "unknown"),
+                    "type": model_data.get("type", "unknown"),
+                    "censored": model_data.get("censored", False),
+                    "description": model_data.get("description", ""),
+                    "baseModel": model_data.get("baseModel", False),
+                    "reasoning": model_data.get("reasoning", None),
+                    "vision": model_data.get("vision", None),
+                    "provider": model_data.get("provider", None),
+                    "tools": model_data.get("tools", None),
+                    "aliases": model_data.get("aliases", None),
+                })
+        return formatted_models
+        
+    except UpstreamUnavailable as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Pollinations API unavailable: {str(e)}",
+            headers={"Retry-After": str(int(e.retry_after))}
+        )
+    except HTTPException:
+        raise
     except httpx.RequestError as e:
         raise HTTPException(
             status_code=500,
@@ -111,4 +129,51 @@ async def list_models():
         raise HTTPException(
             status_code=500,
             detail=f"Internal server error: {str(e)}"
-        ) 
\ No newline at end of file
+        )
+
+def build_catalogue(models: List[Dict[str, Any]]) -> ModelCatalogue:
+    """Serialize the OpenAI response once; the same models give the same body and ETag in every worker"""
+    body = ModelsResponse(data=models).model_dump_json().encode()
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    return ModelCatalogue(models=models, body=body, etag=etag, index=ModelIndex(models))
+
+async def load_model_catalogue() -> ModelCatalogue:
+    """Fetch the model list and serialize the OpenAI response once per refresh"""
+    return build_catalogue(await fetch_models())
+
+_shared_store = open_shared_store("shared_values")
+
+models_cache = CachedValue(
+    load_model_catalogue,
+    ttl=settings.MODELS_CACHE_TTL,
+    stale_ttl=settings.MODELS_CACHE_STALE_TTL,
+    shared=SharedTier(
+        store=_shared_store,
+        key="models",
+        encode=lambda catalogue: json.dumps(catalogue.models).encode(),
+        decode=lambda data: build_catalogue(json.loads(data))
+    ) if _shared_store is not None else None
+)
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Check an If-None-Match header value against our ETag"""
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate == etag:
+            return True
+    return False
+
+@router.get("/models", response_model=ModelsResponse)
+async def list_models(request: Request):
+    """List available models"""
+    catalogue = await models_cache.get()
+    headers = {
+        "ETag": catalogue.etag,
+        "Cache-Control": f"max-age={int(settings.MODELS_CACHE_TTL)}"
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, catalogue.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=catalogue.body, media_type="application/json", headers=headers)
@@ -0,0 +1,37 @@
+from fastapi import APIRouter, HTTPException, Request
+import logging
+from ..core.sessions import session_key, session_store
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+def _key(http_request: Request, session_id: str) -> str:
+    """Store key for a session id as seen by the calling client"""
+    try:
+        key = session_key(session_id, http_request.headers, http_request.client and http_request.client.host)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if key is None:
+        raise HTTPException(status_code=404, detail="Sessions are disabled")
+    return key
+
+@router.get("/sessions/stats")
+async def session_stats():
+    """Session store memory usage, hits and evictions"""
+    return session_store.snapshot()
+
+@router.get("/sessions/{session_id}")
+async def retrieve_session(session_id: str, http_request: Request):
+    """Messages stored for a session, in the form sent upstream"""
+    messages = await session_store.get(_key(http_request, session_id))
+    if not messages:
+        raise HTTPException(status_code=404, detail=f"No such session: {session_id}")
+    return {"id": session_id, "object": "session", "messages": messages}
+
+@router.delete("/sessions/{session_id}")
+async def delete_session(session_id: str, http_request: Request):
+    """Forget a session's history"""
+    if not await session_store.delete(_key(http_request, session_id)):
+        raise HTTPException(status_code=404, detail=f"No such session: {session_id}")
+    return {"id": session_id, "object": "session", "deleted": True}
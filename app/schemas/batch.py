@@ -0,0 +1,65 @@
+from pydantic import BaseModel
+from typing import List, Optional, Dict, Any, Literal
+
+class FileObject(BaseModel):
+    id: str
+    object: str = "file"
+    bytes: int
+    created_at: int
+    filename: str
+    purpose: str
+
+class FileList(BaseModel):
+    object: str = "list"
+    data: List[FileObject]
+    has_more: bool = False
+
+class FileDeleted(BaseModel):
+    id: str
+    object: str = "file"
+    deleted: bool = True
+
+class BatchCreateRequest(BaseModel):
+    input_file_id: str
+    endpoint: Literal["/v1/chat/completions"]
+    completion_window: str = "24h"
+    metadata: Optional[Dict[str, str]] = None
+
+class BatchRequestCounts(BaseModel):
+    total: int = 0
+    completed: int = 0
+    failed: int = 0
+
+class BatchErrors(BaseModel):
+    object: str = "list"
+    data: List[Dict[str, Any]]
+
+class Batch(BaseModel):
+    id: str
+    object: str = "batch"
+    endpoint: str
+    errors: Optional[BatchErrors] = None
+    input_file_id: str
+    completion_window: str
+    status: Literal[
+        "validating", "failed", "in_progress", "finalizing",
+        "completed", "expired", "cancelling", "cancelled"
+    ]
+    output_file_id: Optional[str] = None
+    error_file_id: Optional[str] = None
+    created_at: int
+    in_progress_at: Optional[int] = None
+    finalizing_at: Optional[int] = None
+    completed_at: Optional[int] = None
+    failed_at: Optional[int] = None
+    cancelling_at: Optional[int] = None
+    cancelled_at: Optional[int] = None
+    request_counts: BatchRequestCounts = BatchRequestCounts()
+    metadata: Optional[Dict[str, str]] = None
+
+class BatchList(BaseModel):
+    object: str = "list"
+    data: List[Batch]
+    first_id: Optional[str] = None
+    last_id: Optional[str] = None
+    has_more: bool = False
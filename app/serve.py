@@ -0,0 +1,70 @@
+"""Run the proxy with one worker process per available CPU.
+
+    python -m app.serve [--workers N] [--host 0.0.0.0] [--port 8000]
+
+Workers share the model catalogue and response caches through a SQLite file
+(SHARED_CACHE_PATH), so a new worker starts with the caches the others have
+already filled. Server-side sessions live in each worker's memory, so they
+are turned off with more than one worker; setting SESSIONS_ENABLED=true
+explicitly requires --workers 1.
+"""
+import argparse
+import logging
+import math
+import os
+
+import uvicorn
+
+from .core.config import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SHARED_CACHE_PATH = "shared_cache.sqlite3"
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on: its affinity mask, capped by a cgroup v2 CPU quota"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # not on Linux
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as cpu_max:
+            quota, period = cpu_max.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=settings.WORKERS, help="0 = one per available CPU")
+    parser.add_argument("--host", default=settings.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=settings.SERVER_PORT)
+    args = parser.parse_args()
+
+    workers = args.workers or available_cpus()
+    if workers > 1:
+        # Workers are new processes that read their settings from the environment
+        os.environ.setdefault("SHARED_CACHE_PATH", settings.SHARED_CACHE_PATH or DEFAULT_SHARED_CACHE_PATH)
+        if settings.SESSIONS_ENABLED:
+            # A session's next turn may land on a worker that does not have its history
+            if "SESSIONS_ENABLED" in settings.model_fields_set:
+                parser.error(
+                    f"SESSIONS_ENABLED=true keeps sessions in each worker's memory and "
+                    f"cannot work with {workers} workers: use --workers 1 or SESSIONS_ENABLED=false"
+                )
+            os.environ["SESSIONS_ENABLED"] = "false"
+            logger.warning(
+                "Server-side sessions are disabled with %d workers (each worker would keep its own); "
+                "use --workers 1 to enable them",
+                workers
+            )
+
+    uvicorn.run("app.main:app", host=args.host, port=args.port, workers=workers)
+
+
+if __name__ == "__main__":
+    main()
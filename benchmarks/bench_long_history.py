@@ -0,0 +1,134 @@
+"""Microbenchmark: memory and CPU per request for very long agent histories.
+
+Builds an agent-style conversation (user turns, assistant tool calls and
+large tool outputs) of roughly --size-mb megabytes, sends it through the
+ASGI app against an in-memory upstream and reports the peak resident
+memory growth per request relative to the body size (Linux), the peak
+Python heap growth as seen by tracemalloc (which also counts buffers that
+are reserved but never touched, e.g. by orjson's parser), CPU per request,
+and a per-stage breakdown of the ingestion path.
+
+    python benchmarks/bench_long_history.py [--size-mb 10] [--iterations 5]
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_response_path import UPSTREAM_PLAIN, app, call, upstream_module  # noqa: E402
+from app.core import fastjson  # noqa: E402
+from app.routers.chat import prepare_messages_with_function_calling  # noqa: E402
+from app.schemas.chat import ChatCompletionRequest  # noqa: E402
+
+
+def make_body(size_mb: float) -> bytes:
+    history = [{"role": "system", "content": "You are an agent with tools."}]
+    target = int(size_mb * 1_000_000)
+    size = 0
+    turn = 0
+    while size < target:
+        call_id = f"call_{turn}"
+        turn_messages = [
+            {"role": "user", "content": f"step {turn}: " + "please look into this " * 10},
+            {"role": "assistant", "content": None, "tool_calls": [{
+                "id": call_id,
+                "type": "function",
+                "function": {"name": "read_file", "parameters": {"path": f"src/module_{turn}.py"}},
+            }]},
+            {"role": "tool", "tool_call_id": call_id, "content": "def handler(event):\n    return event\n" * 500},
+        ]
+        size += len(json.dumps(turn_messages))
+        history.extend(turn_messages)
+        turn += 1
+    return json.dumps({"model": "openai", "messages": history}).encode()
+
+
+def _peak_rss() -> int:
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def reset_peak_rss() -> int:
+    """Reset the peak RSS counter and return the current RSS; 0 when unsupported"""
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        return 0
+    return _peak_rss()
+
+
+def stage_breakdown(body: bytes, rounds: int = 3) -> dict:
+    """Best-of-`rounds` wall time of each ingestion stage"""
+    timings = {"decode": [], "validate": [], "prepare": [], "encode": []}
+    for _ in range(rounds):
+        start = time.perf_counter()
+        data = fastjson.loads(body)
+        timings["decode"].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        request = ChatCompletionRequest.model_validate(data)
+        timings["validate"].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        messages = prepare_messages_with_function_calling(request.messages)
+        timings["prepare"].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        fastjson.dumps({"model": request.model, "messages": messages})
+        timings["encode"].append(time.perf_counter() - start)
+    return {stage: min(samples) for stage, samples in timings.items()}
+
+
+async def main(args) -> None:
+    body = make_body(args.size_mb)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=UPSTREAM_PLAIN, headers={"content-type": "application/json"})
+
+    async with app.router.lifespan_context(app):
+        upstream_module.upstream._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        assert await call(body) == 200
+
+        gc.collect()
+        rss_baseline = reset_peak_rss()
+        await call(body)
+        rss_peak = _peak_rss() - rss_baseline if rss_baseline else None
+
+        gc.collect()
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        await call(body)
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+        tracemalloc.stop()
+
+        start = time.process_time()
+        for _ in range(args.iterations):
+            await call(body)
+        cpu = (time.process_time() - start) / args.iterations
+
+    stages = stage_breakdown(body)
+    messages = len(fastjson.loads(body)["messages"])
+    print(f"JSON backend:       {fastjson.BACKEND}")
+    print(f"request body:       {len(body) / 1e6:8.1f} MB ({messages} messages)")
+    if rss_peak is not None:
+        print(f"peak RSS growth:    {rss_peak / 1e6:8.1f} MB ({rss_peak / len(body):.2f}x body)")
+    print(f"peak heap growth:   {peak / 1e6:8.1f} MB ({peak / len(body):.2f}x body, tracemalloc)")
+    print(f"CPU per request:    {cpu * 1e3:8.1f} ms")
+    for stage, seconds in stages.items():
+        print(f"  {stage + ':':<17} {seconds * 1e3:8.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=float, default=10.0)
+    parser.add_argument("--iterations", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,132 @@
+"""Microbenchmark: per-request CPU of a buffered chat completion inside the proxy.
+
+Drives the ASGI app directly (no sockets) against an in-memory upstream, so
+the numbers cover request body decoding, validation, message preparation,
+upstream payload encoding, upstream body decoding and response building.
+Runs plain and tool-call answers at several conversation lengths.
+
+    python benchmarks/bench_response_path.py [--messages 10 200 1000] [--iterations 200]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings  # noqa: E402
+
+settings.UPSTREAM_HEALTH_CHECK_INTERVAL = 0
+settings.RESPONSE_CACHE_ENABLED = False
+settings.COALESCE_ENABLED = False
+settings.WARMUP_ENABLED = False
+
+from app.core import upstream as upstream_module  # noqa: E402
+from app.main import app  # noqa: E402
+
+ANSWER_TEXT = "lorem ipsum dolor sit amet " * 80
+UPSTREAM_PLAIN = json.dumps({
+    "id": "upstream",
+    "object": "chat.completion",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": ANSWER_TEXT}, "finish_reason": "stop"}],
+}).encode()
+UPSTREAM_TOOLS = json.dumps({
+    "tool_calls": [{
+        "id": "call_1",
+        "type": "function",
+        "function": {"name": "lookup", "parameters": {"query": ANSWER_TEXT[:200], "limit": 5}},
+    }]
+}).encode()
+
+
+def make_body(messages: int, tools: bool) -> bytes:
+    history = [{"role": "system", "content": "You are a helpful assistant."}]
+    for i in range(messages):
+        role = "user" if i % 2 == 0 else "assistant"
+        history.append({"role": role, "content": f"turn {i}: " + "some earlier context " * 25})
+    body = {"model": "openai", "messages": history}
+    if tools:
+        body["tools"] = [{
+            "type": "function",
+            "function": {
+                "name": "lookup",
+                "description": "Look something up",
+                "parameters": {"type": "object", "properties": {"query": {"type": "string"}}, "required": ["query"]},
+            },
+        }]
+    return json.dumps(body).encode()
+
+
+async def call(body: bytes) -> int:
+    """Run one POST /v1/chat/completions through the ASGI app"""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/v1/chat/completions",
+        "raw_path": b"/v1/chat/completions",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        "client": ("127.0.0.1", 1234),
+        "server": ("127.0.0.1", 80),
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    status = 0
+    finished = asyncio.Event()
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif not message.get("more_body", False):
+            finished.set()
+
+    await app(scope, receive, send)
+    return status
+
+
+async def bench(body: bytes, iterations: int) -> float:
+    for _ in range(5):
+        assert await call(body) == 200
+    start = time.process_time()
+    for _ in range(iterations):
+        await call(body)
+    return (time.process_time() - start) / iterations * 1e6
+
+
+async def main(args) -> None:
+    upstream_body = UPSTREAM_PLAIN
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=upstream_body, headers={"content-type": "application/json"})
+
+    async with app.router.lifespan_context(app):
+        upstream_module.upstream._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        print(f"{'messages':>8} {'body KB':>8} {'plain us/req':>13} {'tools us/req':>13}")
+        for count in args.messages:
+            results = []
+            for tools in (False, True):
+                upstream_body = UPSTREAM_TOOLS if tools else UPSTREAM_PLAIN
+                results.append(await bench(make_body(count, tools), args.iterations))
+            size = len(make_body(count, False)) / 1024
+            print(f"{count:>8} {size:>8.0f} {results[0]:>13.0f} {results[1]:>13.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, nargs="+", default=[10, 200, 1000])
+    parser.add_argument("--iterations", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,98 @@
+"""Microbenchmark: per-request CPU spent turning a tool list into the prompt block.
+
+Compares the uncached path (convert tools, serialize, build the system
+message on every request) with the memoized ToolSetCache lookup, keyed
+either by the models or by the definitions as decoded from the request
+body, and shows the upstream payload size of indented vs compact
+serialization.
+
+    python benchmarks/bench_toolsets.py [--tools 50] [--iterations 2000]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.toolsets import (  # noqa: E402
+    ToolSetCache, serialize_functions_or_tools, tools_system_message, tools_to_functions
+)
+from app.schemas.chat import Tool  # noqa: E402
+
+
+def make_tools(count: int) -> list[Tool]:
+    """Build `count` realistic tool schemas with a handful of parameters each"""
+    tools = []
+    for i in range(count):
+        tools.append(Tool.model_validate({
+            "type": "function",
+            "function": {
+                "name": f"tool_{i}",
+                "description": f"Tool number {i}: looks things up in system {i} and returns a summary",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "query": {"type": "string", "description": "Free-text search query"},
+                        "limit": {"type": "integer", "description": "Maximum number of results"},
+                        "mode": {"type": "string", "enum": ["fast", "exact", "fuzzy"]},
+                        "filters": {
+                            "type": "object",
+                            "properties": {
+                                "since": {"type": "string", "format": "date-time"},
+                                "tags": {"type": "array", "items": {"type": "string"}},
+                            },
+                        },
+                    },
+                    "required": ["query"],
+                },
+            },
+        }))
+    return tools
+
+
+def uncached(tools: list[Tool]) -> str:
+    tools_to_functions(tools)
+    return tools_system_message(serialize_functions_or_tools(None, tools), True)
+
+
+def bench(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tools", type=int, default=50)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    tools = make_tools(args.tools)
+    # What the route gets from the request body: a fresh decode of the same JSON
+    body = json.dumps([tool.model_dump(exclude_none=True) for tool in tools])
+    raw = (None, json.loads(body))
+    cache = ToolSetCache(max_entries=16)
+    cache.compile(None, tools)
+    cache.compile(None, tools, (None, json.loads(body)))
+
+    uncached_us = bench(lambda: uncached(tools), args.iterations)
+    model_key_us = bench(lambda: cache.compile(None, tools), args.iterations)
+    cached_us = bench(lambda: cache.compile(None, tools, raw), args.iterations)
+
+    compact = serialize_functions_or_tools(None, tools)
+    indented = json.dumps(json.loads(compact), indent=2)
+
+    print(f"tools per request:     {args.tools}")
+    print(f"uncached compile:      {uncached_us:9.1f} us/request")
+    print(f"lookup by model key:   {model_key_us:9.1f} us/request")
+    print(f"memoized lookup:       {cached_us:9.1f} us/request")
+    print(f"CPU saved:             {uncached_us - cached_us:9.1f} us/request ({uncached_us / cached_us:.1f}x)")
+    print(f"indented tool JSON:    {len(indented.encode()):9d} bytes")
+    print(f"compact tool JSON:     {len(compact.encode()):9d} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""Load test: the proxy in front of a local stub upstream, driven concurrently.
+
+Starts benchmarks/stub_upstream.py and the proxy (both under uvicorn) with
+POLLINATIONS_BASE_URL pointed at the stub, runs each scenario with a fixed
+concurrency, prints throughput, latency percentiles and proxy memory, and
+writes the results as JSON so runs on different commits can be compared.
+
+    python benchmarks/load_test.py [--requests 500] [--concurrency 32]
+        [--scenarios plain,functions,tools,stream,models]
+        [--latency-ms 50] [--body-chars 512] [--error-rate 0.0]
+        [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WEATHER_PARAMETERS = {
+    "type": "object",
+    "properties": {
+        "location": {"type": "string", "description": "City name"},
+        "unit": {"type": "string", "enum": ["celsius", "fahrenheit"]},
+    },
+    "required": ["location"],
+}
+MESSAGES = [
+    {"role": "system", "content": "You are a helpful assistant."},
+    {"role": "user", "content": "What is the weather like in Moscow today?"},
+]
+
+SCENARIOS: Dict[str, Optional[Dict[str, Any]]] = {
+    "plain": {"model": "openai", "messages": MESSAGES},
+    "functions": {
+        "model": "openai",
+        "messages": MESSAGES,
+        "functions": [{"name": "get_weather", "description": "Current weather", "parameters": WEATHER_PARAMETERS}],
+    },
+    "tools": {
+        "model": "openai",
+        "messages": MESSAGES,
+        "tools": [{"type": "function", "function": {
+            "name": "get_weather", "description": "Current weather", "parameters": WEATHER_PARAMETERS,
+        }}],
+    },
+    "stream": {"model": "openai", "messages": MESSAGES, "stream": True},
+    # GET /v1/models
+    "models": None,
+}
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[rank]
+
+
+def read_memory_kb(pid: int) -> Dict[str, Optional[int]]:
+    """Current and peak RSS of a process, from /proc (Linux only)"""
+    memory: Dict[str, Optional[int]] = {"rss_kb": None, "peak_rss_kb": None}
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    memory["rss_kb"] = int(line.split()[1])
+                elif line.startswith("VmHWM:"):
+                    memory["peak_rss_kb"] = int(line.split()[1])
+    except OSError:
+        pass
+    return memory
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_server(target: str, port: int, env: Dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", target, "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=ROOT,
+        env={**os.environ, **env},
+    )
+
+
+async def wait_ready(url: str, timeout: float = 20.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{url} did not come up within {timeout}s")
+                await asyncio.sleep(0.1)
+
+
+async def one_request(client: httpx.AsyncClient, payload: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    start = time.perf_counter()
+    first_byte = None
+    try:
+        if payload is None:
+            response = await client.get("/v1/models")
+            status = response.status_code
+        elif payload.get("stream"):
+            async with client.stream("POST", "/v1/chat/completions", json=payload) as response:
+                status = response.status_code
+                async for line in response.aiter_lines():
+                    if first_byte is None and line.startswith("data:"):
+                        first_byte = time.perf_counter() - start
+                    if line.startswith("data:") and '"error"' in line:
+                        status = "stream_error"
+        else:
+            response = await client.post("/v1/chat/completions", json=payload)
+            status = response.status_code
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    return {"latency": time.perf_counter() - start, "ttfb": first_byte, "status": status}
+
+
+async def run_scenario(
+    base_url: str,
+    payload: Optional[Dict[str, Any]],
+    requests: int,
+    concurrency: int
+) -> Dict[str, Any]:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+        remaining = iter(range(requests))
+        samples: List[Dict[str, Any]] = []
+
+        async def worker():
+            for _ in remaining:
+                samples.append(await one_request(client, payload))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies = sorted(sample["latency"] for sample in samples)
+    ttfbs = sorted(sample["ttfb"] for sample in samples if sample["ttfb"] is not None)
+    statuses: Dict[str, int] = {}
+    for sample in samples:
+        statuses[str(sample["status"])] = statuses.get(str(sample["status"]), 0) + 1
+
+    result = {
+        "requests": len(samples),
+        "errors": sum(count for status, count in statuses.items() if status != "200"),
+        "statuses": statuses,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(samples) / elapsed, 2),
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies) * 1000, 2),
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2),
+        },
+    }
+    if ttfbs:
+        result["ttfb_ms"] = {
+            "p50": round(percentile(ttfbs, 50) * 1000, 2),
+            "p95": round(percentile(ttfbs, 95) * 1000, 2),
+            "p99": round(percentile(ttfbs, 99) * 1000, 2),
+        }
+    return result
+
+
+def print_comparison(results: Dict[str, Any], baseline_path: str) -> None:
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\ncompared with {baseline_path} (commit {str(baseline.get('commit'))[:12]}):")
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        changes = []
+        for label, now, before in (
+            ("rps", current["throughput_rps"], previous["throughput_rps"]),
+            ("p50", current["latency_ms"]["p50"], previous["latency_ms"]["p50"]),
+            ("p99", current["latency_ms"]["p99"], previous["latency_ms"]["p99"]),
+        ):
+            delta = (now - before) / before * 100 if before else 0.0
+            changes.append(f"{label} {before} -> {now} ({delta:+.1f}%)")
+        print(f"  {name:<10} " + ", ".join(changes))
+
+
+async def run(args) -> Dict[str, Any]:
+    stub_env = {
+        "STUB_LATENCY_MS": str(args.latency_ms),
+        "STUB_JITTER_MS": str(args.jitter_ms),
+        "STUB_BODY_CHARS": str(args.body_chars),
+        "STUB_CHUNK_CHARS": str(args.chunk_chars),
+        "STUB_CHUNK_DELAY_MS": str(args.chunk_delay_ms),
+        "STUB_ERROR_RATE": str(args.error_rate),
+        "STUB_MALFORMED_RATE": str(args.malformed_rate),
+    }
+    proxy_env = {
+        "POLLINATIONS_BASE_URL": f"http://127.0.0.1:{args.stub_port}",
+        "LOG_LEVEL": "WARNING",
+    }
+    stub = start_server("benchmarks.stub_upstream:app", args.stub_port, stub_env)
+    proxy = start_server("app.main:app", args.proxy_port, proxy_env)
+    base_url = f"http://127.0.0.1:{args.proxy_port}"
+    try:
+        await wait_ready(f"http://127.0.0.1:{args.stub_port}/models")
+        await wait_ready(f"{base_url}/v1/health")
+        results: Dict[str, Any] = {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "config": {
+                "requests": args.requests,
+                "concurrency": args.concurrency,
+                **{key.lower(): value for key, value in stub_env.items()},
+            },
+            "memory_idle": read_memory_kb(proxy.pid),
+            "scenarios": {},
+        }
+        for name in args.scenarios:
+            scenario = await run_scenario(base_url, SCENARIOS[name], args.requests, args.concurrency)
+            scenario["memory"] = read_memory_kb(proxy.pid)
+            results["scenarios"][name] = scenario
+            latency = scenario["latency_ms"]
+            print(
+                f"{name:<10} {scenario['throughput_rps']:8.1f} req/s  "
+                f"p50 {latency['p50']:7.1f} ms  p95 {latency['p95']:7.1f} ms  p99 {latency['p99']:7.1f} ms  "
+                f"errors {scenario['errors']:4d}  rss {scenario['memory']['rss_kb']} kB"
+            )
+        return results
+    finally:
+        for process in (proxy, stub):
+            process.terminate()
+        for process in (proxy, stub):
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--body-chars", type=int, default=512)
+    parser.add_argument("--chunk-chars", type=int, default=16)
+    parser.add_argument("--chunk-delay-ms", type=float, default=5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--stub-port", type=int, default=9100)
+    parser.add_argument("--proxy-port", type=int, default=9101)
+    parser.add_argument("--output", default="load_results.json")
+    parser.add_argument("--compare", help="earlier results file to diff against")
+    args = parser.parse_args()
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    results = asyncio.run(run(args))
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nresults written to {args.output}")
+    if args.compare:
+        print_comparison(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Local stand-in for the Pollinations text API used by the load benchmarks.
+
+Behaviour is controlled with environment variables so the same server can be
+started by load_test.py or by hand:
+
+    STUB_LATENCY_MS        base latency before the first byte (default 50)
+    STUB_JITTER_MS         uniform random extra latency (default 0)
+    STUB_BODY_CHARS        size of plain-text completions (default 512)
+    STUB_CHUNK_CHARS       characters per SSE chunk when streaming (default 16)
+    STUB_CHUNK_DELAY_MS    delay between SSE chunks (default 5)
+    STUB_ERROR_RATE        fraction of requests answered with 503 (default 0)
+    STUB_MALFORMED_RATE    fraction of malformed answers: /models sent as
+                           concatenated objects (the "}{" format the proxy
+                           repairs), function/tool calls truncated mid-JSON,
+                           streams with an undecodable SSE event (default 0)
+
+    uvicorn benchmarks.stub_upstream:app --port 9100
+"""
+import asyncio
+import json
+import os
+import random
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+
+LATENCY = _env_float("STUB_LATENCY_MS", 50) / 1000
+JITTER = _env_float("STUB_JITTER_MS", 0) / 1000
+BODY_CHARS = int(_env_float("STUB_BODY_CHARS", 512))
+CHUNK_CHARS = max(1, int(_env_float("STUB_CHUNK_CHARS", 16)))
+CHUNK_DELAY = _env_float("STUB_CHUNK_DELAY_MS", 5) / 1000
+ERROR_RATE = _env_float("STUB_ERROR_RATE", 0)
+MALFORMED_RATE = _env_float("STUB_MALFORMED_RATE", 0)
+
+MODELS = [
+    {"name": "openai", "type": "chat", "description": "OpenAI GPT-4o-mini", "vision": True, "provider": "stub"},
+    {"name": "mistral", "type": "chat", "description": "Mistral Small", "vision": False, "provider": "stub"},
+    {"name": "deepseek-reasoner", "type": "chat", "reasoning": True, "provider": "stub"},
+]
+
+FUNCTION_CALL = json.dumps({"function_call": {"name": "get_weather", "arguments": json.dumps({"location": "Moscow"})}})
+TOOL_CALLS = json.dumps({"tool_calls": [{
+    "id": "call_1",
+    "type": "function",
+    "function": {"name": "get_weather", "arguments": json.dumps({"location": "Moscow"})},
+}]})
+
+
+def _completion_text(payload: dict) -> str:
+    """Answer like a model that follows the proxy's function-calling prompt"""
+    system = next((m.get("content") or "" for m in payload.get("messages", []) if m.get("role") == "system"), "")
+    if system.startswith("Available tools"):
+        return TOOL_CALLS
+    if system.startswith("Available functions"):
+        return FUNCTION_CALL
+    words = ("lorem", "ipsum", "dolor", "sit", "amet", "consectetur")
+    text = " ".join(words[i % len(words)] for i in range(BODY_CHARS // 5 + 1))
+    return text[:BODY_CHARS]
+
+
+async def _sleep_latency() -> None:
+    await asyncio.sleep(LATENCY + random.uniform(0, JITTER))
+
+
+async def completion(request: Request) -> Response:
+    payload = json.loads(await request.body())
+    await _sleep_latency()
+    if random.random() < ERROR_RATE:
+        return PlainTextResponse("stub: upstream overloaded", status_code=503)
+
+    text = _completion_text(payload)
+    malformed = random.random() < MALFORMED_RATE
+    if not payload.get("stream"):
+        if malformed and text.startswith("{"):
+            text = text[:len(text) // 2]
+        return PlainTextResponse(text)
+
+    async def events():
+        if malformed:
+            yield "data: {not json\n\n"
+        for start in range(0, len(text), CHUNK_CHARS):
+            delta = {"choices": [{"index": 0, "delta": {"content": text[start:start + CHUNK_CHARS]}}]}
+            yield f"data: {json.dumps(delta)}\n\n"
+            if CHUNK_DELAY:
+                await asyncio.sleep(CHUNK_DELAY)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+async def models(request: Request) -> Response:
+    await _sleep_latency()
+    if random.random() < ERROR_RATE:
+        return PlainTextResponse("stub: upstream overloaded", status_code=503)
+    if random.random() < MALFORMED_RATE:
+        return PlainTextResponse("".join(json.dumps(model) for model in MODELS), media_type="application/json")
+    return JSONResponse(MODELS)
+
+
+app = Starlette(routes=[
+    Route("/", completion, methods=["POST"]),
+    Route("/models", models, methods=["GET"]),
+])
@@ -0,0 +1,55 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.core import upstream as upstream_module
+from app.core.config import settings
+from app.core.toolsets import toolset_cache
+from app.main import app
+from app.routers.batches import execute_chat_request
+
+TOOLS = [{
+    "type": "function",
+    "function": {
+        "name": "get_weather",
+        "description": "Current weather",
+        "parameters": {"type": "object", "properties": {"location": {"type": "string"}}},
+    },
+}]
+
+
+@pytest.fixture
+def quiet_app(monkeypatch):
+    """The app without background warm-up and health probes"""
+    monkeypatch.setattr(settings, "WARMUP_ENABLED", False)
+    monkeypatch.setattr(settings, "UPSTREAM_HEALTH_CHECK_INTERVAL", 0)
+    return app
+
+
+def test_batch_line_with_tools(quiet_app, monkeypatch):
+    calls = []
+
+    def handler(request):
+        if request.url.path.endswith("/models"):
+            return httpx.Response(200, json=[{"name": "openai"}])
+        calls.append(json.loads(request.content))
+        return httpx.Response(200, text='{"tool_calls": [{"id": "call_1", "type": "function", '
+                                        '"function": {"name": "get_weather", "arguments": "{}"}}]}')
+
+    async def scenario():
+        async with quiet_app.router.lifespan_context(quiet_app):
+            monkeypatch.setattr(
+                upstream_module.upstream, "_client", httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            )
+            line = {"model": "openai", "messages": [{"role": "user", "content": "weather?"}], "tools": TOOLS}
+            return [await execute_chat_request(line) for _ in range(2)]
+
+    hits = toolset_cache.stats["hits"]
+    results = asyncio.run(scenario())
+    assert [status for status, _ in results] == [200, 200]
+    assert len(calls) == 2
+    assert "get_weather" in calls[0]["messages"][0]["content"]
+    assert results[0][1]["choices"][0]["message"]["tool_calls"][0]["function"]["name"] == "get_weather"
+    assert toolset_cache.stats["hits"] == hits + 1
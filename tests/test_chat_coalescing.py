@@ -0,0 +1,70 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.core import upstream as upstream_module
+from app.core.config import settings
+from app.main import app
+
+CHUNKS = 5
+CHUNK_DELAY = 0.02
+
+
+@pytest.fixture
+def quiet_app(monkeypatch):
+    """The app without background warm-up and health probes"""
+    monkeypatch.setattr(settings, "WARMUP_ENABLED", False)
+    monkeypatch.setattr(settings, "UPSTREAM_HEALTH_CHECK_INTERVAL", 0)
+    monkeypatch.setattr(settings, "COALESCE_ENABLED", True)
+    return app
+
+
+async def _sse_stream():
+    for i in range(CHUNKS):
+        await asyncio.sleep(CHUNK_DELAY)
+        yield f'data: {json.dumps({"choices": [{"delta": {"content": f"part{i} "}}]})}\n\n'.encode()
+    yield b"data: [DONE]\n\n"
+
+
+def test_late_joiner_shares_open_stream(quiet_app, monkeypatch):
+    calls = []
+
+    def handler(request):
+        if request.url.path.endswith("/models"):
+            return httpx.Response(200, json=[{"name": "openai"}])
+        calls.append(json.loads(request.content))
+        return httpx.Response(200, content=_sse_stream(), headers={"content-type": "text/event-stream"})
+
+    async def scenario():
+        async with quiet_app.router.lifespan_context(quiet_app):
+            monkeypatch.setattr(
+                upstream_module.upstream, "_client", httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            )
+            transport = httpx.ASGITransport(app=quiet_app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://proxy") as client:
+                def post():
+                    return client.post(
+                        "/v1/chat/completions",
+                        json={"model": "openai", "stream": True, "messages": [{"role": "user", "content": "hi"}]},
+                        headers={"X-Proxy-Cache": "on"},
+                    )
+
+                leader = asyncio.ensure_future(post())
+                # Join once the upstream stream is open and part of it has been relayed
+                await asyncio.sleep(CHUNK_DELAY * 2.5)
+                assert len(calls) == 1
+                return await asyncio.gather(leader, post())
+
+    leader, joiner = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert leader.status_code == joiner.status_code == 200
+
+    def content(response):
+        events = [line[6:] for line in response.text.splitlines() if line.startswith("data: ")]
+        return "".join(
+            json.loads(event)["choices"][0]["delta"].get("content") or "" for event in events if event != "[DONE]"
+        )
+
+    assert content(joiner) == content(leader) == "".join(f"part{i} " for i in range(CHUNKS))
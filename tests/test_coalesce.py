@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from app.core.coalesce import Coalescer, StreamAbandoned, StreamBroadcast
+
+
+class _Source:
+    """Endless upstream stand-in that records how far it was read and whether it was closed"""
+
+    def __init__(self):
+        self.sent = 0
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await asyncio.sleep(0.001)
+        self.sent += 1
+        return self.sent
+
+    async def aclose(self):
+        self.closed = True
+
+
+def test_source_is_cancelled_when_every_subscriber_leaves():
+    async def scenario():
+        source = _Source()
+        broadcast = StreamBroadcast(source)
+        first, second = broadcast.subscribe(), broadcast.subscribe()
+        assert await first.__anext__() == 1
+        assert await second.__anext__() == 1
+        await first.aclose()
+        await asyncio.sleep(0.01)
+        assert not source.closed  # one subscriber is still listening
+        await second.aclose()
+        assert await broadcast.closed is True
+        sent = source.sent
+        await asyncio.sleep(0.01)
+        return source, sent, broadcast
+
+    source, sent, broadcast = asyncio.run(scenario())
+    assert source.closed
+    assert source.sent == sent
+
+    async def late_subscriber():
+        return [item async for item in broadcast.subscribe()]
+
+    with pytest.raises(StreamAbandoned):
+        asyncio.run(late_subscriber())
+
+
+def test_abandoned_stream_is_not_joined():
+    async def scenario():
+        coalescer = Coalescer(window=60)
+
+        async def start():
+            return StreamBroadcast(_Source())
+
+        broadcast, joined = await coalescer.run("key", start)
+        reader = broadcast.subscribe()
+        await reader.__anext__()
+        await reader.aclose()
+        await broadcast.closed
+        _, joined_after = await coalescer.run("key", start)
+        return joined, joined_after
+
+    assert asyncio.run(scenario()) == (False, False)
+
+
+def test_unstarted_subscriber_does_not_keep_the_source_open():
+    async def scenario():
+        source = _Source()
+        broadcast = StreamBroadcast(source)
+        reader, unstarted = broadcast.subscribe(), broadcast.subscribe()
+        await reader.__anext__()
+        await unstarted.aclose()
+        await reader.aclose()
+        assert await asyncio.wait_for(asyncio.shield(broadcast.closed), 1) is True
+        return source
+
+    assert asyncio.run(scenario()).closed
+
+    async def dropped():
+        source = _Source()
+        broadcast = StreamBroadcast(source)
+        broadcast.subscribe()  # never iterated nor closed
+        assert await asyncio.wait_for(asyncio.shield(broadcast.closed), 1) is True
+        return source
+
+    assert asyncio.run(dropped()).closed
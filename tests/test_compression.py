@@ -0,0 +1,32 @@
+import asyncio
+import gzip
+
+from app.core.compression import CompressionMiddleware
+
+
+def test_decoded_request_shares_the_scope_with_outer_middleware():
+    seen = {}
+
+    async def app(scope, receive, send):
+        seen["body"] = (await receive())["body"]
+        scope["route"] = "matched"  # what the router records for the metrics middleware
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/v1/chat/completions",
+        "headers": [(b"content-encoding", b"gzip"), (b"content-type", b"application/json")],
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": gzip.compress(b'{"a": 1}'), "more_body": False}
+
+    async def send(message):
+        pass
+
+    asyncio.run(CompressionMiddleware(app)(scope, receive, send))
+    assert seen["body"] == b'{"a": 1}'
+    assert scope["route"] == "matched"
+    assert (b"content-encoding", b"gzip") not in scope["headers"]
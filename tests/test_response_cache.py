@@ -0,0 +1,23 @@
+import asyncio
+import time
+
+from app.core.response_cache import ResponseCache
+
+
+def test_disk_hit_keeps_remaining_lifetime(tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: clock[0])
+
+    async def scenario():
+        cache = ResponseCache(max_bytes=10, ttl=60, disk_path=str(tmp_path / "cache.sqlite"))
+        await cache.set("a", b"first")
+        await cache.set("b", b"second")  # pushes "a" out of memory
+        assert len(cache) == 1
+        clock[0] += 50
+        assert await cache.get("a") == b"first"  # promoted from disk
+        clock[0] += 20
+        value = await cache.get("a")
+        cache.close()
+        return value
+
+    assert asyncio.run(scenario()) is None
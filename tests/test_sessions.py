@@ -0,0 +1,26 @@
+import asyncio
+
+from app.core.sessions import SessionStore
+
+
+def _message(text):
+    return {"role": "user", "content": text}
+
+
+def test_append_keeps_history_spilled_during_the_turn(tmp_path):
+    async def scenario():
+        store = SessionStore(max_bytes=200, ttl=60, disk_path=str(tmp_path / "sessions.sqlite"))
+        await store.append("a", [_message("first"), _message("reply")])
+        history = await store.get("a")
+        # Another session pushes "a" to disk while its turn is still streaming
+        await store.append("b", [_message("x" * 180)])
+        assert "a" not in store._sessions
+        await store.append("a", [_message("second")])
+        await store.append("b", [_message("y" * 180)])
+        messages = await store.get("a")
+        store.close()
+        return history, messages
+
+    history, messages = asyncio.run(scenario())
+    assert [message["content"] for message in history] == ["first", "reply"]
+    assert [message["content"] for message in messages] == ["first", "reply", "second"]
@@ -0,0 +1,68 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.routers import chat
+from app.schemas.chat import ChatCompletionRequest
+
+
+class _Body(httpx.AsyncByteStream):
+    """Upstream body that records whether it was closed"""
+
+    def __init__(self):
+        self.closed = False
+
+    async def __aiter__(self):
+        yield b"data: {}\n\n"
+
+    async def aclose(self):
+        self.closed = True
+
+
+def _response():
+    body = _Body()
+    return httpx.Response(200, stream=body, headers={"content-type": "text/event-stream"}), body
+
+
+@pytest.mark.parametrize("n", [1, 2])
+def test_client_leaving_before_deltas_start_closes_upstream(n, monkeypatch):
+    request = ChatCompletionRequest.model_validate(
+        {"model": "openai", "n": n, "stream": True, "messages": [{"role": "user", "content": "hi"}]}
+    )
+
+    async def scenario():
+        bodies = []
+
+        async def open_stream(body):
+            response, stream = _response()
+            bodies.append(stream)
+            return response
+
+        monkeypatch.setattr(chat, "open_completion_stream", open_stream)
+        deltas = await chat.open_completion_deltas(request, {"model": "openai", "messages": []})
+        events = chat.sse_response(request, deltas, "openai").body_iterator
+        await events.__anext__()  # the role chunk is out, the deltas not yet read
+        await events.aclose()
+        return bodies
+
+    bodies = asyncio.run(scenario())
+    assert len(bodies) == n
+    assert all(body.closed for body in bodies)
+
+
+def test_midstream_failure_is_reported_in_band():
+    request = ChatCompletionRequest.model_validate(
+        {"model": "openai", "stream": True, "messages": [{"role": "user", "content": "hi"}]}
+    )
+
+    async def failing():
+        yield 0, {"content": "partial"}, None
+        raise ValueError("parser broke")
+
+    async def scenario():
+        return [event async for event in chat.sse_response(request, failing(), "openai").body_iterator]
+
+    events = asyncio.run(scenario())
+    assert '"partial"' in events[1]
+    assert events[-1].startswith('data: {"error"') and "parser broke" in events[-1]
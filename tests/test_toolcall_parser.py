@@ -0,0 +1,114 @@
+import json
+import random
+
+import pytest
+
+from app.core.toolcall_parser import ToolCallStreamParser
+from app.routers.chat import extract_function_or_tool_call
+
+CASES = {
+    "text": "Hello, {not a call} world",
+    "direct_object": '{"name": "get_weather", "parameters": {"location": "Paris", "days": [1, 2]}}',
+    "direct_string_parameters": r'{"name": "echo", "parameters": "say \"hi\" é\n"}',
+    "direct_scalar_parameters": '{"name": "count", "parameters": 42}',
+    "function_call_arguments_string": r'{"function_call": {"name": "f", "arguments": "{\"x\": \"é😀\"}"}}',
+    "function_call_parameters_object": '{"function_call": {"name": "f", "parameters": {"x": [1, {"y": null}]}}}',
+    "function_call_parameters_string": r'{"function_call": {"name": "f", "parameters": "a\\b \"c\""}}',
+    "tool_calls": (
+        '{"tool_calls": ['
+        r'{"id": "call_1", "type": "function", "function": {"name": "a", "arguments": "{\"q\": 1}"}}, '
+        r'{"id": "call_2", "type": "function", "function": {"name": "b", "parameters": "strA"}}, '
+        '{"id": "call_3", "type": "function", "function": {"name": "c", "parameters": {"k": "v"}}}'
+        ']}'
+    ),
+}
+
+
+def _stream(chunks):
+    """Feed chunks and fold the deltas back into (content, function_call, tool_calls)"""
+    parser = ToolCallStreamParser()
+    deltas = []
+    for chunk in chunks:
+        deltas.extend(parser.feed(chunk))
+    deltas.extend(parser.close())
+
+    content = ""
+    function_call = None
+    tool_calls = {}
+    for delta in deltas:
+        content += delta.get("content", "")
+        if "function_call" in delta:
+            function_call = function_call or {"name": "", "arguments": ""}
+            function_call["name"] += delta["function_call"].get("name", "")
+            function_call["arguments"] += delta["function_call"].get("arguments", "")
+        for call in delta.get("tool_calls", []):
+            entry = tool_calls.setdefault(call["index"], {"id": None, "name": "", "arguments": ""})
+            entry["id"] = call.get("id", entry["id"])
+            entry["name"] += call["function"].get("name", "")
+            entry["arguments"] += call["function"].get("arguments", "")
+    return content, function_call, [tool_calls[index] for index in sorted(tool_calls)], parser.finish_reason
+
+
+def _splits(text, seed):
+    rng = random.Random(seed)
+    cuts = sorted(rng.sample(range(1, len(text)), min(len(text) - 1, rng.randint(1, 12))))
+    return [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+
+
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_output_does_not_depend_on_chunking(name):
+    text = CASES[name]
+    whole = _stream([text])
+    assert _stream(list(text)) == whole
+    for cut in range(1, len(text)):
+        assert _stream([text[:cut], text[cut:]]) == whole
+    for seed in range(50):
+        assert _stream(_splits(text, seed)) == whole
+
+
+def _decoded(arguments):
+    # Objects are streamed as the model wrote them, so compare values rather than spacing
+    return json.loads(arguments)
+
+
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_stream_matches_buffered_extraction(name):
+    text = CASES[name]
+    content, function_call, tool_calls, finish_reason = _stream(list(text))
+    buffered_function_call, buffered_tool_calls = extract_function_or_tool_call(text)
+
+    if buffered_function_call is None and buffered_tool_calls is None:
+        assert (content, function_call, tool_calls, finish_reason) == (text, None, [], "stop")
+        return
+    assert content == ""
+    if buffered_function_call is not None:
+        assert finish_reason == "function_call"
+        assert function_call["name"] == buffered_function_call["name"]
+        assert _decoded(function_call["arguments"]) == _decoded(buffered_function_call["arguments"])
+    else:
+        assert finish_reason == "tool_calls"
+        assert [(call["id"], call["name"], _decoded(call["arguments"])) for call in tool_calls] == [
+            (call["id"], call["function"]["name"], _decoded(call["function"]["arguments"]))
+            for call in buffered_tool_calls
+        ]
+
+
+def test_arguments_string_is_passed_through_decoded():
+    _, function_call, _, _ = _stream([CASES["function_call_arguments_string"]])
+    assert function_call["arguments"] == '{"x": "é\U0001F600"}'
+
+
+@pytest.mark.parametrize("name", ["direct_string_parameters", "function_call_parameters_string"])
+def test_parameters_string_is_json_encoded(name):
+    _, function_call, _, _ = _stream(list(CASES[name]))
+    assert isinstance(json.loads(function_call["arguments"]), str)
+    data = json.loads(CASES[name])
+    parameters = data.get("parameters", data.get("function_call", {}).get("parameters"))
+    assert json.loads(function_call["arguments"]) == parameters
+
+
+def test_truncated_call_still_emits_started_calls():
+    content, function_call, _, finish_reason = _stream(['{"function_call": {"name": "f", "argu'])
+    assert content == ""
+    assert function_call == {"name": "f", "arguments": ""}
+    assert finish_reason == "function_call"